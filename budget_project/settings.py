@@ -94,6 +94,8 @@ else:
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
             #'NAME': "C:\\Users\\Ben\Documents\\projects\\budget\\db.sqlite3"
+            # Wait for the write lock instead of failing when several workers write at once
+            'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
         }
     }
 
@@ -126,6 +128,50 @@ if not DEBUG:
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
 
+# Background aggregate recomputation (see budgetapp.tasks)
+# Set AGGREGATE_WORKERS=0 to run jobs synchronously when the transaction commits
+AGGREGATE_WORKERS = int(os.getenv('AGGREGATE_WORKERS', '2'))
+AGGREGATE_QUEUE_SIZE = int(os.getenv('AGGREGATE_QUEUE_SIZE', '1000'))
+# 'threads' runs jobs in-process; 'database' queues them for `manage.py run_workers`
+AGGREGATE_JOB_BACKEND = os.getenv('AGGREGATE_JOB_BACKEND', 'threads')
+
+# Shared cache for all workers: Redis when REDIS_URL is set (needs the redis package), files under
+# CACHE_DIR when that is set, else per-process memory (the code directory may be read-only, as on Vercel)
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+# Per-process LRU in front of the shared cache (see budgetapp.cache); set LOCAL_CACHE_SIZE=0 to disable
+LOCAL_CACHE_SIZE = int(os.getenv('LOCAL_CACHE_SIZE', '256'))
+LOCAL_CACHE_TIMEOUT = int(os.getenv('LOCAL_CACHE_TIMEOUT', '10'))
+# Per-process LRU of rendered page fragments (dashboard cards and panels)
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', '2000'))
+
+# Part of every page ETag, so a redeploy never answers 304 for markup from older templates.
+# Without one, each process start counts as a new deploy
+DEPLOY_VERSION = os.getenv('DEPLOY_VERSION') or os.getenv('VERCEL_GIT_COMMIT_SHA', '')
+
+# Serializer for cached page data; budgetapp.cache.CompressedPickleSerializer trades CPU for ~5x smaller entries
+CACHE_SERIALIZER = os.getenv('CACHE_SERIALIZER', 'budgetapp.cache.PickleSerializer')
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Budget, Income, Transaction, RecurringTransaction
+from .models import Budget, Income, Transaction, RecurringTransaction, AggregateJob, ImportRule
 
 @admin.register(Budget)
 class BudgetAdmin(admin.ModelAdmin):
@@ -26,3 +26,17 @@ class RecurringTransactionAdmin(admin.ModelAdmin):
     list_filter = ('frequency', 'active', 'budget', 'user')
     search_fields = ('description', 'budget__category', 'user__username')
     date_hierarchy = 'start_date'
+
+
+@admin.register(AggregateJob)
+class AggregateJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'target_id', 'status', 'attempts', 'run_after', 'claimed_at', 'created_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('target_id', 'last_error')
+
+
+@admin.register(ImportRule)
+class ImportRuleAdmin(admin.ModelAdmin):
+    list_display = ('pattern', 'match_type', 'budget', 'income', 'priority', 'user')
+    list_filter = ('match_type', 'user')
+    search_fields = ('pattern', 'budget__category', 'income__source', 'user__username')
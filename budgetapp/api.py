@@ -0,0 +1,269 @@
+"""
+JSON API for widgets and the mobile shell.
+
+Money is sent as integer cents and dates as ISO strings. List endpoints take
+``?fields=a,b`` to trim each record (on the dashboard, ``fields`` trims the
+budgets and ``income_fields`` the incomes), and page with the same keyset
+cursors as the HTML tables (``?after=`` / ``?before=``). Responses share the HTML
+views' cached data and data-version ETags, and are gzipped when the client
+accepts it. The only write is the batch ingestion endpoint.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+from functools import wraps
+
+from django.db import transaction as db_transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from .cache import bump_data_version_on_commit, get_or_compute, user_cache_key
+from .models import Budget, Income, IncomeTransaction, Transaction, deferred_aggregates, set_derived_fields
+from .pagination import InvalidCursor, KeysetPaginator
+from .viewmodels import build_dashboard_data
+from .views import budget_period_paginator, user_data_etag
+
+MAX_PAGE_SIZE = 100
+MAX_BATCH_SIZE = 1000
+
+
+class FieldError(ValueError):
+    pass
+
+
+def cents(value):
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def api_view(view):
+    """Session-authenticated, read-only, compressed, and validated against the user's data version."""
+    @condition(etag_func=user_data_etag)
+    def respond(request, *args, **kwargs):
+        try:
+            data = view(request, *args, **kwargs)
+        except (FieldError, InvalidCursor) as e:
+            return JsonResponse({'error': str(e) or 'Invalid cursor.'}, status=400)
+        return JsonResponse(data, json_dumps_params={'separators': (',', ':')})
+
+    return wraps(view)(api_login_required(gzip_page(require_GET(cache_control(private=True, no_cache=True)(respond)))))
+
+
+def select_fields(request, records, param='fields'):
+    """Trim each record to the comma-separated names in ``?fields=`` (or ``param``), if given."""
+    fields = request.GET.get(param)
+    if not fields or not records:
+        return records
+    names = [name for name in fields.split(',') if name]
+    unknown = set(names) - set(records[0])
+    if unknown:
+        raise FieldError(f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(records[0])}.")
+    return [{name: record[name] for name in names} for record in records]
+
+
+def keyset_page(request, paginator, serialize):
+    try:
+        paginator.per_page = min(max(int(request.GET.get('limit', paginator.per_page)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise FieldError('limit must be a number.')
+    page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    return {
+        'results': select_fields(request, [serialize(obj) for obj in page]),
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+
+
+def period_json(period):
+    return {
+        'start_date': period['start_date'],
+        'end_date': period['end_date'],
+        'budget_amount': cents(period['budget_amount']),
+        'total_spent': cents(period['total_spent']),
+        'balance': cents(period['balance']),
+        'rollover_amount': cents(period['rollover_amount']),
+        'is_over_budget': period['is_over_budget'],
+        'is_current': period['is_current'],
+    }
+
+
+def transaction_json(transaction):
+    return {
+        'id': transaction.id,
+        'budget_id': transaction.budget_id,
+        'date': transaction.date,
+        'description': transaction.description,
+        'amount': cents(transaction.amount),
+    }
+
+
+@api_view
+def dashboard(request):
+    user = request.user
+    data = get_or_compute(user_cache_key(user.id, 'dashboard_data'), lambda: build_dashboard_data(user))
+    budgets = [{
+        'id': card.budget.id,
+        'category': card.budget.category,
+        'amount': cents(card.budget.amount),
+        'frequency': card.budget.frequency_display,
+        'balance': cents(card.balance),
+        'spent': cents(card.spent),
+        'percentage': round(float(card.percentage), 1),
+        'weekly_amount': cents(card.weekly_amount),
+        'weekly_spent': cents(card.weekly_spent),
+    } for card in data['budget_data']]
+    incomes = [{
+        'id': income.id,
+        'source': income.source,
+        'amount': cents(income.amount),
+        'frequency': income.frequency_display,
+        'is_variable': income.is_variable,
+        'total_income': cents(income.total_income),
+    } for income in data['incomes']]
+    return {
+        'totals': {name: cents(data[name]) for name in (
+            'total_budget', 'remaining_budget', 'weekly_budgeted', 'weekly_spent', 'total_weekly_income',
+            'income_remaining_after_budgets', 'income_remaining_after_spend',
+        )},
+        'budgets': select_fields(request, budgets),
+        'incomes': select_fields(request, incomes, 'income_fields'),
+    }
+
+
+@api_view
+def budget_current_period(request, pk):
+    budget = get_object_or_404(Budget, pk=pk, user=request.user)
+    return {
+        'id': budget.id,
+        'category': budget.category,
+        'amount': cents(budget.amount),
+        'frequency': budget.get_frequency_display(),
+        'rollover': budget.rollover,
+        'current_period': period_json(budget.get_current_period_info()),
+    }
+
+
+@api_view
+def budget_periods(request, pk):
+    budget = get_object_or_404(Budget.objects.only('id', 'amount'), pk=pk, user=request.user)
+    return keyset_page(request, budget_period_paginator(budget), lambda period: period_json(budget._period_info(period)))
+
+
+@api_view
+def transactions(request):
+    queryset = Transaction.objects.filter(user=request.user)
+    if request.GET.get('budget'):
+        if not request.GET['budget'].isdigit():
+            raise FieldError('budget must be a budget id.')
+        budget = get_object_or_404(Budget.objects.only('id'), pk=request.GET['budget'], user=request.user)
+        queryset = queryset.filter(budget=budget)
+    return keyset_page(request, KeysetPaginator(queryset, ('-date', '-id'), per_page=20), transaction_json)
+
+
+def parse_row(row, parent_field, parents):
+    """Validate one batch row; returns (model kwargs, errors)."""
+    if not isinstance(row, dict):
+        return None, {'row': 'Expected an object.'}
+    errors = {}
+    parent_id = row.get(parent_field)
+    if parent_id not in parents:
+        errors[parent_field] = f'Unknown {parent_field}.'
+    amount = row.get('amount')
+    if not isinstance(amount, int) or isinstance(amount, bool):
+        errors['amount'] = 'Expected an integer number of cents.'
+    elif abs(amount) >= 10 ** 10:
+        errors['amount'] = 'Amount is too large.'
+    description = row.get('description')
+    if not isinstance(description, str) or not description.strip() or len(description) > 255:
+        errors['description'] = 'Expected between 1 and 255 characters.'
+    date = None
+    if 'date' not in row:
+        date = timezone.localdate()
+    elif isinstance(row['date'], str):
+        try:
+            date = parse_datetime(row['date']) or parse_date(row['date'])
+        except ValueError:
+            pass
+    if date is None:
+        errors['date'] = 'Expected an ISO date or datetime.'
+    if errors:
+        return None, errors
+    if isinstance(date, datetime):
+        date = (timezone.localtime(date) if timezone.is_aware(date) else date).date()
+    # Stored at local midnight, as Transaction.save() does
+    date = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+    return {
+        parent_field: parents[parent_id], 'amount': Decimal(amount).scaleb(-2),
+        'description': description.strip(), 'date': date,
+    }, None
+
+
+@api_login_required
+@require_POST
+def transactions_batch(request):
+    """
+    Create many transactions and income transactions at once.
+
+    Body: ``{"transactions": [{"budget", "amount", "description", "date"}],
+    "income_transactions": [{"income", ...}]}`` with amounts in cents. Valid
+    rows are inserted in one atomic bulk insert; invalid rows are reported and
+    skipped. Each touched budget and income is refreshed once afterwards.
+    """
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Body must be JSON.'}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({'error': 'Body must be a JSON object.'}, status=400)
+    kinds = (
+        ('transactions', 'budget', Budget, Transaction),
+        ('income_transactions', 'income', Income, IncomeTransaction),
+    )
+    rows = {name: body.get(name) or [] for name, *_ in kinds}
+    if not all(isinstance(value, list) for value in rows.values()):
+        return JsonResponse({'error': 'transactions and income_transactions must be lists.'}, status=400)
+    if sum(len(value) for value in rows.values()) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'At most {MAX_BATCH_SIZE} rows per request.'}, status=400)
+
+    user = request.user
+    response = {}
+    with db_transaction.atomic(), deferred_aggregates() as pending:
+        for name, parent_field, parent_model, model in kinds:
+            ids = {row.get(parent_field) for row in rows[name] if isinstance(row, dict)}
+            ids = [value for value in ids if isinstance(value, int) and not isinstance(value, bool)]
+            # Ownership of every referenced parent is checked in one query
+            parents = parent_model.objects.only('id', 'user_id').filter(user=user, pk__in=ids).in_bulk() if ids else {}
+            results = []
+            objects = []
+            for index, row in enumerate(rows[name]):
+                fields, errors = parse_row(row, parent_field, parents)
+                if errors:
+                    results.append({'index': index, 'status': 'error', 'errors': errors})
+                else:
+                    results.append({'index': index, 'status': 'created'})
+                    objects.append((results[-1], model(user=user, **fields)))
+            model.objects.bulk_create(set_derived_fields([obj for _, obj in objects]))
+            for result, obj in objects:
+                result['id'] = obj.pk
+                pending[parent_field].add(getattr(obj, f'{parent_field}_id'))
+            response[name] = {
+                'created': len(objects),
+                'errors': len(results) - len(objects),
+                'results': results,
+            }
+        if any(pending.values()):
+            bump_data_version_on_commit(user.id)
+    return JsonResponse(response, json_dumps_params={'separators': (',', ':')})
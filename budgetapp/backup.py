@@ -0,0 +1,217 @@
+"""
+Per-user backup and restore.
+
+A backup is gzipped NDJSON: a header line, then one ``{"model", "pk",
+"fields"}`` line per row, written model by model in dependency order while
+the rows are read with ``iterator()``, so neither side holds an account in
+memory. Restore reads it back in the same order, gives every row a new
+primary key (remapping foreign keys through the ids it has just inserted)
+and writes each model with chunked ``bulk_create``. No per-row signals run:
+stored aggregates and budget periods are restored as they were, or with
+``rebuild`` recomputed once per budget and income at the end.
+"""
+import gzip
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .cache import bump_data_version_on_commit
+from .models import (
+    Budget, BudgetPeriod, ImportRule, Income, IncomeTransaction, RecurringTransaction, Transaction, UserProfile,
+    deferred_aggregates, set_derived_fields,
+)
+
+FORMAT = 'budgetapp-backup'
+VERSION = 1
+CHUNK_SIZE = 2000
+
+# In dependency order: every foreign key points at a model listed before it
+MODELS = [
+    ('profile', UserProfile, 'user'),
+    ('budget', Budget, 'user'),
+    ('income', Income, 'user'),
+    ('import_rule', ImportRule, 'user'),
+    ('recurring_transaction', RecurringTransaction, 'user'),
+    ('budget_period', BudgetPeriod, 'budget__user'),
+    ('transaction', Transaction, 'user'),
+    ('income_transaction', IncomeTransaction, 'user'),
+]
+# Foreign key column -> the model whose new ids it is remapped through
+REMAPPED = {'budget_id': 'budget', 'income_id': 'income', 'recurring_transaction_id': 'recurring_transaction'}
+# Environment-specific or derived columns that aren't carried over
+SKIPPED = {'id', 'user_id', 'day', 'fingerprint', 'claim_token', 'claimed_until'}
+
+
+class BackupError(ValueError):
+    pass
+
+
+class BackupEncoder(DjangoJSONEncoder):
+    """Keeps microseconds, which DjangoJSONEncoder drops from datetimes."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _columns(model):
+    return [field for field in model._meta.concrete_fields if field.attname not in SKIPPED]
+
+
+def dump_lines(user):
+    """Yield the backup of ``user``'s data as NDJSON lines."""
+    encoder = BackupEncoder(separators=(',', ':'))
+    yield encoder.encode({
+        'format': FORMAT, 'version': VERSION, 'username': user.username, 'email': user.email,
+        'created': timezone.now(),
+    }) + '\n'
+    for name, model, owner in MODELS:
+        attnames = [field.attname for field in _columns(model)]
+        rows = model.objects.filter(**{owner: user}).order_by('pk').values_list('pk', *attnames)
+        for pk, *values in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield encoder.encode({'model': name, 'pk': pk, 'fields': dict(zip(attnames, values))}) + '\n'
+
+
+def dump_user(user, fileobj):
+    """Write a gzipped backup of ``user`` to a binary file object; returns the number of rows."""
+    rows = -1
+    with gzip.open(fileobj, 'wt', encoding='utf-8') as archive:
+        for line in dump_lines(user):
+            archive.write(line)
+            rows += 1
+    return rows
+
+
+def read_lines(fileobj):
+    """Parse a gzipped backup; returns (header, iterator of records)."""
+    archive = gzip.open(fileobj, 'rt', encoding='utf-8')
+    try:
+        header = json.loads(archive.readline() or 'null')
+    except (OSError, ValueError):
+        raise BackupError('Not a gzipped backup file.')
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        raise BackupError('Not a budget tracker backup.')
+    if header.get('version') != VERSION:
+        raise BackupError(f"Unsupported backup version {header.get('version')}.")
+    return header, _records(archive)
+
+
+def _records(archive):
+    try:
+        for line in archive:
+            if line.strip():
+                yield json.loads(line)
+    except (EOFError, OSError, ValueError) as e:
+        raise BackupError(f'Backup is truncated or corrupt: {e}')
+
+
+class Restorer:
+    """Inserts records for one user, remapping primary and foreign keys as it goes."""
+
+    def __init__(self, user, rebuild=False, chunk_size=CHUNK_SIZE):
+        self.user = user
+        self.rebuild = rebuild
+        self.chunk_size = chunk_size
+        self.models = {name: model for name, model, _ in MODELS}
+        self.fields = {name: {field.attname: field for field in _columns(model)} for name, model, _ in MODELS}
+        self.new_ids = {name: {} for name in REMAPPED.values()}
+        self.counts = {name: 0 for name, _, _ in MODELS}
+        self.skipped = 0
+        self.buffer = []
+        self.buffer_model = None
+        profile = UserProfile.objects.filter(user=user).first()
+        self.tzname = profile.timezone if profile else None
+
+    def add(self, record):
+        name = record.get('model')
+        if name not in self.models:
+            raise BackupError(f'Unknown model {name!r} in backup.')
+        if name == 'budget_period' and self.rebuild:
+            return
+        if name != self.buffer_model or len(self.buffer) >= self.chunk_size:
+            self.flush()
+            self.buffer_model = name
+        fields = self.fields[name]
+        values = {}
+        for attname, value in record['fields'].items():
+            field = fields.get(attname)
+            if field is None:
+                continue
+            value = field.to_python(value)
+            if attname in REMAPPED and value is not None:
+                value = self.new_ids[REMAPPED[attname]].get(value)
+                if value is None and not field.null:
+                    # Its parent wasn't in the backup
+                    self.skipped += 1
+                    return
+            values[attname] = value
+        self.buffer.append((record['pk'], values))
+
+    def flush(self):
+        if not self.buffer:
+            return
+        name, model = self.buffer_model, self.models[self.buffer_model]
+        if name == 'profile':
+            profile, _ = UserProfile.objects.get_or_create(user=self.user)
+            for attname, value in self.buffer[-1][1].items():
+                setattr(profile, attname, value)
+            profile.save()
+            self.tzname = profile.timezone
+        else:
+            owner = {} if name == 'budget_period' else {'user_id': self.user.pk}
+            objects = [model(**owner, **values) for _, values in self.buffer]
+            if name in ('transaction', 'income_transaction'):
+                # Days and fingerprints use local dates, as they did when the rows were first saved
+                with timezone.override(self.tzname):
+                    set_derived_fields(objects)
+            model.objects.bulk_create(objects)
+            # bulk_create stamps auto_now fields with the current time; put the originals back
+            stamped = [field.attname for field in self.fields[name].values()
+                       if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+            if stamped:
+                for obj, (_, values) in zip(objects, self.buffer):
+                    for attname in stamped:
+                        setattr(obj, attname, values[attname])
+                model.objects.bulk_update(objects, stamped)
+            if name in self.new_ids:
+                self.new_ids[name].update((old_pk, obj.pk) for (old_pk, _), obj in zip(self.buffer, objects))
+        self.counts[name] += len(self.buffer)
+        self.buffer = []
+
+
+def restore_user(fileobj, user, rebuild=False, replace=False, chunk_size=CHUNK_SIZE):
+    """Restore a gzipped backup into ``user``'s account; see ``restore_records``."""
+    _, records = read_lines(fileobj)
+    return restore_records(records, user, rebuild=rebuild, replace=replace, chunk_size=chunk_size)
+
+
+def restore_records(records, user, rebuild=False, replace=False, chunk_size=CHUNK_SIZE):
+    """
+    Restore backup records into ``user``'s account and return per-model row counts.
+
+    The account must be empty unless ``replace`` is set, in which case its
+    existing data is deleted first. Everything happens in one transaction.
+    """
+    with db_transaction.atomic(), deferred_aggregates() as pending:
+        has_data = Budget.objects.filter(user=user).exists() or Income.objects.filter(user=user).exists()
+        if has_data and not replace:
+            raise BackupError(f'{user.username} already has budgets or income; restore into an empty account.')
+        if has_data:
+            Budget.objects.filter(user=user).delete()
+            Income.objects.filter(user=user).delete()
+            # Nothing left to refresh for the deleted rows
+            pending['budget'].clear()
+            pending['income'].clear()
+        restorer = Restorer(user, rebuild=rebuild, chunk_size=chunk_size)
+        for record in records:
+            restorer.add(record)
+        restorer.flush()
+        if rebuild:
+            pending['budget'].update(restorer.new_ids['budget'].values())
+            pending['income'].update(restorer.new_ids['income'].values())
+        bump_data_version_on_commit(user.id)
+    return {'counts': restorer.counts, 'skipped': restorer.skipped}
@@ -0,0 +1,335 @@
+"""
+Per-user cache generations.
+
+Every cached page fragment for a user has the user's current data version
+in its key. Any change to the user's data (model signals, bulk inserts,
+finished aggregate recomputes) bumps the version once the surrounding
+transaction commits, which orphans every older entry at once; nothing is
+deleted and stale entries simply expire.
+
+Values go through ``get_cached`` / ``set_cached``, which store them as bytes
+produced by the serializer named in ``settings.CACHE_SERIALIZER``.
+
+Expensive pages use ``get_or_compute`` on top of that. Entries stay in the
+cache for a grace period after they go stale; the first request to notice
+takes a short lock (``cache.add``) and recomputes while everyone else keeps
+getting the stale value. Entries are also refreshed a little early at random
+("XFetch"), weighted by how long they took to build, so busy keys don't all
+expire together. Stale values are only ever served for the same data
+version: after an edit the key changes and the page is rebuilt.
+
+Each process keeps a small LRU of deserialized entries in front of the shared
+cache. Data versions are always read from the shared cache, so a bump in any
+worker moves every worker onto new keys; the local copies only ever lag the
+shared cache by ``LOCAL_CACHE_TIMEOUT`` seconds for same-version refreshes.
+Rendered HTML fragments, keyed by the content they show, have an LRU of
+their own (``get_fragments`` / ``set_fragments``).
+
+A shared cache that errors (unwritable directory, Redis down) is treated as
+empty: every lookup misses and each request gets a fresh data version, so
+pages are computed uncached and never validated rather than failing.
+"""
+import logging
+import math
+import pickle
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Views cache their data for this long unless the version moves on first
+CACHE_TIMEOUT = 300
+# Stale entries are kept (and served during a refresh) for this much longer
+STALE_TIMEOUT = 300
+# How long a recompute lock is held at most, and how long a request with
+# nothing to serve waits for another process to finish computing
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2.0
+# Rendered fragments are dropped from the in-process LRU after this long
+FRAGMENT_TIMEOUT = 3600
+
+
+def _version_key(user_id):
+    return f'data_version_{user_id}'
+
+
+def _initial_version():
+    # Seeded from the clock so a version evicted from the cache is never reused
+    return time.time_ns() // 1000
+
+
+def get_data_version(user_id):
+    """Return the user's current data version."""
+    key = _version_key(user_id)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, _initial_version(), timeout=None)
+            version = cache.get(key)
+    except Exception:
+        logger.warning('Cache unavailable reading the data version of user %s', user_id, exc_info=True)
+        version = None
+    # A version of our own matches nothing cached, so nothing stale can be served
+    return _initial_version() if version is None else version
+
+
+def bump_data_version(user_id):
+    """Move the user on to a new data version, invalidating everything cached for them."""
+    key = _version_key(user_id)
+    try:
+        try:
+            return cache.incr(key)
+        except ValueError:
+            version = _initial_version()
+            cache.set(key, version, timeout=None)
+            return version
+    except Exception:
+        logger.warning('Cache unavailable bumping the data version of user %s', user_id, exc_info=True)
+        return None
+
+
+def bump_data_version_on_commit(user_id):
+    """Bump the user's version once the current transaction commits (immediately outside one)."""
+    transaction.on_commit(lambda: bump_data_version(user_id))
+
+
+def user_cache_key(user_id, name, *parts):
+    """Cache key for ``name`` under the user's current data version."""
+    suffix = ''.join(f'_{part}' for part in parts)
+    return f'{name}_{user_id}_v{get_data_version(user_id)}{suffix}'
+
+
+class PickleSerializer:
+    """Highest-protocol pickle; the default."""
+
+    def dumps(self, value):
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class CompressedPickleSerializer(PickleSerializer):
+    """Pickle plus fast zlib compression, for caches where payload size matters more than CPU."""
+
+    def dumps(self, value):
+        return zlib.compress(super().dumps(value), 1)
+
+    def loads(self, data):
+        return super().loads(zlib.decompress(data))
+
+
+_serializers = {}
+
+
+def get_serializer():
+    path = getattr(settings, 'CACHE_SERIALIZER', 'budgetapp.cache.PickleSerializer')
+    if path not in _serializers:
+        _serializers[path] = import_string(path)()
+    return _serializers[path]
+
+
+class LocalCache:
+    """Thread-safe LRU of deserialized entries for this process, bounded in size and age."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local_cache = None
+_fragment_cache = None
+_stats = {'local_hits': 0, 'local_misses': 0, 'shared_hits': 0, 'shared_misses': 0,
+          'fragment_hits': 0, 'fragment_misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        _local_cache = LocalCache(getattr(settings, 'LOCAL_CACHE_SIZE', 256),
+                                  getattr(settings, 'LOCAL_CACHE_TIMEOUT', 10))
+    return _local_cache
+
+
+def get_fragment_cache():
+    # Fragments are keyed by their content and never go stale, and rendering
+    # one is cheaper than a round trip to a file cache, so they stay in-process
+    global _fragment_cache
+    if _fragment_cache is None:
+        _fragment_cache = LocalCache(getattr(settings, 'FRAGMENT_CACHE_SIZE', 2000), FRAGMENT_TIMEOUT)
+    return _fragment_cache
+
+
+def _count(name):
+    _count_many(name, 1)
+
+
+def _count_many(name, count):
+    with _stats_lock:
+        _stats[name] += count
+
+
+def cache_stats():
+    """Hit and miss counts per tier for this process."""
+    local = get_local_cache()
+    fragments = get_fragment_cache()
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        'local': {'hits': stats['local_hits'], 'misses': stats['local_misses'],
+                  'entries': len(local), 'max_entries': local.max_entries},
+        'shared': {'hits': stats['shared_hits'], 'misses': stats['shared_misses']},
+        'fragments': {'hits': stats['fragment_hits'], 'misses': stats['fragment_misses'],
+                      'entries': len(fragments), 'max_entries': fragments.max_entries},
+    }
+
+
+def _load_shared(key):
+    try:
+        data = cache.get(key)
+    except Exception:
+        logger.warning('Cache unavailable reading %s', key, exc_info=True)
+        data = None
+    if data is None:
+        _count('shared_misses')
+        return None
+    _count('shared_hits')
+    entry = get_serializer().loads(data)
+    get_local_cache().set(key, entry)
+    return entry
+
+
+def _load(key):
+    """Return ``(value, delta, expires)`` for ``key`` from either tier, or None."""
+    entry = get_local_cache().get(key)
+    if entry is not None:
+        _count('local_hits')
+        return entry
+    _count('local_misses')
+    return _load_shared(key)
+
+
+def get_cached(key):
+    """Return the deserialized value stored under ``key``, or None (stale or not)."""
+    entry = _load(key)
+    return None if entry is None else entry[0]
+
+
+def set_cached(key, value, timeout=CACHE_TIMEOUT, delta=0.0):
+    """Store ``value`` under ``key``; ``delta`` is how many seconds it took to compute."""
+    entry = (value, delta, time.time() + timeout)
+    try:
+        cache.set(key, get_serializer().dumps(entry), timeout + STALE_TIMEOUT)
+    except Exception:
+        logger.warning('Cache unavailable writing %s', key, exc_info=True)
+        return
+    get_local_cache().set(key, entry)
+
+
+def get_fragments(keys):
+    """Return ``{key: html}`` for the rendered fragments this process has cached."""
+    fragments = get_fragment_cache()
+    found = {}
+    for key in keys:
+        html = fragments.get(key)
+        if html is not None:
+            found[key] = html
+    _count_many('fragment_hits', len(found))
+    _count_many('fragment_misses', len(keys) - len(found))
+    return found
+
+
+def set_fragments(rendered):
+    fragments = get_fragment_cache()
+    for key, html in rendered.items():
+        fragments.set(key, html)
+
+
+def _should_refresh(delta, expires, beta):
+    # XFetch: refresh early with a probability that rises as expiry nears
+    # and with the cost of the computation (log of (0, 1] is <= 0)
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires
+
+
+def _compute(key, compute, timeout):
+    started = time.monotonic()
+    value = compute()
+    set_cached(key, value, timeout, time.monotonic() - started)
+    return value
+
+
+def get_or_compute(key, compute, timeout=CACHE_TIMEOUT, beta=1.0):
+    """
+    Return the value cached under ``key``, calling ``compute()`` to refresh it.
+
+    Only the request holding ``key``'s lock recomputes; others get the stale
+    value if there is one, or wait up to ``LOCK_WAIT`` seconds for the fresh
+    value and then compute it themselves.
+    """
+    entry = _load(key)
+    if entry is not None and _should_refresh(entry[1], entry[2], beta):
+        # Another worker may already have refreshed the shared copy
+        entry = _load_shared(key) or entry
+    if entry is not None and not _should_refresh(entry[1], entry[2], beta):
+        return entry[0]
+
+    lock_key = f'{key}_lock'
+    try:
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    except Exception:
+        logger.warning('Cache unavailable locking %s', key, exc_info=True)
+        return compute()
+    if locked:
+        try:
+            return _compute(key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+    if entry is not None:
+        return entry[0]
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = _load_shared(key)
+        if entry is not None:
+            return entry[0]
+    return _compute(key, compute, timeout)
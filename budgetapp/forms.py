@@ -1,8 +1,9 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, PasswordChangeForm
 from django.contrib.auth.models import User
-from .models import Budget, Income, Transaction, RecurringTransaction, IncomeTransaction, UserProfile
+from .models import Budget, Income, Transaction, RecurringTransaction, IncomeTransaction, UserProfile, ImportRule
 import pytz
+import re
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -113,4 +114,67 @@ class RecurringTransactionForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if user:
             self.fields['budget'].queryset = Budget.objects.filter(user=user)
-        self.fields['end_date'].required = False
\ No newline at end of file
+        self.fields['end_date'].required = False
+
+class StatementImportForm(forms.Form):
+    FORMAT_CHOICES = [('', 'Detect from file name'), ('csv', 'CSV'), ('ofx', 'OFX / QFX'), ('qif', 'QIF')]
+    statement = forms.FileField()
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+    date_format = forms.CharField(max_length=20, required=False,
+                                  help_text="strftime format such as %d/%m/%Y, if dates aren't detected correctly")
+    default_budget = forms.ModelChoiceField(queryset=Budget.objects.none(), required=False,
+                                            help_text="Debits that match no rule")
+    default_income = forms.ModelChoiceField(queryset=Income.objects.none(), required=False,
+                                            help_text="Credits that match no rule")
+
+    def __init__(self, user=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['default_budget'].queryset = Budget.objects.filter(user=user)
+            self.fields['default_income'].queryset = Income.objects.filter(user=user)
+
+class ImportRuleForm(forms.ModelForm):
+    class Meta:
+        model = ImportRule
+        fields = ['pattern', 'match_type', 'budget', 'income', 'priority']
+
+    def __init__(self, user=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['budget'].queryset = Budget.objects.filter(user=user)
+            self.fields['income'].queryset = Income.objects.filter(user=user)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if bool(cleaned_data.get('budget')) == bool(cleaned_data.get('income')):
+            raise forms.ValidationError("Choose either a budget or an income source.")
+        if cleaned_data.get('match_type') == 'regex' and cleaned_data.get('pattern'):
+            try:
+                re.compile(cleaned_data['pattern'])
+            except re.error as e:
+                self.add_error('pattern', f"Invalid regular expression: {e}")
+        return cleaned_data
+
+class TransactionExportForm(forms.Form):
+    KIND_CHOICES = [('transactions', 'Transactions'), ('income', 'Income transactions')]
+    FORMAT_CHOICES = [('csv', 'CSV'), ('ndjson', 'NDJSON')]
+    kind = forms.ChoiceField(choices=KIND_CHOICES, required=False)
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    budget = forms.ModelChoiceField(queryset=Budget.objects.none(), required=False)
+    income = forms.ModelChoiceField(queryset=Income.objects.none(), required=False)
+
+    def __init__(self, user=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['budget'].queryset = Budget.objects.filter(user=user)
+            self.fields['income'].queryset = Income.objects.filter(user=user)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['kind'] = cleaned_data.get('kind') or 'transactions'
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        if cleaned_data.get('start') and cleaned_data.get('end') and cleaned_data['start'] > cleaned_data['end']:
+            raise forms.ValidationError("The start date must be on or before the end date.")
+        return cleaned_data
@@ -0,0 +1,280 @@
+"""
+Bank statement import.
+
+Parsers read CSV, OFX and QIF files line by line and yield ``StatementRow``s,
+so memory use doesn't grow with the file. ``import_statement`` maps each row
+to a budget or income source through the user's ``ImportRule``s and writes
+them in chunks with ``bulk_create`` inside ``deferred_aggregates``, so each
+touched budget and income is refreshed once at the end instead of per row.
+Rows already stored (same date, amount and description) are skipped, so
+overlapping statements can be imported safely.
+"""
+import csv
+import re
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .cache import bump_data_version_on_commit
+from .models import (
+    DuplicateFilter, ImportRule, IncomeTransaction, Transaction, deferred_aggregates, set_derived_fields,
+)
+
+StatementRow = namedtuple('StatementRow', ['line', 'date', 'amount', 'description'])
+
+FORMATS = ('csv', 'ofx', 'qif')
+# Day-first formats are tried before month-first ones
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d %b %Y', '%m/%d/%Y', '%Y%m%d')
+
+CSV_DATE_COLUMNS = ('date', 'transaction date', 'posted date', 'posting date', 'value date')
+CSV_AMOUNT_COLUMNS = ('amount', 'value', 'transaction amount')
+CSV_DEBIT_COLUMNS = ('debit', 'withdrawal', 'withdrawals', 'debit amount')
+CSV_CREDIT_COLUMNS = ('credit', 'deposit', 'deposits', 'credit amount')
+CSV_DESCRIPTION_COLUMNS = ('description', 'narrative', 'details', 'memo', 'payee', 'transaction details')
+
+
+class StatementError(ValueError):
+    """A statement that can't be read at all (as opposed to a bad row)."""
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'qfx':
+        return 'ofx'
+    if extension not in FORMATS:
+        raise StatementError(f'Unrecognised statement type: {filename}')
+    return extension
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value, date_format=None):
+    # Cached: a statement has far fewer distinct dates than rows
+    value = value.strip()
+    for fmt in (date_format,) if date_format else DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f'Unrecognised date: {value!r}')
+
+
+def parse_amount(value):
+    cleaned = value.strip().replace(',', '').replace('$', '').replace(' ', '')
+    negative = cleaned.startswith('(') and cleaned.endswith(')')
+    try:
+        amount = Decimal(cleaned.strip('()'))
+    except InvalidOperation:
+        raise RowError(f'Unrecognised amount: {value!r}')
+    return -amount if negative else amount
+
+
+def _column(fieldnames, candidates):
+    lowered = {name.strip().lower(): name for name in fieldnames if name}
+    return next((lowered[name] for name in candidates if name in lowered), None)
+
+
+def parse_csv(lines, date_format=None):
+    """Yield rows from a CSV export with a header row; amounts may be signed or split into debit/credit."""
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames:
+        return
+    date_column = _column(reader.fieldnames, CSV_DATE_COLUMNS)
+    amount_column = _column(reader.fieldnames, CSV_AMOUNT_COLUMNS)
+    debit_column = _column(reader.fieldnames, CSV_DEBIT_COLUMNS)
+    credit_column = _column(reader.fieldnames, CSV_CREDIT_COLUMNS)
+    description_column = _column(reader.fieldnames, CSV_DESCRIPTION_COLUMNS)
+    if not date_column or not description_column or not (amount_column or debit_column or credit_column):
+        raise StatementError('CSV needs date, description and amount (or debit/credit) columns.')
+    for record in reader:
+        line = reader.line_num
+        try:
+            if amount_column:
+                amount = parse_amount(record[amount_column] or '0')
+            else:
+                debit = (record.get(debit_column) or '').strip() if debit_column else ''
+                credit = (record.get(credit_column) or '').strip() if credit_column else ''
+                amount = parse_amount(credit or '0') - abs(parse_amount(debit or '0'))
+            row = StatementRow(line, parse_date(record[date_column] or '', date_format), amount,
+                               (record[description_column] or '').strip())
+        except (RowError, TypeError) as e:
+            yield line, RowError(str(e))
+            continue
+        yield line, row
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def parse_ofx(lines, date_format=None):
+    """Yield STMTTRN entries from SGML (OFX 1.x) or XML (OFX 2.x) statements."""
+    current = None
+    start_line = 0
+    for line_number, line in enumerate(lines, 1):
+        for closing, tag, text in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield start_line, _ofx_row(start_line, current)
+                    current = None
+                elif not closing:
+                    current, start_line = {}, line_number
+            elif current is not None and not closing and text.strip():
+                current[tag] = text.strip()
+
+
+def _ofx_row(line, fields):
+    try:
+        posted = fields.get('DTPOSTED', '')[:8]
+        description = ' '.join(filter(None, (fields.get('NAME'), fields.get('MEMO'))))
+        return StatementRow(line, datetime.strptime(posted, '%Y%m%d').date(),
+                            parse_amount(fields.get('TRNAMT', '')), description)
+    except (RowError, ValueError) as e:
+        return RowError(str(e))
+
+
+def _qif_date(value, date_format):
+    # Quicken writes years after 2000 as d/m'yy, often with padding spaces
+    value = value.replace("'", '/').replace(' ', '')
+    return parse_date(value, date_format)
+
+
+def parse_qif(lines, date_format=None):
+    """Yield records from a QIF bank export (D date, T amount, P payee, M memo, ^ ends a record)."""
+    record = {}
+    start_line = None
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('!'):
+            continue
+        code, value = line[0], line[1:].strip()
+        if start_line is None:
+            start_line = line_number
+        if code == '^':
+            if record:
+                try:
+                    row = StatementRow(start_line, _qif_date(record.get('D', ''), date_format),
+                                       parse_amount(record.get('T') or record.get('U', '')),
+                                       ' '.join(filter(None, (record.get('P'), record.get('M')))))
+                except RowError as e:
+                    row = e
+                yield start_line, row
+            record = {}
+            start_line = None
+        elif code not in record:
+            record[code] = value
+
+
+PARSERS = {'csv': parse_csv, 'ofx': parse_ofx, 'qif': parse_qif}
+
+
+class RuleMatcher:
+    """Finds the first matching rule for a description, falling back to defaults by sign."""
+
+    def __init__(self, rules, default_budget=None, default_income=None):
+        self.rules = []
+        for rule in rules:
+            if rule.match_type == 'regex':
+                test = re.compile(rule.pattern, re.IGNORECASE).search
+            elif rule.match_type == 'startswith':
+                pattern = rule.pattern.lower()
+                test = lambda text, pattern=pattern: text.lower().startswith(pattern)
+            else:
+                pattern = rule.pattern.lower()
+                test = lambda text, pattern=pattern: pattern in text.lower()
+            target = ('budget', rule.budget_id) if rule.budget_id else ('income', rule.income_id)
+            self.rules.append((test, target))
+        self.default_budget = default_budget
+        self.default_income = default_income
+        # Statements repeat the same few hundred descriptions
+        self._match_rule = lru_cache(maxsize=4096)(self._match_rule)
+
+    def _match_rule(self, description):
+        return next((target for test, target in self.rules if test(description)), None)
+
+    def match(self, row):
+        target = self._match_rule(row.description)
+        if target is not None:
+            return target
+        if row.amount < 0 and self.default_budget is not None:
+            return ('budget', self.default_budget)
+        if row.amount > 0 and self.default_income is not None:
+            return ('income', self.default_income)
+        return None
+
+
+def import_statement(user, rows, default_budget=None, default_income=None, chunk_size=2000, skip_duplicates=True):
+    """
+    Import parsed ``(line, row)`` pairs for ``user`` and return counts and row errors.
+
+    Debits matched to a budget become transactions (refunds reduce spending);
+    rows matched to an income become income transactions. Unmatched rows and,
+    with ``skip_duplicates``, rows that are already stored are skipped.
+    Everything is written in one database transaction.
+    """
+    rules = ImportRule.objects.filter(user=user)
+    matcher = RuleMatcher(rules, default_budget, default_income)
+    stats = {'rows': 0, 'transactions': 0, 'income_transactions': 0, 'skipped': 0, 'duplicates': 0, 'errors': []}
+    if skip_duplicates:
+        new_transactions, new_income_transactions = DuplicateFilter(Transaction), DuplicateFilter(IncomeTransaction)
+    else:
+        new_transactions = new_income_transactions = set_derived_fields
+    transactions = []
+    income_transactions = []
+    tz = timezone.get_current_timezone()
+    midnight = datetime.min.time()
+    aware_dates = {}
+
+    def flush():
+        created = Transaction.objects.bulk_create(new_transactions(transactions))
+        created_income = IncomeTransaction.objects.bulk_create(new_income_transactions(income_transactions))
+        stats['transactions'] += len(created)
+        stats['income_transactions'] += len(created_income)
+        stats['duplicates'] += len(transactions) + len(income_transactions) - len(created) - len(created_income)
+        pending['budget'].update(t.budget_id for t in created)
+        pending['income'].update(t.income_id for t in created_income)
+        transactions.clear()
+        income_transactions.clear()
+
+    with db_transaction.atomic(), deferred_aggregates() as pending:
+        for line, row in rows:
+            stats['rows'] += 1
+            if isinstance(row, Exception):
+                stats['errors'].append((line, str(row)))
+                continue
+            target = matcher.match(row)
+            if target is None or not row.amount:
+                stats['skipped'] += 1
+                continue
+            kind, target_id = target
+            date = aware_dates.get(row.date)
+            if date is None:
+                date = aware_dates[row.date] = timezone.make_aware(datetime.combine(row.date, midnight), tz)
+            description = row.description[:255] or 'Imported transaction'
+            if kind == 'budget':
+                transactions.append(Transaction(user=user, budget_id=target_id, amount=-row.amount,
+                                                description=description, date=date))
+            else:
+                income_transactions.append(IncomeTransaction(user=user, income_id=target_id, amount=row.amount,
+                                                             description=description, date=date))
+            if len(transactions) + len(income_transactions) >= chunk_size:
+                flush()
+        flush()
+        if stats['transactions'] or stats['income_transactions']:
+            bump_data_version_on_commit(user.id)
+    return stats
+
+
+def import_file(user, lines, file_format, date_format=None, **options):
+    """Parse and import an open text stream of the given format."""
+    try:
+        return import_statement(user, PARSERS[file_format](lines, date_format), **options)
+    except csv.Error as e:
+        raise StatementError(f'Could not read CSV: {e}')
@@ -0,0 +1,34 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from budgetapp.backup import dump_user
+
+
+class Command(BaseCommand):
+    help = "Write a gzipped NDJSON backup of one user's budgets, income, transactions and settings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='User id or username to back up.')
+        parser.add_argument('--output', '-o', help='File to write (default: <username>.ndjson.gz; - for stdout).')
+
+    def handle(self, *args, **options):
+        value = options['user']
+        user = User.objects.filter(**{'pk' if value.isdigit() else 'username': value}).first()
+        if user is None:
+            raise CommandError(f"No user {value!r}")
+        path = options['output'] or f'{user.username}.ndjson.gz'
+
+        if path == '-':
+            dump_user(user, sys.stdout.buffer)
+            return
+        started = time.monotonic()
+        try:
+            with open(path, 'wb') as output:
+                rows = dump_user(user, output)
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Backed up {rows} rows for {user.username} to {path} in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,70 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Prefetch
+from django.utils.module_loading import import_string
+from budgetapp.models import Budget, Income, IncomeTransaction, RecurringTransaction, Transaction
+from budgetapp.viewmodels import build_dashboard_data
+
+SERIALIZERS = ('budgetapp.cache.PickleSerializer', 'budgetapp.cache.CompressedPickleSerializer')
+
+
+def model_payload(user, payload):
+    """The dashboard payload as it used to be cached: model instances and lazy querysets."""
+    budgets = {budget.pk: budget for budget in Budget.objects.filter(user=user).prefetch_related(
+        Prefetch('transactions', queryset=Transaction.objects.select_related('recurring_transaction')))}
+    incomes = list(Income.objects.filter(user=user).prefetch_related('income_transactions'))
+    incomes_by_id = {income.pk: income for income in incomes}
+    legacy = dict(payload)
+    legacy['budget_data'] = [
+        {'budget': budgets[card.budget.id], 'balance': card.balance, 'spent': card.spent,
+         'weekly_amount': card.weekly_amount, 'weekly_spent': card.weekly_spent, 'percentage': card.percentage}
+        for card in payload['budget_data']
+    ]
+    legacy['incomes'] = incomes
+    legacy['variable_income_data'] = [
+        {'income': incomes_by_id[card.income.id],
+         'recent_transactions': IncomeTransaction.objects.filter(income_id=card.income.id).order_by('-date')[:5],
+         'actual_period_amount': card.actual_period_amount, 'expected_amount': card.expected_amount,
+         'difference': card.difference}
+        for card in payload['variable_income_data']
+    ]
+    legacy['recent_transactions'] = Transaction.objects.filter(user=user).select_related('budget').order_by('-date')[:10]
+    legacy['recent_income_transactions'] = IncomeTransaction.objects.filter(user=user).select_related('income').order_by('-date')[:5]
+    legacy['recurring_transactions'] = RecurringTransaction.objects.filter(user=user, active=True).select_related('budget')
+    return legacy
+
+
+class Command(BaseCommand):
+    help = 'Compare cached dashboard payload size and (de)serialization time for model and view-model payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='User id or username (defaults to the user with the most budgets).')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            value = options['user']
+            user = users.filter(pk=value).first() if value.isdigit() else users.filter(username=value).first()
+        else:
+            user = users.annotate(budget_count=Count('budgets')).order_by('-budget_count').first()
+        if user is None:
+            raise CommandError('No matching user.')
+
+        payload = build_dashboard_data(user)
+        payloads = {'models': model_payload(user, payload), 'view models': payload}
+        self.stdout.write(f"User {user.username}: {len(payload['budget_data'])} budgets, "
+                          f"{len(payload['incomes'])} incomes, {options['iterations']} iterations")
+        for path in SERIALIZERS:
+            serializer = import_string(path)()
+            for label, value in payloads.items():
+                data = serializer.dumps(value)
+                dumps = timeit.timeit(lambda: serializer.dumps(value), number=options['iterations'])
+                loads = timeit.timeit(lambda: serializer.loads(data), number=options['iterations'])
+                self.stdout.write(
+                    f"{path.rsplit('.', 1)[-1]:<28} {label:<12} {len(data):>9} bytes  "
+                    f"dumps {dumps / options['iterations'] * 1e6:>8.0f}us  "
+                    f"loads {loads / options['iterations'] * 1e6:>8.0f}us"
+                )
@@ -0,0 +1,66 @@
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from budgetapp.cache import get_fragment_cache
+from budgetapp.models import Budget, Income, Transaction, set_derived_fields, update_budget_aggregates
+from budgetapp.viewmodels import build_dashboard_data, render_dashboard_fragments
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time dashboard rendering for a throwaway user, with cold, warm and partly changed fragment caches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budgets', type=int, default=50)
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['budgets'], options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, budget_count, iterations):
+        user = User.objects.create_user('benchmark-dashboard-render')
+        now = timezone.now()
+        for i in range(budget_count):
+            budget = Budget.objects.create(user=user, category=f'Budget {i}', amount=Decimal('50.00'),
+                                           frequency=('weekly', 'fortnightly', 'monthly')[i % 3])
+            Transaction.objects.bulk_create(set_derived_fields([
+                Transaction(user=user, budget=budget, amount=Decimal('4.00'), description=f'Purchase {j}',
+                            date=now - timedelta(days=3 * j))
+                for j in range(10)
+            ]))
+            update_budget_aggregates(budget)
+        for i in range(5):
+            Income.objects.create(user=user, source=f'Income {i}', amount=Decimal('500.00'), frequency='weekly',
+                                  is_variable=i % 2 == 0)
+        data = build_dashboard_data(user)
+
+        def render():
+            render_to_string('budgetapp/dashboard.html', dict(data, **render_dashboard_fragments(data)))
+
+        def cold():
+            get_fragment_cache().clear()
+            render()
+
+        def one_card_changed():
+            data['budget_data'][0].spent += Decimal('0.01')
+            render()
+
+        self.stdout.write(f'{budget_count} budgets, {iterations} iterations')
+        for label, func in (('cold fragments', cold), ('warm fragments', render), ('one card changed', one_card_changed)):
+            render()
+            seconds = timeit.timeit(func, number=iterations)
+            self.stdout.write(f'{label:<18} {seconds / iterations * 1000:>8.2f}ms per render')
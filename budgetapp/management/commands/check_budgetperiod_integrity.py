@@ -10,7 +10,7 @@ class Command(BaseCommand):
         errors = 0
         for budget in Budget.objects.all():
             # Get expected periods from calculation
-            expected_periods = budget.get_historical_periods(num_periods=52)
+            expected_periods = budget.get_historical_periods(num_periods=52, use_db=False)
             # Get actual periods from DB
             actual_periods = list(BudgetPeriod.objects.filter(budget=budget).order_by('-start_date'))
             if len(expected_periods) != len(actual_periods):
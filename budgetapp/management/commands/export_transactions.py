@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from budgetapp.exporters import FORMATS, KINDS, export_lines, export_queryset
+from budgetapp.models import Budget, Income, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Stream a user's transactions or income transactions to CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='User id or username to export.')
+        parser.add_argument('--kind', choices=list(KINDS), default='transactions')
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--start', help='First date to include (YYYY-MM-DD).')
+        parser.add_argument('--end', help='Last date to include (YYYY-MM-DD).')
+        parser.add_argument('--budget', type=int, help='Only this budget id (transactions).')
+        parser.add_argument('--income', type=int, help='Only this income id (income transactions).')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout).')
+
+    def handle(self, *args, **options):
+        value = options['user']
+        user = User.objects.filter(**{'pk' if value.isdigit() else 'username': value}).first()
+        if user is None:
+            raise CommandError(f"No user {value!r}")
+        dates = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                try:
+                    dates[name] = datetime.strptime(options[name], "%Y-%m-%d").date()
+                except ValueError:
+                    raise CommandError(f"--{name} must be a date in YYYY-MM-DD format")
+        parents = {}
+        for name, model in (('budget', Budget), ('income', Income)):
+            if options[name]:
+                parents[name] = model.objects.filter(pk=options[name], user=user).first()
+                if parents[name] is None:
+                    raise CommandError(f"--{name} {options[name]} doesn't belong to {user.username}")
+
+        # Dates are exported as the user sees them
+        profile = UserProfile.objects.filter(user=user).first()
+        with timezone.override(profile.timezone if profile else None):
+            queryset = export_queryset(user, options['kind'], dates.get('start'), dates.get('end'),
+                                       parents.get('budget'), parents.get('income'))
+            lines = export_lines(queryset, options['kind'], options['format'])
+            if options['output']:
+                with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                    output.writelines(lines)
+            else:
+                self.stdout.writelines(lines)
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from budgetapp.models import IncomeTransaction, Transaction
+
+
+class Command(BaseCommand):
+    # Report only: identical purchases on one day are often genuine (DuplicateFilter keeps them too),
+    # so which copies to remove is left to a person reading the ids
+    help = ('Report transactions and income transactions recorded more than once (same user, date, amount and '
+            'description), with the ids of every copy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', help='Comma-separated user ids or usernames to limit the scan to.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read per query.')
+        parser.add_argument('--backfill', action='store_true', help='Fill in missing fingerprints before scanning.')
+
+    def handle(self, *args, **options):
+        user_filter = Q()
+        if options['users']:
+            values = [value.strip() for value in options['users'].split(',')]
+            ids = [value for value in values if value.isdigit()]
+            names = [value for value in values if not value.isdigit()]
+            user_filter = Q(user_id__in=ids) | Q(user__username__in=names)
+
+        started = time.monotonic()
+        for model in (Transaction, IncomeTransaction):
+            rows = model.objects.filter(user_filter)
+            if options['backfill']:
+                self.backfill(rows, options['chunk_size'])
+            groups, extra = self.scan(rows, options['chunk_size'])
+            label = model._meta.verbose_name_plural
+            if not groups:
+                self.stdout.write(f"No duplicate {label}.")
+                continue
+            self.stdout.write(f"{groups} duplicated {label}, {extra} extra rows.")
+        self.stdout.write(f"Finished in {time.monotonic() - started:.1f}s.")
+
+    def backfill(self, rows, chunk_size):
+        missing = rows.filter(fingerprint='').only('user_id', 'day', 'amount', 'description').order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(missing.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            for row in chunk:
+                row.fingerprint = row.compute_fingerprint()
+            rows.model.objects.bulk_update(chunk, ['fingerprint'])
+            last_pk = chunk[-1].pk
+
+    def scan(self, rows, chunk_size):
+        """
+        Stream rows in fingerprint order so copies are adjacent; memory stays flat
+        apart from the current group. Returns (groups, extra rows).
+        """
+        columns = ('pk', 'fingerprint', 'date', 'amount', 'description', 'user_id')
+        ordered = rows.exclude(fingerprint='').order_by('fingerprint', 'pk').values_list(*columns)
+        groups = 0
+        extra = 0
+        current = []
+
+        def report():
+            nonlocal groups, extra
+            if len(current) > 1:
+                groups += 1
+                pk, _, date, amount, description, user_id = current[0]
+                self.stdout.write(
+                    f"user {user_id} {timezone.localtime(date):%Y-%m-%d} ${amount} {description!r}: "
+                    f"{len(current)} copies (ids {', '.join(str(row[0]) for row in current)})"
+                )
+                extra += len(current) - 1
+
+        for row in ordered.iterator(chunk_size=chunk_size):
+            if current and row[1] != current[0][1]:
+                report()
+                current = []
+            current.append(row)
+        report()
+        return groups, extra
@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from budgetapp.importers import FORMATS, StatementError, detect_format, import_file
+from budgetapp.models import Budget, Income, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV, OFX or QIF bank statement for a user, mapping lines to budgets with their import rules.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement file to import.')
+        parser.add_argument('--user', required=True, help='User id or username to import for.')
+        parser.add_argument('--format', choices=FORMATS, help='Statement format (default: from the file extension).')
+        parser.add_argument('--date-format', help='strftime format for dates, e.g. %%d/%%m/%%Y (default: detect).')
+        parser.add_argument('--default-budget', type=int, help='Budget id for debits that match no rule.')
+        parser.add_argument('--default-income', type=int, help='Income id for credits that match no rule.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows written per bulk insert.')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--keep-duplicates', action='store_true',
+                            help='Import rows even if the same date, amount and description is already recorded.')
+
+    def handle(self, *args, **options):
+        value = options['user']
+        user = User.objects.filter(**{'pk' if value.isdigit() else 'username': value}).first()
+        if user is None:
+            raise CommandError(f"No user {value!r}")
+        for name, model in (('default_budget', Budget), ('default_income', Income)):
+            if options[name] and not model.objects.filter(pk=options[name], user=user).exists():
+                raise CommandError(f"--{name.replace('_', '-')} {options[name]} doesn't belong to {user.username}")
+
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+        except StatementError as e:
+            raise CommandError(f"{e} (use --format)")
+
+        # Statement dates are local dates, so store them at midnight in the user's timezone
+        profile = UserProfile.objects.filter(user=user).first()
+        started = time.monotonic()
+        try:
+            with open(options['path'], encoding=options['encoding'], errors='replace', newline='') as lines, \
+                    timezone.override(profile.timezone if profile else None):
+                result = import_file(
+                    user, lines, file_format, date_format=options['date_format'],
+                    default_budget=options['default_budget'], default_income=options['default_income'],
+                    chunk_size=options['chunk_size'], skip_duplicates=not options['keep_duplicates'],
+                )
+        except (OSError, StatementError) as e:
+            raise CommandError(str(e))
+
+        for line, error in result['errors']:
+            self.stderr.write(f"Line {line}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['transactions']} transactions and {result['income_transactions']} income transactions "
+            f"from {result['rows']} rows in {time.monotonic() - started:.1f}s "
+            f"({result['skipped']} unmatched, {result['duplicates']} duplicates, {len(result['errors'])} unreadable)."
+        ))
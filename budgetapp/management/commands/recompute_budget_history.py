@@ -1,39 +1,99 @@
-from django.core.management.base import BaseCommand
-from budgetapp.models import Budget, BudgetPeriod
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from budgetapp.models import Budget, Transaction, update_budget_aggregates
+
+
+def _init_worker():
+    # Workers may be spawned rather than forked; either way they need their own connections
+    django.setup()
+    connections.close_all()
+
+
+def recompute_budgets(budget_ids):
+    """Recompute the given budgets, one transaction each; returns the number of periods stored."""
+    total_created = 0
+    for budget in Budget.objects.filter(pk__in=budget_ids).order_by('pk'):
+        with transaction.atomic():
+            total_created += update_budget_aggregates(budget)
+    connections.close_all()
+    return total_created
+
 
 class Command(BaseCommand):
     help = 'Recompute and store historical budget period data for all budgets using BudgetPeriod model.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (budgets are sharded by user).')
+        parser.add_argument('--users', help='Comma-separated user ids or usernames to limit the recompute to.')
+        parser.add_argument('--since', help='Only budgets changed or with transactions on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--stale', action='store_true',
+                            help='Only budgets whose stored periods end before the current period (e.g. daily from cron).')
+
     def handle(self, *args, **options):
         budgets = Budget.objects.all()
+        if options['users']:
+            ids = [value for value in options['users'].split(',') if value.strip().isdigit()]
+            names = [value.strip() for value in options['users'].split(',') if not value.strip().isdigit()]
+            budgets = budgets.filter(Q(user_id__in=ids) | Q(user__username__in=names))
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+            # Local days, answered from the (budget, day) index
+            recent = Transaction.objects.filter(budget=OuterRef('pk'), day__gte=since)
+            budgets = budgets.filter(Q(updated_at__date__gte=since) | Exists(recent))
+        if options['stale']:
+            latest = budgets.annotate(latest_start=Max('periods__start_date'))
+            budgets = Budget.objects.filter(pk__in=[
+                budget.pk for budget in latest.iterator()
+                if budget.latest_start is None or budget.latest_start < budget.get_current_period_start()
+            ])
+
+        # Shard by user so one user's budgets are always handled by the same worker
+        shards = {}
+        for budget_id, user_id in budgets.order_by('user_id', 'pk').values_list('pk', 'user_id'):
+            shards.setdefault(user_id, []).append(budget_id)
+        total_budgets = sum(len(ids) for ids in shards.values())
+        if not total_budgets:
+            self.stdout.write("No budgets to recompute.")
+            return
+
+        started = time.monotonic()
+        self.done = 0
+        self.last_report = started
         total_created = 0
-        for budget in budgets:
-            # Remove old periods for a clean recompute
-            BudgetPeriod.objects.filter(budget=budget).delete()
-            # Recompute periods using the existing method
-            periods = budget.get_historical_periods(num_periods=52)
-            for period in periods:
-                try:
-                    start_date = period['start_date']
-                    if isinstance(start_date, str):
-                        start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-                    end_date = period['end_date']
-                    if isinstance(end_date, str):
-                        end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-                except Exception as e:
-                    self.stderr.write(f"Skipping period for budget {budget.id} due to date error: {e}")
-                    continue
-                BudgetPeriod.objects.create(
-                    budget=budget,
-                    start_date=start_date,
-                    end_date=end_date,
-                    budget_amount=Decimal(str(period.get('budget_amount', budget.amount))),
-                    total_spent=Decimal(str(period.get('total_spent', 0))),
-                    difference=Decimal(str(period.get('difference', 0))),
-                    is_current=period.get('is_current', False),
-                    is_over_budget=period.get('is_over_budget', False),
-                )
-                total_created += 1
-        self.stdout.write(self.style.SUCCESS(f'Recomputed and stored {total_created} budget periods for all budgets.'))
+        if options['workers'] <= 1:
+            for budget_ids in shards.values():
+                total_created += recompute_budgets(budget_ids)
+                self.report_progress(len(budget_ids), total_budgets, started)
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+                futures = {executor.submit(recompute_budgets, budget_ids): len(budget_ids) for budget_ids in shards.values()}
+                for future in as_completed(futures):
+                    total_created += future.result()
+                    self.report_progress(futures[future], total_budgets, started)
+
+        elapsed = time.monotonic() - started
+        rate = total_budgets / elapsed if elapsed else float(total_budgets)
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed and stored {total_created} budget periods for {total_budgets} budgets '
+            f'in {elapsed:.1f}s ({rate:.1f} budgets/s, {options["workers"]} worker(s)).'
+        ))
+
+    def report_progress(self, count, total, started):
+        self.done += count
+        now = time.monotonic()
+        if now - self.last_report < 1 and self.done < total:
+            return
+        self.last_report = now
+        rate = self.done / (now - started) if now > started else float(self.done)
+        eta = (total - self.done) / rate if rate else 0
+        self.stdout.write(f'{self.done}/{total} budgets ({rate:.1f} budgets/s, ETA {eta:.0f}s)')
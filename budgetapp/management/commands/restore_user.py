@@ -0,0 +1,52 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from budgetapp.backup import BackupError, read_lines, restore_records
+
+
+class Command(BaseCommand):
+    help = 'Restore a backup_user archive into an account, creating the user if needed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Backup file (- for stdin).')
+        parser.add_argument('--user', help='Username to restore into (default: the username in the backup).')
+        parser.add_argument('--replace', action='store_true', help="Delete the account's existing data first.")
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute budget periods and totals instead of restoring the stored ones.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows written per bulk insert.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            source = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        try:
+            # A user created for the restore goes away again if the restore fails
+            with source, transaction.atomic():
+                header, records = read_lines(source)
+                user = self.target_user(options['user'], header)
+                result = restore_records(records, user, rebuild=options['rebuild'], replace=options['replace'],
+                                         chunk_size=options['chunk_size'])
+        except (BackupError, OSError) as e:
+            raise CommandError(str(e))
+
+        counts = ', '.join(f'{count} {name.replace("_", " ")}' for name, count in result['counts'].items() if count)
+        skipped = f" Skipped {result['skipped']} rows whose parent was missing." if result['skipped'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {counts or 'nothing'} for {user.username} in {time.monotonic() - started:.1f}s.{skipped}"
+        ))
+
+    def target_user(self, username, header):
+        username = username or header.get('username')
+        if not username:
+            raise BackupError('The backup has no username; pass --user.')
+        user, created = User.objects.get_or_create(username=username, defaults={'email': header.get('email', '')})
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+            self.stdout.write(f"Created user {username} (no password set).")
+        return user
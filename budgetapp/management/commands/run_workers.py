@@ -0,0 +1,68 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from budgetapp.tasks import claim_aggregate_jobs, run_aggregate_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued aggregate recomputation jobs (AGGREGATE_JOB_BACKEND = "database").'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=max(getattr(settings, 'AGGREGATE_WORKERS', 2), 1),
+                            help='Number of worker threads.')
+        parser.add_argument('--batch-size', type=int, default=20, help='Jobs claimed per round trip.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Attempts before a job is marked failed.')
+        parser.add_argument('--backoff', type=int, default=30, help='Base retry delay in seconds (doubles per attempt).')
+        parser.add_argument('--lease', type=int, default=300, help='Seconds before a running job is considered abandoned.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained.')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        threads = [
+            threading.Thread(target=self.work, args=(options,), name=f'run-workers-{i}', daemon=True)
+            for i in range(options['threads'])
+        ]
+        self.stdout.write(f"Starting {len(threads)} worker thread(s).")
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after current jobs...")
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS(f"Processed {self.processed} jobs ({self.failed} failed)."))
+
+    def work(self, options):
+        try:
+            while not self.stop.is_set():
+                try:
+                    jobs = claim_aggregate_jobs(options['batch_size'], options['lease'])
+                except DatabaseError as exc:
+                    # Most likely lock contention with another worker; try again shortly
+                    self.stderr.write(f"Could not claim jobs: {exc}")
+                    jobs = None
+                if not jobs:
+                    if options['once'] and jobs is not None:
+                        return
+                    self.stop.wait(options['poll_interval'])
+                    continue
+                for job in jobs:
+                    ok = run_aggregate_job(job, options['max_attempts'], options['backoff'])
+                    with self.lock:
+                        self.processed += 1
+                        self.failed += 0 if ok else 1
+                connections.close_all()
+        finally:
+            connections.close_all()
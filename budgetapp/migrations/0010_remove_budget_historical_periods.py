@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgetapp', '0009_budgetperiod'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='budget',
+            name='historical_periods',
+        ),
+    ]
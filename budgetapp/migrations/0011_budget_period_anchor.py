@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:20
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+
+def backfill_period_anchor(apps, schema_editor):
+    Budget = apps.get_model('budgetapp', 'Budget')
+    budgets = Budget.objects.annotate(oldest=Min('transactions__date')).filter(oldest__isnull=False)
+    batch = []
+    for budget in budgets.iterator(chunk_size=500):
+        budget.period_anchor = timezone.localtime(budget.oldest).date()
+        batch.append(budget)
+        if len(batch) >= 500:
+            Budget.objects.bulk_update(batch, ['period_anchor'])
+            batch = []
+    if batch:
+        Budget.objects.bulk_update(batch, ['period_anchor'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgetapp', '0010_remove_budget_historical_periods'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='period_anchor',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_period_anchor, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_recurring_transactions(apps, schema_editor):
+    # Keep the oldest row of each (rule, date) pair; affected budgets need
+    # `manage.py recompute_budget_history` afterwards as no signals run here
+    Transaction = apps.get_model('budgetapp', 'Transaction')
+    duplicates = (
+        Transaction.objects.filter(recurring_transaction__isnull=False)
+        .values('recurring_transaction_id', 'date')
+        .annotate(count=Count('id'), keep=Min('id'))
+        .filter(count__gt=1)
+    )
+    for row in list(duplicates):
+        Transaction.objects.filter(
+            recurring_transaction_id=row['recurring_transaction_id'], date=row['date'],
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgetapp', '0012_aggregatejob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='claim_token',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(remove_duplicate_recurring_transactions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('recurring_transaction', 'date'), name='unique_recurring_transaction_date'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgetapp', '0013_recurring_uniqueness'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.CharField(max_length=255)),
+                ('match_type', models.CharField(choices=[('contains', 'Contains'), ('startswith', 'Starts with'), ('regex', 'Regular expression')], default='contains', max_length=20)),
+                ('priority', models.PositiveIntegerField(default=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('budget', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_rules', to='budgetapp.budget')),
+                ('income', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_rules', to='budgetapp.income')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['priority', 'id'],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('budget__isnull', False), ('income__isnull', True)), models.Q(('budget__isnull', True), ('income__isnull', False)), _connector='OR'), name='import_rule_single_target')],
+            },
+        ),
+    ]
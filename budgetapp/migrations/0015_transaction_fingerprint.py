@@ -0,0 +1,66 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:52
+
+import hashlib
+import re
+from decimal import Decimal
+
+import pytz
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of models.transaction_fingerprint() as it was when this migration was written
+RECURRING_SUFFIX = re.compile(r'\s*\(recurring\)\s*$')
+NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+
+
+def fingerprint(user_id, day, amount, description):
+    description = NON_ALPHANUMERIC.sub(' ', RECURRING_SUFFIX.sub('', description.lower())).strip()
+    key = f"{user_id}|{day.isoformat()}|{Decimal(amount).quantize(Decimal('0.01'))}|{description}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    # Rows were truncated to midnight in their owner's timezone, so their local
+    # dates come from the profile, as they do when rows are saved
+    UserProfile = apps.get_model('budgetapp', 'UserProfile')
+    zones = {}
+    for user_id, tzname in UserProfile.objects.values_list('user_id', 'timezone'):
+        try:
+            zones[user_id] = pytz.timezone(tzname)
+        except pytz.UnknownTimeZoneError:
+            pass
+    default = timezone.get_default_timezone()
+    for model_name in ('Transaction', 'IncomeTransaction'):
+        model = apps.get_model('budgetapp', model_name)
+        rows = model.objects.only('user_id', 'date', 'amount', 'description').order_by('pk')
+        batch = []
+        for row in rows.iterator(chunk_size=2000):
+            day = timezone.localtime(row.date, zones.get(row.user_id, default)).date()
+            row.fingerprint = fingerprint(row.user_id, day, row.amount, row.description)
+            batch.append(row)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['fingerprint'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgetapp', '0014_importrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incometransaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:09
+
+from collections import defaultdict
+
+import pytz
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+def backfill_days(apps, schema_editor):
+    # Rows were truncated to midnight in their owner's timezone, so each user's
+    # days come from their profile; every row on one day is set with one update
+    UserProfile = apps.get_model('budgetapp', 'UserProfile')
+    zones = {}
+    for user_id, tzname in UserProfile.objects.values_list('user_id', 'timezone'):
+        try:
+            zones[user_id] = pytz.timezone(tzname)
+        except pytz.UnknownTimeZoneError:
+            pass
+    default = timezone.get_default_timezone()
+    for model_name in ('Transaction', 'IncomeTransaction'):
+        model = apps.get_model('budgetapp', model_name)
+        user_ids = model.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        for user_id in user_ids:
+            tz = zones.get(user_id, default)
+            days = defaultdict(list)
+            stamps = model.objects.filter(user_id=user_id).order_by('date').values_list('date', flat=True).distinct()
+            for stamp in stamps.iterator(chunk_size=2000):
+                days[timezone.localtime(stamp, tz).date()].append(stamp)
+            for day, values in days.items():
+                for start in range(0, len(values), 500):
+                    model.objects.filter(user_id=user_id, date__in=values[start:start + 500]).update(day=day)
+
+
+def backfill_period_anchors(apps, schema_editor):
+    # 0011 took anchors from the server timezone; the oldest local day is the
+    # owner's, matching what sync_period_anchor() now stores. Fortnightly budgets
+    # whose anchor moves need `manage.py recompute_budget_history` afterwards
+    Budget = apps.get_model('budgetapp', 'Budget')
+    Transaction = apps.get_model('budgetapp', 'Transaction')
+    oldest = Transaction.objects.filter(budget=OuterRef('pk')).order_by('day').values('day')[:1]
+    Budget.objects.update(period_anchor=Subquery(oldest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgetapp', '0015_transaction_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incometransaction',
+            name='day',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='day',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_days, migrations.RunPython.noop),
+        migrations.RunPython(backfill_period_anchors, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='incometransaction',
+            name='day',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='day',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='incometransaction',
+            index=models.Index(fields=['income', 'day'], name='budgetapp_i_income__c5600e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['budget', 'day'], name='budgetapp_t_budget__943bde_idx'),
+        ),
+    ]
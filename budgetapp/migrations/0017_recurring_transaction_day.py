@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_recurring_days(apps, schema_editor):
+    # Generators in different timezones could store one occurrence at two
+    # midnights; keep the oldest row of each (rule, day) pair. Affected budgets
+    # need `manage.py recompute_budget_history` afterwards as no signals run here
+    Transaction = apps.get_model('budgetapp', 'Transaction')
+    duplicates = (
+        Transaction.objects.filter(recurring_transaction__isnull=False)
+        .values('recurring_transaction_id', 'day')
+        .annotate(count=Count('id'), keep=Min('id'))
+        .filter(count__gt=1)
+    )
+    for row in list(duplicates):
+        Transaction.objects.filter(
+            recurring_transaction_id=row['recurring_transaction_id'], day=row['day'],
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgetapp', '0016_transaction_day'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='transaction',
+            name='unique_recurring_transaction_date',
+        ),
+        migrations.RunPython(remove_duplicate_recurring_days, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('recurring_transaction', 'day'), name='unique_recurring_transaction_day'),
+        ),
+    ]
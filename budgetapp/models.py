@@ -1,14 +1,40 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Q, ExpressionWrapper
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 import json
 from django.core.serializers.json import DjangoJSONEncoder
 from datetime import timedelta, datetime, date
 from decimal import Decimal
+import hashlib
 import pytz
-from threading import Thread
+import re
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import local
+from .periods import local_day, compute_budget_periods, compute_period, next_rollover
+from .cache import bump_data_version_on_commit
+from .tasks import schedule_aggregate_job
+
+# Number of most recent periods stored as BudgetPeriod rows for each budget
+BUDGET_PERIOD_HISTORY = 52
+
+RECURRING_SUFFIX = re.compile(r'\s*\(recurring\)\s*$')
+NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_description(description):
+    """Lowercase, without the "(Recurring)" suffix generated rows get, and with punctuation folded to spaces."""
+    return NON_ALPHANUMERIC.sub(' ', RECURRING_SUFFIX.sub('', description.lower())).strip()
+
+
+def transaction_fingerprint(user_id, day, amount, description):
+    """Hash identifying "the same transaction": same user, local date, amount and normalized description."""
+    key = f"{user_id}|{day.isoformat()}|{Decimal(amount).quantize(Decimal('0.01'))}|{normalize_description(description)}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
 
 # User Profile model to store additional user settings
 class UserProfile(models.Model):
@@ -41,6 +67,8 @@ class Budget(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     avg_weekly_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Local date of the oldest transaction; periods (and fortnight parity) are counted from it
+    period_anchor = models.DateField(null=True, blank=True)
     
     class Meta:
         indexes = [
@@ -52,12 +80,28 @@ class Budget(models.Model):
     def __str__(self):
         return f"{self.category} - {self.amount} ({self.get_frequency_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored configuration so a change can trigger a rebuild
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def get_start_date(self):
         """Calculate the effective start date based on the oldest transaction"""
-        oldest_transaction = self.transactions.order_by('date').first()
-        if oldest_transaction:
-            return self.get_period_start_for_date(oldest_transaction.date.date())
-        return self.get_period_start_for_date(self.created_at.date())
+        return self.get_period_start_for_date(self._get_anchor_date())
+
+    def _get_anchor_date(self):
+        """Return the stored period anchor, or the creation date for budgets without transactions."""
+        if self.period_anchor:
+            return self.period_anchor
+        if self.created_at:
+            return local_day(self.created_at)
+        return timezone.localdate()
+
+    def _compute_anchor_date(self):
+        """Look up the local date of the oldest transaction (None if there are none)."""
+        return self.transactions.order_by('day').values_list('day', flat=True).first()
 
     def get_current_balance(self):
         """Return the balance for the current period using BudgetPeriod."""
@@ -65,7 +109,8 @@ class Budget(models.Model):
         period = self.periods.filter(start_date=period_start).first()
         if period:
             return period.budget_amount - period.total_spent
-        # fallback to calculation if missing
+        # fallback to calculation if missing, and roll the stored periods forward
+        rebucket_budget_periods(self)
         info = self.get_current_period_info(force_calc=True)
         return info['balance']
 
@@ -75,22 +120,28 @@ class Budget(models.Model):
         if not force_calc:
             period = self.periods.filter(start_date=period_start).first()
             if period:
-                return {
-                    'start_date': period.start_date,
-                    'end_date': period.end_date,
-                    'total_spent': period.total_spent,
-                    'balance': period.budget_amount - period.total_spent,
-                    'budget_amount': period.budget_amount,
-                    'base_budget': self.amount,
-                    'rollover_amount': period.budget_amount - self.amount if period.budget_amount > self.amount else 0,
-                    'difference': period.difference,
-                    'is_over_budget': period.is_over_budget,
-                    'is_current': period.is_current
-                }
+                return self._period_info(period)
+            # A new period began since the last write; roll the stored periods forward
+            rebucket_budget_periods(self)
         # fallback to calculation if missing or forced
         period = self._get_period_data(period_start)
         return period
 
+    def _period_info(self, period):
+        """Period dict for a stored BudgetPeriod."""
+        return {
+            'start_date': period.start_date,
+            'end_date': period.end_date,
+            'total_spent': period.total_spent,
+            'balance': period.budget_amount - period.total_spent,
+            'budget_amount': period.budget_amount,
+            'base_budget': self.amount,
+            'rollover_amount': period.budget_amount - self.amount if period.budget_amount > self.amount else 0,
+            'difference': period.difference,
+            'is_over_budget': period.is_over_budget,
+            'is_current': period.is_current
+        }
+
     def get_historical_periods(self, num_periods=6, use_db=True):
         """Return previous budget periods, using BudgetPeriod if available."""
         if use_db:
@@ -115,109 +166,13 @@ class Budget(models.Model):
         # fallback to calculation if missing
         return self._get_historical_periods_calc(num_periods)
 
-    def _get_historical_periods_calc(self, num_periods=6):
-        # original calculation logic
-        transactions = self.transactions.all()
-        transactions = list(transactions)
-        periods = []
-        current_period_start = self.get_current_period_start()
-        
-        # Start with current period
-        periods.append(self._get_period_data(current_period_start, transactions))
-        
-        # Add previous periods
-        for i in range(1, num_periods):
-            # Get the end date of the previous period
-            prev_period_end = self._get_previous_period_end(periods[-1]['start_date'])
-            prev_period_start = self.get_period_start_for_date(prev_period_end)
-            
-            # Stop if we reach start date
-            if prev_period_start < self.get_start_date():
-                break
-                
-            periods.append(self._get_period_data(prev_period_start, transactions))
-            
-        return periods
-        
-    def _get_previous_period_end(self, period_start):
-        # Get the day before the current period start
-        return period_start - timedelta(days=1)
-        
+    def _get_historical_periods_calc(self, num_periods=6, transactions=None, vectorized=False):
+        """Calculate the most recent periods (newest first) in a single pass over history."""
+        return compute_budget_periods(self, num_periods, transactions, vectorized=vectorized)
+
     def _get_period_data(self, period_start, transactions=None):
         """Get budget data for a specific period"""
-        period_end = self.get_period_end_for_date(period_start)
-        
-        # Get transactions in this period
-        if transactions is None:
-            transactions = self.transactions.all()
-            transactions = list(transactions)  # Evaluate queryset once
-        
-        # Convert date objects to timezone-aware datetime for proper comparison
-        period_start_dt = timezone.make_aware(datetime.combine(period_start, datetime.min.time()))
-        period_end_dt = timezone.make_aware(datetime.combine(period_end, datetime.max.time()))
-        
-        period_transactions = [t for t in transactions 
-                             if period_start_dt <= t.date <= period_end_dt]
-        
-        total_spent = sum(t.amount for t in period_transactions)
-        
-        # Calculate rollover from previous period if applicable
-        rollover_amount = 0
-        if self.rollover and period_start > self.get_start_date():
-            # Get previous period's end and start dates
-            prev_period_end = period_start - timedelta(days=1)
-            prev_period_start = self.get_period_start_for_date(prev_period_end)
-            
-            # Adjust start date if it's before start date
-            start_date = self.get_start_date()
-            if prev_period_start < start_date:
-                prev_period_start = start_date
-            
-            # Convert date objects to timezone-aware datetime for proper comparison
-            prev_period_start_dt = timezone.make_aware(datetime.combine(prev_period_start, datetime.min.time()))
-            period_start_dt = timezone.make_aware(datetime.combine(period_start, datetime.min.time()))
-            
-            # Get previous period's transactions
-            prev_transactions = [t for t in transactions 
-                               if prev_period_start_dt <= t.date < period_start_dt]
-            
-            prev_spent = sum(t.amount for t in prev_transactions)
-            
-            # Get rollover from previous period recursively
-            if prev_period_start > start_date:
-                prev_period_data = self._get_period_data(prev_period_start, transactions)
-                rollover_amount = prev_period_data['rollover_amount']
-                prev_budget_amount = self.amount + rollover_amount
-                rollover_amount = max(0, prev_budget_amount - prev_spent)
-            else:
-                # For the first period after start date, just calculate based on previous period
-                rollover_amount = max(0, self.amount - prev_spent)
-            
-            # Apply rollover_max limit if set
-            if self.rollover_max is not None:
-                rollover_amount = min(rollover_amount, self.rollover_max)
-        
-        # Calculate total budget including rollover
-        budget_amount = self.amount + rollover_amount
-        
-        # Calculate the balance
-        balance = budget_amount - total_spent
-        
-        # Determine if current period
-        is_current = (period_start == self.get_current_period_start())
-        
-        return {
-            'start_date': period_start,
-            'end_date': period_end,
-            'total_spent': total_spent,
-            'balance': balance,
-            'budget_amount': budget_amount,
-            'base_budget': self.amount,
-            'rollover_amount': rollover_amount,
-            'difference': balance,
-            'is_over_budget': balance < 0,
-            'is_current': is_current
-        }
+        return compute_period(self, period_start, transactions)
 
     def get_current_period_start(self):
         today = timezone.now().date()
@@ -230,8 +185,8 @@ class Budget(models.Model):
         elif self.frequency == 'fortnightly':
             # Get Monday of the current or previous week depending on if it's a budget week
             monday = date - timedelta(days=date.weekday())
-            # Use start_date calculated from transactions
-            reference_date = self.get_start_date()
+            # Fortnights are counted from the week of the oldest transaction
+            reference_date = self._get_anchor_date()
             reference_monday = reference_date - timedelta(days=reference_date.weekday())
             days_diff = (monday - reference_monday).days
             weeks_diff = days_diff // 7
@@ -260,55 +215,14 @@ class Budget(models.Model):
         else:  # yearly
             # Last day of the year
             return date(start_date.year, 12, 31)
-            
-    
-    def get_historical_periods(self, num_periods=6, use_db=True):
-        """Return previous budget periods, using BudgetPeriod if available."""
-        if use_db:
-            periods = list(self.periods.order_by('-start_date')[:num_periods])
-            if periods:
-                # Convert to dicts for compatibility
-                return [
-                    {
-                        'start_date': p.start_date,
-                        'end_date': p.end_date,
-                        'total_spent': p.total_spent,
-                        'balance': p.budget_amount - p.total_spent,
-                        'budget_amount': p.budget_amount,
-                        'base_budget': self.amount,
-                        'rollover_amount': p.budget_amount - self.amount if p.budget_amount > self.amount else 0,
-                        'difference': p.difference,
-                        'is_over_budget': p.is_over_budget,
-                        'is_current': p.is_current
-                    }
-                    for p in periods
-                ]
-        # fallback to calculation if missing
-        return self._get_historical_periods_calc(num_periods)
 
-    def _get_historical_periods_calc(self, num_periods=6):
-        # original calculation logic
-        transactions = self.transactions.all()
-        transactions = list(transactions)
-        periods = []
-        current_period_start = self.get_current_period_start()
-        
-        # Start with current period
-        periods.append(self._get_period_data(current_period_start, transactions))
-        
-        # Add previous periods
-        for i in range(1, num_periods):
-            # Get the end date of the previous period
-            prev_period_end = self._get_previous_period_end(periods[-1]['start_date'])
-            prev_period_start = self.get_period_start_for_date(prev_period_end)
-            
-            # Stop if we reach start date
-            if prev_period_start < self.get_start_date():
-                break
-                
-            periods.append(self._get_period_data(prev_period_start, transactions))
-            
-        return periods
+    def get_avg_weekly_spent(self, total_spent=None):
+        """Average spend per week since the budget's start date."""
+        if total_spent is None:
+            total_spent = self.transactions.aggregate(total=models.Sum('amount'))['total'] or Decimal('0')
+        days = (timezone.now().date() - self.get_start_date()).days + 1
+        weeks = Decimal(max(days, 7)) / Decimal('7')
+        return (Decimal(total_spent) / weeks).quantize(Decimal('0.01'))
 
     def get_weekly_amount(self):
         """Get the weekly equivalent of the budget amount."""
@@ -354,16 +268,17 @@ class Income(models.Model):
     def __str__(self):
         return f"{self.source} - {self.amount} ({self.get_frequency_display()})"
     
-    def get_weekly_amount(self):
+    def get_weekly_amount(self, recent_total=None):
+        """Weekly equivalent of the income; ``recent_total`` is a precomputed 60 day sum for variable income."""
         if self.frequency == 'variable':
             # For variable income, get average weekly income from recent transactions
-            recent_period = timezone.now() - timedelta(days=60)  # Last 60 days
-            income_transactions = self.income_transactions.filter(date__gte=recent_period)
-            
-            if income_transactions.exists():
-                total_income = sum(t.amount for t in income_transactions)
+            if recent_total is None:
+                recent_period = timezone.localdate() - timedelta(days=60)  # Last 60 days
+                recent_total = self.income_transactions.filter(day__gt=recent_period).aggregate(
+                    total=models.Sum('amount'))['total']
+            if recent_total is not None:
                 weeks = Decimal('8.57')  # Approximately 60/7 weeks
-                return total_income / weeks
+                return recent_total / weeks
             # Fall back to the expected amount if no transactions yet
             return self.amount
         elif self.frequency == 'weekly':
@@ -375,18 +290,16 @@ class Income(models.Model):
         else:  # yearly
             return self.amount / Decimal('52')
 
-    def get_current_period_actual_income(self):
-        """Get actual income for current budget period"""
-        if not self.is_variable:
-            return self.amount
-            
-        # Determine period dates based on frequency
-        today = timezone.now().date()
-        if self.frequency == 'weekly':
+    @staticmethod
+    def get_period_bounds(frequency, today=None):
+        """Return (start, end) dates of the current income period for a frequency."""
+        if today is None:
+            today = timezone.now().date()
+        if frequency == 'weekly':
             # Start of week (Monday)
             period_start = today - timedelta(days=today.weekday())
             period_end = period_start + timedelta(days=6)
-        elif self.frequency == 'fortnightly':
+        elif frequency == 'fortnightly':
             # Start of week
             period_start = today - timedelta(days=today.weekday())
             # Determine if this is week 1 or 2 of the fortnight
@@ -394,7 +307,7 @@ class Income(models.Model):
             if (period_start.isocalendar()[1] % 2) == 0:
                 period_start -= timedelta(days=7)
             period_end = period_start + timedelta(days=13)
-        elif self.frequency == 'monthly':
+        elif frequency == 'monthly':
             # Start of month
             period_start = today.replace(day=1)
             # End of month
@@ -406,17 +319,33 @@ class Income(models.Model):
             # Start of year
             period_start = today.replace(month=1, day=1)
             period_end = today.replace(month=12, day=31)
-            
-        # Get transactions in this period
-        income_in_period = self.income_transactions.filter(
-            date__gte=timezone.make_aware(datetime.combine(period_start, datetime.min.time())),
-            date__lte=timezone.make_aware(datetime.combine(period_end, datetime.min.time()))
-        )
-        
+        return period_start, period_end
+
+    @classmethod
+    def current_period_filter(cls):
+        """Q selecting each income's transactions in its current period, for filtered aggregates over incomes."""
+        condition = Q(pk__in=[])
+        for frequency, _ in cls.FREQUENCY_CHOICES:
+            period_start, period_end = cls.get_period_bounds(frequency)
+            condition |= Q(
+                frequency=frequency,
+                income_transactions__day__gte=period_start,
+                income_transactions__day__lte=period_end,
+            )
+        return condition
+
+    def get_current_period_actual_income(self, period_total=None):
+        """Get actual income for current budget period; ``period_total`` may be precomputed."""
+        if not self.is_variable:
+            return self.amount
+        if period_total is None:
+            period_start, period_end = self.get_period_bounds(self.frequency)
+            # Get transactions in this period
+            period_total = self.income_transactions.filter(
+                day__gte=period_start, day__lte=period_end,
+            ).aggregate(total=models.Sum('amount'))['total']
         # Return the sum of actual income
-        if income_in_period.exists():
-            return sum(t.amount for t in income_in_period)
-        return Decimal('0')
+        return period_total if period_total is not None else Decimal('0')
 
 class IncomeTransaction(models.Model):
     """Model for tracking actual income received"""
@@ -425,15 +354,21 @@ class IncomeTransaction(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.CharField(max_length=255)
     date = models.DateTimeField(default=timezone.now, db_index=True)
+    day = models.DateField(editable=False)
+    fingerprint = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
     
     class Meta:
         indexes = [
             models.Index(fields=['user', 'date']),
             models.Index(fields=['income', 'date']),
+            models.Index(fields=['income', 'day']),
         ]
 
     def __str__(self):
         return f"{self.description} - ${self.amount} ({self.date.date()})"
+
+    def compute_fingerprint(self):
+        return transaction_fingerprint(self.user_id, self.day, self.amount, self.description)
     
     def save(self, *args, **kwargs):
         # If date is being set for the first time, use start of day
@@ -442,6 +377,8 @@ class IncomeTransaction(models.Model):
             self.date = timezone.make_aware(
                 datetime.combine(self.date.date(), datetime.min.time())
             )
+        self.day = local_day(self.date)
+        self.fingerprint = self.compute_fingerprint()
         super().save(*args, **kwargs)
 
 class Transaction(models.Model):
@@ -451,15 +388,34 @@ class Transaction(models.Model):
     description = models.CharField(max_length=255)
     date = models.DateTimeField(default=timezone.now, db_index=True)
     recurring_transaction = models.ForeignKey('RecurringTransaction', on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions', db_index=True)
+    # Local calendar day of date, for date-only range scans, and its transaction_fingerprint();
+    # both set on save, and by set_derived_fields() before bulk_create
+    day = models.DateField(editable=False)
+    fingerprint = models.CharField(max_length=32, blank=True, db_index=True, editable=False)
     
     class Meta:
         indexes = [
             models.Index(fields=['user', 'date']),
             models.Index(fields=['budget', 'date']),
+            models.Index(fields=['budget', 'day']),
+        ]
+        constraints = [
+            # A recurring rule generates at most one transaction per date, however many workers run it
+            models.UniqueConstraint(fields=['recurring_transaction', 'day'], name='unique_recurring_transaction_day'),
         ]
 
     def __str__(self):
         return f"{self.description} - ${self.amount} ({self.date.date()})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so signal handlers can tell what moved
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def compute_fingerprint(self):
+        return transaction_fingerprint(self.user_id, self.day, self.amount, self.description)
         
     def save(self, *args, **kwargs):
         # If date is being set for the first time, use start of day
@@ -468,6 +424,8 @@ class Transaction(models.Model):
             self.date = timezone.make_aware(
                 datetime.combine(self.date.date(), datetime.min.time())
             )
+        self.day = local_day(self.date)
+        self.fingerprint = self.compute_fingerprint()
         super().save(*args, **kwargs)
 
 class RecurringTransaction(models.Model):
@@ -488,6 +446,9 @@ class RecurringTransaction(models.Model):
     end_date = models.DateField(null=True, blank=True, db_index=True)
     last_generated = models.DateField(null=True, blank=True)
     active = models.BooleanField(default=True, db_index=True)
+    # Set while a generate_recurring worker holds the rule
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         indexes = [
@@ -500,54 +461,9 @@ class RecurringTransaction(models.Model):
         return f"{self.budget.category}: {self.amount} - {self.description} ({self.get_frequency_display()})"
         
     def generate_transactions(self):
-        if not self.active:
-            return []
-            
-        today = date.today()
-        if self.end_date and today > self.end_date:
-            self.active = False
-            self.save()
-            return []
-            
-        created_transactions = []
-        next_date = self.start_date if not self.last_generated else self._get_next_date(self.last_generated)
-        
-        # Generate transactions up to today
-        while next_date <= today:
-            # Check if transaction already exists for this date
-            transaction_date = timezone.make_aware(datetime.combine(next_date, datetime.min.time()))
-            existing_transaction = Transaction.objects.filter(
-                user=self.user,
-                budget=self.budget,
-                recurring_transaction=self,
-                date=transaction_date
-            ).exists()
-            
-            if not existing_transaction:
-                # Create the transaction only if it doesn't exist
-                transaction = Transaction(
-                    user=self.user,
-                    budget=self.budget,
-                    amount=self.amount,
-                    description=f"{self.description} (Recurring)",
-                    date=transaction_date,
-                    recurring_transaction=self
-                )
-                transaction.save()
-                created_transactions.append(transaction)
-            
-            # Update last generated date regardless of whether we created a new transaction
-            self.last_generated = next_date
-            self.save()
-            
-            # Calculate next date
-            next_date = self._get_next_date(next_date)
-            
-            # Stop if reached end date
-            if self.end_date and next_date > self.end_date:
-                break
-                
-        return created_transactions
+        """Create this rule's missing transactions up to today; see ``budgetapp.recurring``."""
+        from .recurring import generate_for_rules
+        return generate_for_rules([self])
         
     def _get_next_date(self, from_date):
         if self.frequency == 'daily':
@@ -577,52 +493,275 @@ class RecurringTransaction(models.Model):
         elif self.frequency == 'yearly':
             return from_date.replace(year=from_date.year + 1)
 
+def get_current_period_infos(budgets):
+    """Map budget id to its current period info in a fixed number of queries, healing stale budgets."""
+    starts = {budget.pk: budget.get_current_period_start() for budget in budgets}
+    if not starts:
+        return {}
+    candidates = BudgetPeriod.objects.filter(budget_id__in=starts, start_date__in=set(starts.values()))
+    # Budgets share only a handful of distinct start dates, so the few extra rows are cheap to discard
+    stored = {period.budget_id: period for period in candidates if starts[period.budget_id] == period.start_date}
+    infos = {budget.pk: budget._period_info(stored[budget.pk]) for budget in budgets if budget.pk in stored}
+    stale = [budget for budget in budgets if budget.pk not in stored]
+    if stale:
+        # Rows not built yet, or a new period has begun since the last write: calculate
+        # from one query for all of them, and rebuild their rows so later reads hit
+        transactions = defaultdict(list)
+        for t in Transaction.objects.filter(budget_id__in=[budget.pk for budget in stale]).only('budget', 'day', 'amount'):
+            transactions[t.budget_id].append(t)
+        for budget in stale:
+            infos[budget.pk] = budget._get_period_data(starts[budget.pk], transactions[budget.pk])
+            rebucket_budget_periods(budget)
+    return infos
+
+def _lock_budget(budget):
+    # apply_transaction_delta() takes the same lock, so a delta can't land between
+    # a rebuild reading the transactions and writing its totals
+    Budget.objects.select_for_update().only('pk').get(pk=budget.pk)
+
+def rebuild_budget_periods(budget, transactions=None):
+    """
+    Replace every stored BudgetPeriod for a budget with a fresh calculation.
+
+    Callers passing ``transactions`` must have read them under ``_lock_budget``
+    in the current transaction.
+    """
+    with db_transaction.atomic():
+        if transactions is None:
+            _lock_budget(budget)
+            transactions = list(budget.transactions.only('budget', 'day', 'amount'))
+        periods = budget._get_historical_periods_calc(
+            num_periods=BUDGET_PERIOD_HISTORY, transactions=transactions, vectorized=True
+        )
+        BudgetPeriod.objects.filter(budget=budget).delete()
+        BudgetPeriod.objects.bulk_create([
+            BudgetPeriod(
+                budget=budget,
+                start_date=period['start_date'],
+                end_date=period['end_date'],
+                budget_amount=period['budget_amount'],
+                total_spent=period['total_spent'],
+                difference=period['difference'],
+                is_current=period['is_current'],
+                is_over_budget=period['is_over_budget'],
+            )
+            for period in periods
+        ])
+    return len(periods)
+
 def update_budget_aggregates(budget):
-    transactions = budget.transactions.all()
-    total_spent = sum(t.amount for t in transactions)
-    avg_weekly_spent = budget.get_avg_weekly_spent()
-    budget.total_spent = total_spent
-    budget.avg_weekly_spent = avg_weekly_spent
-    budget.save(update_fields=["total_spent", "avg_weekly_spent"])
-    # Update BudgetPeriod records
-    from .models import BudgetPeriod
-    # Remove old periods for this budget
-    BudgetPeriod.objects.filter(budget=budget).delete()
-    # Recompute and store up to 52 periods
-    periods = budget.get_historical_periods(num_periods=52)
-    for period in periods:
-        BudgetPeriod.objects.create(
-            budget=budget,
-            start_date=period['start_date'],
-            end_date=period['end_date'],
-            budget_amount=period['budget_amount'],
-            total_spent=period['total_spent'],
-            difference=period['difference'],
-            is_current=period['is_current'],
-            is_over_budget=period['is_over_budget'],
+    """Recompute a budget's totals and rebuild all of its stored periods."""
+    with db_transaction.atomic():
+        _lock_budget(budget)
+        transactions = list(budget.transactions.only('budget', 'day', 'amount'))
+        sync_period_anchor(budget, transactions)
+        total_spent = sum(t.amount for t in transactions)
+        avg_weekly_spent = budget.get_avg_weekly_spent(total_spent)
+        budget.total_spent = total_spent
+        budget.avg_weekly_spent = avg_weekly_spent
+        budget.save(update_fields=["total_spent", "avg_weekly_spent"])
+        created = rebuild_budget_periods(budget, transactions)
+    # Pages cached while the rebuild ran may hold the old periods
+    bump_data_version_on_commit(budget.user_id)
+    return created
+
+def apply_transaction_delta(budget, day, delta):
+    """
+    Apply a change of ``delta`` spent on ``day`` to a budget's stored aggregates.
+
+    Only the period containing ``day`` is updated, plus (for rollover budgets)
+    the later periods whose carried-over amount actually changes. Falls back
+    to a full rebuild when the stored periods are missing or no longer end at
+    the current period.
+    """
+    if not delta:
+        return
+    period_start = budget.get_period_start_for_date(day)
+    current_start = budget.get_current_period_start()
+    with db_transaction.atomic():
+        locked = Budget.objects.select_for_update().only('total_spent').get(pk=budget.pk)
+        budget.total_spent = locked.total_spent + delta
+        budget.avg_weekly_spent = budget.get_avg_weekly_spent(budget.total_spent)
+        Budget.objects.filter(pk=budget.pk).update(total_spent=budget.total_spent, avg_weekly_spent=budget.avg_weekly_spent)
+
+        if period_start > current_start:
+            # Future-dated spending isn't part of the stored history yet
+            return
+        periods = BudgetPeriod.objects.filter(budget=budget)
+        latest_start = periods.order_by('-start_date').values_list('start_date', flat=True).first()
+        if latest_start != current_start:
+            # A new period has started (or nothing is stored yet)
+            rebucket_budget_periods(budget)
+            return
+
+        updated = periods.filter(start_date=period_start).update(
+            total_spent=F('total_spent') + delta,
+            difference=F('difference') - delta,
+            is_over_budget=ExpressionWrapper(Q(difference__lt=delta), output_field=models.BooleanField()),
         )
+        if not updated:
+            if budget.rollover or periods.filter(start_date__lt=period_start).exists():
+                # Older than the stored window but still carried into it, or a gap
+                rebucket_budget_periods(budget)
+            return
+        if budget.rollover:
+            _propagate_rollover(budget, periods.select_for_update().filter(start_date__gte=period_start).order_by('start_date'))
+
+def _propagate_rollover(budget, periods):
+    """Recompute carried-over amounts forward until they stop changing."""
+    changed = []
+    previous = None
+    for period in periods:
+        if previous is not None:
+            budget_amount = budget.amount + next_rollover(budget, previous.budget_amount, previous.total_spent)
+            if budget_amount == period.budget_amount:
+                break
+            period.budget_amount = budget_amount
+            period.difference = budget_amount - period.total_spent
+            period.is_over_budget = period.difference < 0
+            changed.append(period)
+        previous = period
+    if changed:
+        BudgetPeriod.objects.bulk_update(changed, ['budget_amount', 'difference', 'is_over_budget'])
+
+def refresh_budget_aggregates(budget_id):
+    """Background job: recompute a budget's aggregates if it still exists."""
+    budget = Budget.objects.filter(pk=budget_id).first()
+    if budget is not None:
+        update_budget_aggregates(budget)
 
 def update_budget_aggregates_async(budget):
-    Thread(target=update_budget_aggregates, args=(budget,)).start()
+    if not _defer_refresh('budget', budget.pk):
+        schedule_aggregate_job('budget', budget.pk, refresh_budget_aggregates)
+
+def update_period_anchor(budget, added_day=None, removed_day=None):
+    """
+    Keep budget.period_anchor in step with the budget's oldest transaction.
+
+    Adding an older transaction moves the anchor without a query; removing the
+    transaction on the anchor date looks the new oldest date up. Returns True
+    when the anchor moved, in which case every period boundary may have shifted
+    and the caller must re-bucket the budget's history.
+    """
+    anchor = budget.period_anchor
+    if added_day is not None and (anchor is None or added_day < anchor):
+        new_anchor = added_day
+    elif removed_day is not None and anchor is not None and removed_day <= anchor:
+        new_anchor = budget._compute_anchor_date()
+    else:
+        return False
+    if new_anchor == anchor:
+        return False
+    Budget.objects.filter(pk=budget.pk).update(period_anchor=new_anchor)
+    budget.period_anchor = new_anchor
+    return True
+
+def sync_period_anchor(budget, transactions=None):
+    """Recompute budget.period_anchor from scratch; returns True if it changed."""
+    if transactions is None:
+        anchor = budget._compute_anchor_date()
+    else:
+        anchor = min((t.day for t in transactions), default=None)
+    if anchor == budget.period_anchor:
+        return False
+    Budget.objects.filter(pk=budget.pk).update(period_anchor=anchor)
+    budget.period_anchor = anchor
+    return True
+
+def rebucket_budget_periods(budget):
+    """Rebuild all stored periods after the budget's period boundaries changed."""
+    update_budget_aggregates_async(budget)
+
+# Budgets whose cascade delete is in progress; their transactions need no upkeep
+_deleting = local()
+
+def _budgets_being_deleted():
+    if not hasattr(_deleting, 'budget_ids'):
+        _deleting.budget_ids = set()
+    return _deleting.budget_ids
+
+def _loaded_transaction_values(instance):
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    return loaded.get('budget_id'), loaded.get('day'), loaded.get('amount')
+
+def _remove_from_budget(budget, day, amount):
+    if update_period_anchor(budget, removed_day=day):
+        rebucket_budget_periods(budget)
+    else:
+        apply_transaction_delta(budget, day, -amount)
 
 # Signals for Transaction
 @receiver(post_save, sender='budgetapp.Transaction')
-def transaction_post_save(sender, instance, **kwargs):
-    update_budget_aggregates_async(instance.budget)
+def transaction_post_save(sender, instance, created, **kwargs):
+    old_budget_id, old_day, old_amount = (None, None, None) if created else _loaded_transaction_values(instance)
+    if _defer_refresh('budget', instance.budget_id):
+        if old_budget_id is not None and old_budget_id != instance.budget_id:
+            _defer_refresh('budget', old_budget_id)
+        instance._loaded_values = {'budget_id': instance.budget_id, 'day': instance.day, 'amount': instance.amount}
+        return
+    budget = instance.budget
+    new_day = instance.day
+    if old_day is None or old_amount is None:
+        if not created:
+            # Nothing to diff against; recompute from scratch
+            update_budget_aggregates_async(budget)
+        elif update_period_anchor(budget, added_day=new_day):
+            rebucket_budget_periods(budget)
+        else:
+            apply_transaction_delta(budget, new_day, instance.amount)
+    elif old_budget_id != instance.budget_id:
+        # Moved to another budget: the old budget loses the transaction
+        old_budget = Budget.objects.filter(pk=old_budget_id).first()
+        if old_budget:
+            _remove_from_budget(old_budget, old_day, old_amount)
+        if update_period_anchor(budget, added_day=new_day):
+            rebucket_budget_periods(budget)
+        else:
+            apply_transaction_delta(budget, new_day, instance.amount)
+    else:
+        if update_period_anchor(budget, added_day=new_day, removed_day=old_day if old_day != new_day else None):
+            rebucket_budget_periods(budget)
+        elif old_day == new_day:
+            apply_transaction_delta(budget, new_day, instance.amount - old_amount)
+        else:
+            apply_transaction_delta(budget, old_day, -old_amount)
+            apply_transaction_delta(budget, new_day, instance.amount)
+    instance._loaded_values = {'budget_id': instance.budget_id, 'day': instance.day, 'amount': instance.amount}
 
 @receiver(post_delete, sender='budgetapp.Transaction')
 def transaction_post_delete(sender, instance, **kwargs):
-    update_budget_aggregates_async(instance.budget)
+    if instance.budget_id in _budgets_being_deleted() or _defer_refresh('budget', instance.budget_id):
+        return
+    _remove_from_budget(instance.budget, instance.day, instance.amount)
+
+# Budget configuration changes move every period, so they trigger a full rebuild
+BUDGET_PERIOD_FIELDS = ('amount', 'frequency', 'rollover', 'rollover_max')
+
+@receiver(post_save, sender='budgetapp.Budget')
+def budget_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(BUDGET_PERIOD_FIELDS):
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if not created and loaded is not None:
+        if any(loaded.get(field) != getattr(instance, field) for field in BUDGET_PERIOD_FIELDS):
+            rebucket_budget_periods(instance)
+    instance._loaded_values = {field: getattr(instance, field) for field in BUDGET_PERIOD_FIELDS}
+
+@receiver(pre_delete, sender='budgetapp.Budget')
+def budget_pre_delete(sender, instance, **kwargs):
+    _budgets_being_deleted().add(instance.pk)
+
+@receiver(post_delete, sender='budgetapp.Budget')
+def budget_post_delete(sender, instance, **kwargs):
+    _budgets_being_deleted().discard(instance.pk)
 
 def update_income_aggregates(income):
     """Update precomputed fields for an Income instance."""
     transactions = income.income_transactions.all()
     total_income = sum(t.amount for t in transactions)
-    now = timezone.now()
-    last_30_days = now - timedelta(days=30)
-    last_90_days = now - timedelta(days=90)
-    transactions_30d = transactions.filter(date__gte=last_30_days)
-    transactions_90d = transactions.filter(date__gte=last_90_days)
+    today = timezone.localdate()
+    transactions_30d = transactions.filter(day__gt=today - timedelta(days=30))
+    transactions_90d = transactions.filter(day__gt=today - timedelta(days=90))
     avg_30d = sum(t.amount for t in transactions_30d) / Decimal('30') * Decimal('7') if transactions_30d else Decimal('0')
     avg_90d = sum(t.amount for t in transactions_90d) / Decimal('90') * Decimal('7') if transactions_90d else Decimal('0')
     income.total_income = total_income
@@ -630,8 +769,95 @@ def update_income_aggregates(income):
     income.avg_90d = avg_90d
     income.save(update_fields=["total_income", "avg_30d", "avg_90d"])
 
+def refresh_income_aggregates(income_id):
+    """Background job: recompute an income's aggregates if it still exists."""
+    income = Income.objects.filter(pk=income_id).first()
+    if income is not None:
+        update_income_aggregates(income)
+
 def update_income_aggregates_async(income):
-    Thread(target=update_income_aggregates, args=(income,)).start()
+    if not _defer_refresh('income', income.pk):
+        schedule_aggregate_job('income', income.pk, refresh_income_aggregates)
+
+# Refreshes requested inside deferred_aggregates(), per thread
+_deferred = local()
+
+def _defer_refresh(kind, target_id):
+    pending = getattr(_deferred, 'pending', None)
+    if pending is None:
+        return False
+    pending[kind].add(target_id)
+    return True
+
+@contextmanager
+def deferred_aggregates():
+    """
+    Refresh each touched budget and income once, after the block, instead of per row.
+
+    Inside the block, transaction signals skip their incremental updates, and
+    aggregate refreshes and data version bumps are only recorded. Yields the
+    pending ``{'budget': ids, 'income': ids, 'user': ids}`` sets so that code
+    using ``bulk_create`` (which sends no signals) can add the targets it
+    touched. On success each target gets one refresh job, and each user one
+    version bump, when the surrounding transaction commits.
+    """
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        # Nested: the outermost block does the refreshing
+        yield pending
+        return
+    pending = _deferred.pending = {'budget': set(), 'income': set(), 'user': set()}
+    try:
+        yield pending
+    finally:
+        _deferred.pending = None
+    for budget_id in sorted(pending['budget']):
+        schedule_aggregate_job('budget', budget_id, refresh_budget_aggregates)
+    for income_id in sorted(pending['income']):
+        schedule_aggregate_job('income', income_id, refresh_income_aggregates)
+    for user_id in sorted(pending['user']):
+        bump_data_version_on_commit(user_id)
+
+def set_derived_fields(objects):
+    """Fill in ``day`` and ``fingerprint`` on unsaved transactions, which ``bulk_create`` won't do; returns them."""
+    for obj in objects:
+        obj.day = local_day(obj.date)
+        obj.fingerprint = obj.compute_fingerprint()
+    return objects
+
+class DuplicateFilter:
+    """
+    Drops new ``Transaction`` or ``IncomeTransaction`` objects that are already stored.
+
+    Call it with each batch before ``bulk_create``. Every stored row cancels
+    out one incoming object with the same fingerprint, so re-importing an
+    overlapping statement skips the overlap while two identical purchases on
+    one day in new data are both kept. Stored counts are fetched with one
+    query per batch, and only for fingerprints this filter hasn't seen, so
+    rows it let through earlier aren't mistaken for existing ones.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.remaining = Counter()
+        self.checked = set()
+
+    def __call__(self, objects):
+        set_derived_fields(objects)
+        unchecked = {obj.fingerprint for obj in objects} - self.checked
+        if unchecked:
+            self.remaining.update(dict(
+                self.model.objects.filter(fingerprint__in=unchecked).order_by()
+                .values('fingerprint').annotate(count=Count('id')).values_list('fingerprint', 'count')
+            ))
+            self.checked |= unchecked
+        kept = []
+        for obj in objects:
+            if self.remaining[obj.fingerprint]:
+                self.remaining[obj.fingerprint] -= 1
+            else:
+                kept.append(obj)
+        return kept
 
 # Signals for IncomeTransaction
 @receiver(post_save, sender='budgetapp.IncomeTransaction')
@@ -642,6 +868,15 @@ def incometransaction_post_save(sender, instance, **kwargs):
 def incometransaction_post_delete(sender, instance, **kwargs):
     update_income_aggregates_async(instance.income)
 
+# Cached pages are keyed by their owner's data version; any change moves it on
+def bump_owner_data_version(sender, instance, **kwargs):
+    if not _defer_refresh('user', instance.user_id):
+        bump_data_version_on_commit(instance.user_id)
+
+for _model in ('Budget', 'Income', 'Transaction', 'IncomeTransaction', 'RecurringTransaction', 'UserProfile'):
+    post_save.connect(bump_owner_data_version, sender=f'budgetapp.{_model}', dispatch_uid=f'data_version_save_{_model}')
+    post_delete.connect(bump_owner_data_version, sender=f'budgetapp.{_model}', dispatch_uid=f'data_version_delete_{_model}')
+
 class BudgetPeriod(models.Model):
     budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name='periods')
     start_date = models.DateField()
@@ -660,3 +895,68 @@ class BudgetPeriod(models.Model):
 
     def __str__(self):
         return f"{self.budget.category} {self.start_date} - {self.end_date}"
+
+
+class AggregateJob(models.Model):
+    """Durable request to recompute aggregates, processed by `manage.py run_workers`."""
+    KIND_CHOICES = [
+        ('budget', 'Budget'),
+        ('income', 'Income'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    target_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    timezone = models.CharField(max_length=50, default='UTC')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        constraints = [
+            # At most one waiting job per target; duplicates collapse into it
+            models.UniqueConstraint(fields=['kind', 'target_id'], condition=Q(status='pending'), name='unique_pending_aggregate_job'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.target_id} ({self.status})"
+
+
+class ImportRule(models.Model):
+    """Maps imported statement lines whose description matches ``pattern`` to a budget or income source."""
+    MATCH_CHOICES = [
+        ('contains', 'Contains'),
+        ('startswith', 'Starts with'),
+        ('regex', 'Regular expression'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_rules', db_index=True)
+    pattern = models.CharField(max_length=255)
+    match_type = models.CharField(max_length=20, choices=MATCH_CHOICES, default='contains')
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, null=True, blank=True, related_name='import_rules')
+    income = models.ForeignKey(Income, on_delete=models.CASCADE, null=True, blank=True, related_name='import_rules')
+    # Lower numbers are tried first
+    priority = models.PositiveIntegerField(default=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['priority', 'id']
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(budget__isnull=False, income__isnull=True) | Q(budget__isnull=True, income__isnull=False),
+                name='import_rule_single_target',
+            ),
+        ]
+
+    def __str__(self):
+        target = self.budget.category if self.budget_id else self.income.source
+        return f"{self.get_match_type_display()} '{self.pattern}' -> {target}"
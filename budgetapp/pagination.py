@@ -0,0 +1,117 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are found by filtering on the ordering columns of the row at the edge
+of the previous page rather than with OFFSET, so every page costs one
+indexed range scan of ``per_page + 1`` rows and no ``COUNT(*)``. Cursors
+are opaque URL-safe strings holding those column values.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering``, e.g. ``('-date', '-id')``.
+
+    The ordering must be unique (end it with the primary key) and should
+    match an index, e.g. ``budget, date`` for a budget's transactions.
+    """
+
+    def __init__(self, queryset, ordering, per_page=10):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+        self.model_fields = [queryset.model._meta.get_field(name) for name, _ in self.fields]
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field in self.model_fields]
+        return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if len(values) != len(self.model_fields):
+                raise InvalidCursor(cursor)
+            return [field.to_python(value) for field, value in zip(self.model_fields, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidCursor(cursor)
+
+    def _seek(self, values, forward):
+        # (a, b) after (x, y)  ==  a > x OR (a = x AND b > y), with > flipped for descending columns
+        condition = Q()
+        for i in reversed(range(len(self.fields))):
+            name, descending = self.fields[i]
+            lookup = 'lt' if descending == forward else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            if condition:
+                step |= Q(**{name: values[i]}) & condition
+            condition = step
+        return self.queryset.filter(condition)
+
+    def page(self, after=None, before=None):
+        """
+        The first page, the page following cursor ``after``, or the page
+        preceding cursor ``before``. Raises InvalidCursor for bad cursors.
+        """
+        if before:
+            reverse = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering)
+            rows = list(self._seek(self.decode_cursor(before), forward=False).order_by(*reverse)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_previous, has_next = more, True
+        else:
+            queryset = self._seek(self.decode_cursor(after), forward=True) if after else self.queryset
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = bool(after)
+        if not rows:
+            return KeysetPage([], None, None)
+        return KeysetPage(
+            rows,
+            self.encode_cursor(rows[-1]) if has_next else None,
+            self.encode_cursor(rows[0]) if has_previous else None,
+        )
+
+    def page_from_request(self, request, prefix):
+        """The page named by ``<prefix>_after`` / ``<prefix>_before`` in the query string (first page if invalid)."""
+        try:
+            return self.page(after=request.GET.get(f'{prefix}_after'), before=request.GET.get(f'{prefix}_before'))
+        except InvalidCursor:
+            return self.page()
@@ -0,0 +1,222 @@
+"""
+Budget period engine.
+
+Walks a budget's history forward from its start date in a single pass,
+bucketing transactions into periods and carrying the rollover balance from
+one period to the next. The period dicts produced here are the same shape
+used by ``Budget.get_historical_periods``, ``update_budget_aggregates`` and
+the management commands.
+
+When NumPy is installed, bulk rebuilds can use ``vectorized_budget_periods``
+instead: it works on integer cents and day numbers, groups spending by
+period index and chains rollovers with a cumulative scan, producing exactly
+the same figures.
+"""
+from collections import deque
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python engine is used instead
+    np = None
+
+
+def local_day(value):
+    """Return the calendar date of an aware datetime in the active timezone."""
+    return timezone.localtime(value).date()
+
+
+def _day_amounts(transactions):
+    """Return (day, amount) pairs for transactions, sorted by day."""
+    return sorted((t.day, t.amount) for t in transactions)
+
+
+def _period_dict(budget, period_start, period_end, total_spent, rollover_amount, current_start):
+    budget_amount = budget.amount + rollover_amount
+    balance = budget_amount - total_spent
+    return {
+        'start_date': period_start,
+        'end_date': period_end,
+        'total_spent': total_spent,
+        'balance': balance,
+        'budget_amount': budget_amount,
+        'base_budget': budget.amount,
+        'rollover_amount': rollover_amount,
+        'difference': balance,
+        'is_over_budget': balance < 0,
+        'is_current': period_start == current_start,
+    }
+
+
+def next_rollover(budget, budget_amount, total_spent):
+    """Return the rollover carried into the period after one with these figures."""
+    if not budget.rollover:
+        return 0
+    rollover_amount = max(0, budget_amount - total_spent)
+    if budget.rollover_max is not None:
+        rollover_amount = min(rollover_amount, budget.rollover_max)
+    return rollover_amount
+
+
+def iter_budget_periods(budget, transactions, until=None):
+    """
+    Yield period dicts for a budget in chronological order.
+
+    Starts at ``budget.get_start_date()`` and stops after the period that
+    begins at ``until`` (the current period by default). Transactions are
+    sorted once and consumed with a single cursor, so the cost is linear in
+    the number of periods plus the number of transactions.
+    """
+    start_date = budget.get_start_date()
+    current_start = budget.get_current_period_start()
+    if until is None:
+        until = current_start
+    entries = _day_amounts(transactions)
+    count = len(entries)
+
+    if until < start_date:
+        # Before any history exists there is nothing to roll over
+        period_end = budget.get_period_end_for_date(until)
+        total_spent = sum(amount for day, amount in entries if until <= day <= period_end)
+        yield _period_dict(budget, until, period_end, total_spent, 0, current_start)
+        return
+
+    index = 0
+    rollover_amount = 0
+    period_start = start_date
+    while period_start <= until:
+        period_end = budget.get_period_end_for_date(period_start)
+        while index < count and entries[index][0] < period_start:
+            index += 1
+        total_spent = 0
+        while index < count and entries[index][0] <= period_end:
+            total_spent += entries[index][1]
+            index += 1
+        period = _period_dict(budget, period_start, period_end, total_spent, rollover_amount, current_start)
+        yield period
+        rollover_amount = next_rollover(budget, period['budget_amount'], total_spent)
+        period_start = period_end + timedelta(days=1)
+
+
+def compute_budget_periods(budget, num_periods=52, transactions=None, vectorized=False):
+    """
+    Return up to ``num_periods`` period dicts, newest first, ending at the current period.
+
+    ``vectorized=True`` uses the NumPy engine when it is available.
+    """
+    if transactions is None:
+        transactions = budget.transactions.only('budget', 'day', 'amount')
+    if vectorized and np is not None:
+        periods = vectorized_budget_periods(budget, num_periods, transactions)
+        if periods is not None:
+            return periods
+    return list(reversed(deque(iter_budget_periods(budget, transactions), maxlen=num_periods)))
+
+
+def compute_period(budget, period_start, transactions=None):
+    """Return the period dict for the period beginning at ``period_start``."""
+    if transactions is None:
+        transactions = budget.transactions.only('budget', 'day', 'amount')
+    period = None
+    for period in iter_budget_periods(budget, transactions, until=period_start):
+        pass
+    return period
+
+
+# Vectorized engine
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _to_cents(value):
+    return int(Decimal(value).scaleb(2))
+
+
+def _from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _period_numbers(budget, days):
+    """Map datetime64[D] days to a running period number for the budget's frequency."""
+    if budget.frequency == 'weekly':
+        return days.astype(np.int64) // 7  # 1970-01-01 was a Thursday; offset applied by caller
+    if budget.frequency == 'fortnightly':
+        return days.astype(np.int64) // 14
+    if budget.frequency == 'monthly':
+        return days.astype('datetime64[M]').astype(np.int64)
+    return days.astype('datetime64[Y]').astype(np.int64)
+
+
+def _period_start_days(budget, numbers, offset):
+    """Inverse of ``_period_numbers``: the first day of each period number."""
+    if budget.frequency == 'weekly':
+        return (numbers * 7 + offset).astype('datetime64[D]')
+    if budget.frequency == 'fortnightly':
+        return (numbers * 14 + offset).astype('datetime64[D]')
+    if budget.frequency == 'monthly':
+        return numbers.astype('datetime64[M]').astype('datetime64[D]')
+    return numbers.astype('datetime64[Y]').astype('datetime64[D]')
+
+
+def vectorized_budget_periods(budget, num_periods, transactions):
+    """
+    NumPy equivalent of ``compute_budget_periods``.
+
+    Returns None for the cases it doesn't handle (a current period before
+    the budget's start), so the caller can fall back to the pure-Python engine.
+    """
+    start_date = budget.get_start_date()
+    current_start = budget.get_current_period_start()
+    if current_start < start_date:
+        return None
+
+    # Weekly and fortnightly periods are counted in whole blocks of days from
+    # the start date, so shift day numbers until the start lands on a boundary
+    block = {'weekly': 7, 'fortnightly': 14}.get(budget.frequency)
+    start_day = np.datetime64(start_date, 'D')
+    offset = int(start_day.astype(np.int64)) % block if block else 0
+    first = int(_period_numbers(budget, np.array([start_day]) - offset)[0])
+    count = int(_period_numbers(budget, np.array([np.datetime64(current_start, 'D')]) - offset)[0]) - first + 1
+
+    ordinals = []
+    amounts = []
+    for t in transactions:
+        ordinals.append(t.day.toordinal())
+        amounts.append(int(t.amount.scaleb(2)))
+    spent = np.zeros(count, dtype=np.int64)
+    if ordinals:
+        days = (np.array(ordinals, dtype=np.int64) - _EPOCH_ORDINAL).astype('datetime64[D]')
+        cents = np.array(amounts, dtype=np.int64)
+        index = _period_numbers(budget, days - offset) - first
+        in_range = (index >= 0) & (index < count)
+        np.add.at(spent, index[in_range], cents[in_range])
+
+    base = _to_cents(budget.amount)
+    carried = np.zeros(count, dtype=np.int64)
+    if budget.rollover and count > 1:
+        surplus = base - spent[:-1]
+        if budget.rollover_max is None:
+            # Lindley recursion r[i+1] = max(0, r[i] + surplus[i]) as a running sum minus its running minimum
+            running = np.concatenate(([0], np.cumsum(surplus)))
+            carried = running - np.minimum.accumulate(running)
+        else:
+            cap = _to_cents(budget.rollover_max)
+            rollover_amount = 0
+            for i, value in enumerate(surplus.tolist(), start=1):
+                rollover_amount = min(max(0, rollover_amount + value), cap)
+                carried[i] = rollover_amount
+
+    keep = slice(max(0, count - num_periods), count)
+    numbers = np.arange(first, first + count, dtype=np.int64)[keep]
+    starts = _period_start_days(budget, numbers, offset)
+    ends = _period_start_days(budget, numbers + 1, offset) - np.timedelta64(1, 'D')
+    periods = [
+        _period_dict(budget, period_start, period_end, _from_cents(total), _from_cents(rollover_amount), current_start)
+        for period_start, period_end, total, rollover_amount in zip(
+            starts.tolist(), ends.tolist(), spent[keep].tolist(), carried[keep].tolist()
+        )
+    ]
+    periods.reverse()
+    return periods
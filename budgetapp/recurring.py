@@ -0,0 +1,169 @@
+"""
+Generation of transactions from recurring rules.
+
+Rules are processed in batches: due dates are worked out in memory, the
+missing transactions are inserted with one ``bulk_create`` per batch, each
+rule's ``last_generated`` is written once, and every affected budget gets a
+single aggregate refresh. ``manage.py generate_recurring`` runs this for all
+users and is meant to be scheduled (e.g. daily from cron).
+
+Generation is safe to run from several workers at once: each batch of rules
+is claimed with a short lease before it is processed, and a unique
+constraint on (recurring_transaction, day) plus insert-or-ignore means a
+race can never produce a duplicate transaction. Transactions already entered
+by hand for the same day, amount and description (see ``DuplicateFilter``)
+are not generated again.
+"""
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_data_version_on_commit
+from .models import DuplicateFilter, RecurringTransaction, Transaction, UserProfile, update_budget_aggregates_async
+
+
+def due_dates(rule, today):
+    """Return the dates a rule should have generated a transaction for, up to ``today``."""
+    next_date = rule.start_date if not rule.last_generated else rule._get_next_date(rule.last_generated)
+    last_date = min(today, rule.end_date) if rule.end_date else today
+    dates = []
+    while next_date <= last_date:
+        dates.append(next_date)
+        next_date = rule._get_next_date(next_date)
+    return dates
+
+
+def generate_for_rules(rules, today=None):
+    """
+    Create the missing transactions for ``rules``; returns the new transactions.
+
+    A row another worker inserted after the existing-row lookup is silently
+    skipped, so the result can overstate what this call itself inserted.
+
+    The rules should have ``budget`` loaded (``select_related('budget')``).
+    """
+    if today is None:
+        today = timezone.localdate()
+    due = {rule.pk: due_dates(rule, today) for rule in rules if rule.active}
+    earliest = min((dates[0] for dates in due.values() if dates), default=None)
+
+    existing = set()
+    if earliest is not None:
+        existing = set(Transaction.objects.filter(
+            recurring_transaction_id__in=[pk for pk, dates in due.items() if dates], day__gte=earliest,
+        ).values_list('recurring_transaction_id', 'day'))
+
+    new_transactions = []
+    changed_rules = []
+    for rule in rules:
+        dates = due.get(rule.pk, [])
+        for day in dates:
+            if (rule.pk, day) in existing:
+                continue
+            new_transactions.append(Transaction(
+                user_id=rule.user_id,
+                budget=rule.budget,
+                amount=rule.amount,
+                description=f"{rule.description} (Recurring)",
+                date=timezone.make_aware(datetime.combine(day, datetime.min.time())),
+                recurring_transaction=rule,
+            ))
+        expired = rule.active and rule.end_date is not None and today > rule.end_date
+        if dates:
+            rule.last_generated = dates[-1]
+        if expired:
+            rule.active = False
+        if dates or expired:
+            changed_rules.append(rule)
+    new_transactions = DuplicateFilter(Transaction)(new_transactions)
+
+    with db_transaction.atomic():
+        # Rows another worker inserted since the lookup above are skipped by the unique constraint
+        Transaction.objects.bulk_create(new_transactions, ignore_conflicts=True)
+        RecurringTransaction.objects.bulk_update(changed_rules, ['last_generated', 'active'])
+        # bulk_create skips the per-transaction signals, so refresh each budget once
+        budgets = {t.budget_id: t.budget for t in new_transactions}
+        for budget in budgets.values():
+            update_budget_aggregates_async(budget)
+        for user_id in {t.user_id for t in new_transactions} | {rule.user_id for rule in changed_rules}:
+            bump_data_version_on_commit(user_id)
+    return new_transactions
+
+
+def claim_rules(rules, batch_size=500, lease_seconds=300, after_pk=0):
+    """
+    Claim up to ``batch_size`` rules from ``rules`` with a pk above ``after_pk``.
+
+    Returns the claimed rules with their budgets, and the highest pk
+    considered so the caller can move past rules held by other workers.
+    """
+    now = timezone.now()
+    claimable = Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+    ids = list(rules.filter(claimable, pk__gt=after_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return [], None
+    token = uuid.uuid4().hex
+    RecurringTransaction.objects.filter(claimable, pk__in=ids).update(
+        claim_token=token, claimed_until=now + timedelta(seconds=lease_seconds),
+    )
+    claimed = list(
+        RecurringTransaction.objects.filter(claim_token=token).select_related('budget', 'user__profile').order_by('pk')
+    )
+    return claimed, ids[-1]
+
+
+def _owner_timezone(rule):
+    try:
+        return rule.user.profile.timezone
+    except UserProfile.DoesNotExist:
+        return None
+
+
+def release_rules(rules):
+    """Give up a claim early so other workers can retry the rules."""
+    RecurringTransaction.objects.filter(pk__in=[rule.pk for rule in rules]).update(claim_token='', claimed_until=None)
+
+
+def generate_recurring_transactions(users=None, today=None, batch_size=500, lease_seconds=300):
+    """
+    Generate due transactions for every active rule (optionally only ``users``'s).
+
+    Any number of these can run concurrently; each claims its own batches.
+    Each owner's rules are generated in their profile timezone, so "today"
+    and the stored midnights match what the app itself would write. Returns
+    a dict with the number of rules processed, transactions created and
+    budgets refreshed.
+    """
+    # No timezone is more than a day ahead of the server's
+    latest_start = today or timezone.localdate() + timedelta(days=1)
+    rules = RecurringTransaction.objects.filter(active=True, start_date__lte=latest_start)
+    if users is not None:
+        rules = rules.filter(user__in=users)
+
+    stats = {'rules': 0, 'created': 0, 'budgets': 0}
+    last_pk = 0
+    while True:
+        batch, last_pk = claim_rules(rules, batch_size, lease_seconds, after_pk=last_pk)
+        if last_pk is None:
+            break
+        by_timezone = defaultdict(list)
+        for rule in batch:
+            by_timezone[_owner_timezone(rule)].append(rule)
+        created = []
+        try:
+            for tzname, rules_in_zone in by_timezone.items():
+                with timezone.override(tzname):
+                    created += generate_for_rules(rules_in_zone, today)
+        except Exception:
+            release_rules(batch)
+            raise
+        # Finished rules keep their claim until the lease runs out, so workers
+        # that are further behind don't pick them up again in this run
+        stats['rules'] += len(batch)
+        stats['created'] += len(created)
+        stats['budgets'] += len({t.budget_id for t in created})
+    return stats
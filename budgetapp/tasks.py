@@ -0,0 +1,251 @@
+"""
+Background execution of aggregate recomputation.
+
+By default jobs are handed to a process-wide pool of worker threads once
+the surrounding database transaction commits. Requests for a target that is
+already waiting in the queue collapse into the pending job, the queue is
+bounded (a full queue runs the job in the caller instead), and each worker
+closes its database connection after every job.
+
+With ``AGGREGATE_JOB_BACKEND = 'database'`` jobs are instead written to the
+AggregateJob table in the same transaction as the change that caused them,
+and ``manage.py run_workers`` claims and processes them. Jobs then survive
+the web process being recycled.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class AggregateWorkerPool:
+    """Bounded pool of daemon threads running coalesced aggregate jobs."""
+
+    def __init__(self, num_workers, max_queue):
+        self.num_workers = num_workers
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._submitted = 0
+        self._coalesced = 0
+        self._completed = 0
+        self._failed = 0
+        self._inline = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_last = 0.0
+
+    def submit(self, key, func, *args):
+        """Queue ``func(*args)`` under ``key``; returns False if it coalesced into a pending job."""
+        tzname = timezone.get_current_timezone_name()
+        with self._lock:
+            self._submitted += 1
+            if key in self._pending:
+                self._coalesced += 1
+                return False
+            self._pending[key] = time.monotonic()
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((key, func, args, tzname))
+        except queue.Full:
+            # Backpressure: do the work in the caller rather than grow without bound
+            with self._lock:
+                self._inline += 1
+            self._run(key, func, args, tzname)
+        return True
+
+    def _ensure_workers(self):
+        pid = os.getpid()
+        if self._pid == pid and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            if self._pid != pid:
+                # Threads don't survive a fork; start a fresh set in this process
+                self._threads = []
+                self._pid = pid
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.num_workers:
+                thread = threading.Thread(target=self._work, name=f'aggregate-worker-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            key, func, args, tzname = self._queue.get()
+            try:
+                self._run(key, func, args, tzname)
+            finally:
+                # Only on worker threads: an inline run shares the request's connection
+                connections.close_all()
+                self._queue.task_done()
+
+    def _run(self, key, func, args, tzname):
+        with self._lock:
+            # Requests arriving from here on describe changes this run may miss
+            enqueued_at = self._pending.pop(key, time.monotonic())
+        failed = False
+        try:
+            with timezone.override(tzname):
+                func(*args)
+        except Exception:
+            failed = True
+            logger.exception('Aggregate job %s failed', key)
+        finally:
+            latency = time.monotonic() - enqueued_at
+            with self._lock:
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                self._latency_total += latency
+                self._latency_last = latency
+                self._latency_max = max(self._latency_max, latency)
+
+    def join(self):
+        """Block until every queued job has finished."""
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                'workers': len([thread for thread in self._threads if thread.is_alive()]),
+                'queue_depth': self._queue.qsize(),
+                'pending': len(self._pending),
+                'submitted': self._submitted,
+                'coalesced': self._coalesced,
+                'completed': self._completed,
+                'failed': self._failed,
+                'ran_inline': self._inline,
+                'latency_avg': self._latency_total / finished if finished else 0.0,
+                'latency_max': self._latency_max,
+                'latency_last': self._latency_last,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the process-wide worker pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = AggregateWorkerPool(
+                    num_workers=getattr(settings, 'AGGREGATE_WORKERS', 2),
+                    max_queue=getattr(settings, 'AGGREGATE_QUEUE_SIZE', 1000),
+                )
+    return _pool
+
+
+# Functions run for each kind of job, called with the target's primary key
+JOB_HANDLERS = {
+    'budget': 'budgetapp.models.refresh_budget_aggregates',
+    'income': 'budgetapp.models.refresh_income_aggregates',
+}
+
+
+def schedule_aggregate_job(kind, target_id, func):
+    """
+    Run ``func(target_id)`` in the background once the current transaction commits.
+
+    With ``AGGREGATE_WORKERS = 0`` the job runs synchronously on commit,
+    which is what management commands and tests usually want. With the
+    database backend the job is recorded durably instead.
+    """
+    if getattr(settings, 'AGGREGATE_JOB_BACKEND', 'threads') == 'database':
+        enqueue_aggregate_job(kind, target_id)
+        return
+
+    def submit():
+        if getattr(settings, 'AGGREGATE_WORKERS', 2) <= 0:
+            func(target_id)
+        else:
+            get_worker_pool().submit((kind, target_id), func, target_id)
+
+    transaction.on_commit(submit)
+
+
+def worker_stats():
+    """Monitoring snapshot of this process's worker pool (and the durable queue, if used)."""
+    stats = get_worker_pool().stats()
+    if getattr(settings, 'AGGREGATE_JOB_BACKEND', 'threads') == 'database':
+        from .models import AggregateJob
+        stats['durable_queue'] = {
+            status: AggregateJob.objects.filter(status=status).count()
+            for status, _ in AggregateJob.STATUS_CHOICES
+        }
+    return stats
+
+
+# Durable database-backed queue
+
+def enqueue_aggregate_job(kind, target_id):
+    """Record a job unless an identical one is already waiting."""
+    from .models import AggregateJob
+    AggregateJob.objects.bulk_create(
+        [AggregateJob(kind=kind, target_id=target_id, timezone=timezone.get_current_timezone_name())],
+        ignore_conflicts=True,
+    )
+
+
+def claim_aggregate_jobs(batch_size=20, lease_seconds=300):
+    """
+    Claim up to ``batch_size`` due jobs for this worker and return them.
+
+    Claiming stamps a fresh token on rows that are still claimable, so two
+    workers racing for the same rows can't both win; jobs whose worker died
+    are reclaimed once their lease expires.
+    """
+    from .models import AggregateJob
+    now = timezone.now()
+    claimable = (
+        Q(status='pending', run_after__lte=now)
+        | Q(status='running', claimed_at__lt=now - timedelta(seconds=lease_seconds))
+    )
+    ids = list(AggregateJob.objects.filter(claimable).order_by('run_after').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    AggregateJob.objects.filter(claimable, id__in=ids).update(status='running', claim_token=token, claimed_at=now)
+    return list(AggregateJob.objects.filter(claim_token=token, status='running'))
+
+
+def run_aggregate_job(job, max_attempts=5, backoff_seconds=30):
+    """Run one claimed job; failures are retried with exponential backoff."""
+    from .models import AggregateJob
+    claimed = AggregateJob.objects.filter(pk=job.pk, claim_token=job.claim_token)
+    try:
+        with timezone.override(job.timezone):
+            import_string(JOB_HANDLERS[job.kind])(job.target_id)
+    except Exception as exc:
+        logger.exception('Aggregate job %s failed', job)
+        attempts = job.attempts + 1
+        if attempts >= max_attempts:
+            claimed.update(status='failed', attempts=attempts, last_error=repr(exc))
+            return False
+        retry_at = timezone.now() + timedelta(seconds=backoff_seconds * 2 ** (attempts - 1))
+        try:
+            with transaction.atomic():
+                claimed.update(status='pending', attempts=attempts, run_after=retry_at, claim_token='', last_error=repr(exc))
+        except IntegrityError:
+            # A newer request for the same target is already waiting and covers this one
+            claimed.delete()
+        return False
+    claimed.delete()
+    return True
@@ -1,3 +1,1275 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import periods as period_engine
+from .backup import BackupError, dump_user, restore_user
+from .importers import StatementRow, import_file, parse_csv, parse_ofx, parse_qif
+from .management.commands import recompute_budget_history as recompute_command
+from .models import (
+    AggregateJob, Budget, BudgetPeriod, ImportRule, Income, IncomeTransaction, RecurringTransaction, Transaction,
+    UserProfile, deferred_aggregates, set_derived_fields, sync_period_anchor, update_budget_aggregates,
+)
+from . import cache as page_cache
+from .cache import get_cached, get_data_version, get_or_compute, get_serializer, user_cache_key
+from .pagination import InvalidCursor, KeysetPaginator
+from .recurring import claim_rules, generate_for_rules, generate_recurring_transactions
+from .tasks import (
+    AggregateWorkerPool, claim_aggregate_jobs, enqueue_aggregate_job, run_aggregate_job, schedule_aggregate_job,
+)
+from .viewmodels import build_dashboard_data, render_dashboard_fragments
+
+
+# Tests clear the cache freely, so keep them off the developer's file cache (or Redis)
+TEST_CACHES = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'budgetapp-tests'},
+})
+
+
+def setUpModule():
+    TEST_CACHES.enable()
+
+
+def tearDownModule():
+    TEST_CACHES.disable()
+
+
+def aware(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def reference_period(budget, period_start, transactions):
+    """Straightforward recursive rollover calculation used to check the engine."""
+    start_date = budget.get_start_date()
+    period_end = budget.get_period_end_for_date(period_start)
+    spent = sum(t.amount for t in transactions if period_start <= timezone.localtime(t.date).date() <= period_end)
+    rollover_amount = 0
+    if budget.rollover and period_start > start_date:
+        prev_start = budget.get_period_start_for_date(period_start - timedelta(days=1))
+        prev = reference_period(budget, prev_start, transactions)
+        rollover_amount = max(0, prev['budget_amount'] - prev['total_spent'])
+        if budget.rollover_max is not None:
+            rollover_amount = min(rollover_amount, budget.rollover_max)
+    return {'total_spent': spent, 'budget_amount': budget.amount + rollover_amount}
+
+
+class PeriodEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('engine', password='pw')
+
+    def make_budget(self, **kwargs):
+        defaults = {'category': 'Food', 'amount': Decimal('100.00'), 'frequency': 'weekly'}
+        defaults.update(kwargs)
+        return Budget.objects.create(user=self.user, **defaults)
+
+    def add_transactions(self, budget, days_and_amounts):
+        Transaction.objects.bulk_create(set_derived_fields([
+            Transaction(user=self.user, budget=budget, amount=Decimal(amount),
+                        description='t', date=aware(day))
+            for day, amount in days_and_amounts
+        ]))
+        sync_period_anchor(budget)
+
+    def history(self, weeks):
+        today = timezone.now().date()
+        return [(today - timedelta(days=3 * i), f'{(i * 37) % 90 + 5}.25') for i in range(weeks * 7 // 3)]
+
+    def assert_matches_reference(self, budget):
+        transactions = list(budget.transactions.all())
+        periods = budget.get_historical_periods(num_periods=52, use_db=False)
+        self.assertTrue(periods[0]['is_current'])
+        for period in periods:
+            expected = reference_period(budget, period['start_date'], transactions)
+            self.assertEqual(period['total_spent'], expected['total_spent'])
+            self.assertEqual(period['budget_amount'], expected['budget_amount'])
+            self.assertEqual(period['balance'], expected['budget_amount'] - expected['total_spent'])
+        return periods
+
+    def test_weekly_rollover_with_cap(self):
+        budget = self.make_budget(rollover=True, rollover_max=Decimal('60.00'))
+        self.add_transactions(budget, self.history(20))
+        periods = self.assert_matches_reference(budget)
+        self.assertEqual(periods[-1]['start_date'], budget.get_start_date())
+        self.assertEqual(periods[-1]['rollover_amount'], 0)
+
+    def test_fortnightly_and_monthly_rollover(self):
+        for frequency in ('fortnightly', 'monthly', 'yearly'):
+            budget = self.make_budget(category=frequency, frequency=frequency, rollover=True)
+            self.add_transactions(budget, self.history(30))
+            self.assert_matches_reference(budget)
+
+    def test_limits_to_requested_number_of_periods(self):
+        budget = self.make_budget(rollover=True)
+        self.add_transactions(budget, self.history(80))
+        periods = budget.get_historical_periods(num_periods=52, use_db=False)
+        self.assertEqual(len(periods), 52)
+        self.assertEqual(periods[0]['start_date'], budget.get_current_period_start())
+
+    @unittest.skipIf(period_engine.np is None, 'NumPy is not installed')
+    def test_vectorized_engine_matches_python(self):
+        settings = [{'rollover': False}, {'rollover': True}, {'rollover': True, 'rollover_max': Decimal('45.50')}]
+        for frequency in ('weekly', 'fortnightly', 'monthly', 'yearly'):
+            for options in settings:
+                budget = self.make_budget(category=f'{frequency} {options}', frequency=frequency, **options)
+                self.add_transactions(budget, self.history(120))
+                transactions = list(budget.transactions.all())
+                expected = period_engine.compute_budget_periods(budget, 52, transactions)
+                actual = period_engine.compute_budget_periods(budget, 52, transactions, vectorized=True)
+                self.assertEqual(actual, expected, (frequency, options))
+
+    def test_vectorized_falls_back_without_numpy(self):
+        budget = self.make_budget(rollover=True)
+        self.add_transactions(budget, self.history(10))
+        expected = budget.get_historical_periods(num_periods=52, use_db=False)
+        with mock.patch.object(period_engine, 'np', None):
+            self.assertEqual(period_engine.compute_budget_periods(budget, 52, vectorized=True), expected)
+
+
+class PeriodAnchorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('anchor', password='pw')
+        self.budget = Budget.objects.create(user=self.user, category='Rent', amount=Decimal('500.00'), frequency='fortnightly')
+
+    def add(self, day):
+        return Transaction.objects.create(user=self.user, budget=self.budget, amount=Decimal('10.00'),
+                                          description='t', date=aware(day))
+
+    def test_anchor_follows_oldest_transaction(self):
+        today = timezone.localdate()
+        first = self.add(today - timedelta(days=30))
+        self.add(today - timedelta(days=10))
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.period_anchor, today - timedelta(days=30))
+
+        older = self.add(today - timedelta(days=45))
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.period_anchor, today - timedelta(days=45))
+
+        older.delete()
+        first.delete()
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.period_anchor, today - timedelta(days=10))
+
+    def test_period_boundaries_do_not_query(self):
+        self.add(date(2024, 1, 10))
+        self.budget.refresh_from_db()
+        with self.assertNumQueries(0):
+            start = self.budget.get_period_start_for_date(date(2024, 1, 24))
+            self.budget.get_current_period_start()
+            self.budget.get_start_date()
+        self.assertEqual(start, date(2024, 1, 22))
+
+
+@override_settings(AGGREGATE_WORKERS=0)
+class TransactionDayTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('days', password='pw')
+        self.budget = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+
+    def test_day_is_the_local_date_when_saved(self):
+        with timezone.override('Pacific/Auckland'):
+            t = Transaction.objects.create(user=self.user, budget=self.budget, amount=Decimal('5.00'), description='t',
+                                           date=timezone.make_aware(datetime(2024, 3, 1, 22, 30)))
+        self.assertEqual(Transaction.objects.get(pk=t.pk).day, date(2024, 3, 1))
+        t.date = aware(date(2024, 3, 5))
+        t.save()
+        self.assertEqual(Transaction.objects.get(pk=t.pk).day, date(2024, 3, 5))
+        self.assertEqual(self.budget._compute_anchor_date(), date(2024, 3, 5))
+
+    def test_income_period_totals_use_days(self):
+        income = Income.objects.create(user=self.user, source='Gig', amount=Decimal('100.00'), frequency='weekly',
+                                       is_variable=True)
+        start, end = Income.get_period_bounds('weekly')
+        for day, amount in ((start - timedelta(days=1), '1.00'), (start, '10.00'), (end, '20.00')):
+            IncomeTransaction.objects.create(user=self.user, income=income, amount=Decimal(amount), description='p',
+                                             date=aware(day))
+        self.assertEqual(income.get_current_period_actual_income(), Decimal('30.00'))
+        annotated = Income.objects.annotate(
+            period_total=Sum('income_transactions__amount', filter=Income.current_period_filter()),
+        ).get(pk=income.pk)
+        self.assertEqual(annotated.period_total, Decimal('30.00'))
+
+
+@mock.patch('budgetapp.models.update_budget_aggregates_async', update_budget_aggregates)
+class IncrementalPeriodTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('incremental', password='pw')
+
+    def make_budget(self, **kwargs):
+        budget = Budget.objects.create(user=self.user, category='Fuel', amount=Decimal('80.00'),
+                                       frequency='weekly', **kwargs)
+        today = timezone.localdate()
+        Transaction.objects.bulk_create(set_derived_fields([
+            Transaction(user=self.user, budget=budget, amount=Decimal('30.00') + i % 7,
+                        description='t', date=aware(today - timedelta(days=5 * i)))
+            for i in range(150)
+        ]))
+        update_budget_aggregates(budget)
+        return budget
+
+    def stored(self, budget):
+        return list(BudgetPeriod.objects.filter(budget=budget).order_by('-start_date').values_list(
+            'start_date', 'budget_amount', 'total_spent', 'difference', 'is_over_budget'))
+
+    def expected(self, budget):
+        return [
+            (p['start_date'], p['budget_amount'], p['total_spent'], p['difference'], p['is_over_budget'])
+            for p in budget.get_historical_periods(num_periods=52, use_db=False)
+        ]
+
+    def test_insert_touches_only_affected_rows(self):
+        budget = self.make_budget()
+        with CaptureQueriesContext(connection) as queries:
+            Transaction.objects.create(user=self.user, budget=budget, amount=Decimal('99.00'),
+                                       description='new', date=aware(timezone.localdate() - timedelta(days=40)))
+        self.assertLess(len(queries), 12)
+        self.assertEqual(self.stored(budget), self.expected(budget))
+
+    def test_rollover_changes_propagate(self):
+        budget = self.make_budget(rollover=True, rollover_max=Decimal('50.00'))
+        transaction = Transaction.objects.create(user=self.user, budget=budget, amount=Decimal('1.00'),
+                                                 description='new', date=aware(timezone.localdate() - timedelta(days=60)))
+        self.assertEqual(self.stored(budget), self.expected(budget))
+        transaction.amount = Decimal('250.00')
+        transaction.save()
+        self.assertEqual(self.stored(budget), self.expected(budget))
+        transaction.delete()
+        self.assertEqual(self.stored(budget), self.expected(budget))
+        budget.refresh_from_db()
+        self.assertEqual(budget.total_spent, sum(t.amount for t in budget.transactions.all()))
+
+    def test_config_change_rebuilds(self):
+        budget = self.make_budget()
+        budget.amount = Decimal('120.00')
+        budget.rollover = True
+        budget.save()
+        self.assertEqual(self.stored(budget), self.expected(budget))
+
+
+class AggregateWorkerPoolTests(TestCase):
+    def test_repeated_requests_coalesce(self):
+        pool = AggregateWorkerPool(num_workers=1, max_queue=10)
+        release = threading.Event()
+        calls = []
+        pool.submit(('budget', 0), lambda target: release.wait(5), 0)
+        for _ in range(5):
+            pool.submit(('budget', 1), calls.append, 1)
+        release.set()
+        pool.join()
+        stats = pool.stats()
+        self.assertEqual(calls, [1])
+        self.assertEqual(stats['coalesced'], 4)
+        self.assertEqual(stats['completed'], 2)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_inline_run_keeps_the_callers_connection(self):
+        pool = AggregateWorkerPool(num_workers=1, max_queue=1)
+        started, release = threading.Event(), threading.Event()
+        pool.submit(('budget', 0), lambda target: started.set() or release.wait(5), 0)
+        started.wait(5)
+        pool.submit(('budget', 1), lambda target: None, 1)
+        with mock.patch('budgetapp.tasks.connections') as connections:
+            # The queue is full, so this one runs on this thread, in the middle of its request
+            pool.submit(('budget', 2), lambda target: None, 2)
+            self.assertEqual(pool.stats()['ran_inline'], 1)
+            connections.close_all.assert_not_called()
+            release.set()
+            pool.join()
+        self.assertEqual(connections.close_all.call_count, 2)
+
+
+@override_settings(AGGREGATE_JOB_BACKEND='database')
+class DurableJobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('queue', password='pw')
+        self.budget = Budget.objects.create(user=self.user, category='Gym', amount=Decimal('20.00'), frequency='monthly')
+
+    def test_jobs_deduplicate_and_run(self):
+        for _ in range(3):
+            enqueue_aggregate_job('budget', self.budget.pk)
+        self.assertEqual(AggregateJob.objects.count(), 1)
+
+        jobs = claim_aggregate_jobs(batch_size=10)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(claim_aggregate_jobs(batch_size=10), [])
+        # A request arriving while the job runs is queued again rather than lost
+        enqueue_aggregate_job('budget', self.budget.pk)
+        self.assertTrue(run_aggregate_job(jobs[0]))
+        self.assertEqual(list(AggregateJob.objects.values_list('status', flat=True)), ['pending'])
+        self.assertTrue(self.budget.periods.exists())
+
+    def test_failures_back_off_then_fail(self):
+        enqueue_aggregate_job('budget', self.budget.pk)
+        with mock.patch('budgetapp.models.update_budget_aggregates', side_effect=RuntimeError('boom')):
+            job = claim_aggregate_jobs()[0]
+            self.assertFalse(run_aggregate_job(job, max_attempts=2))
+            job = AggregateJob.objects.get()
+            self.assertEqual((job.status, job.attempts), ('pending', 1))
+            self.assertGreater(job.run_after, timezone.now())
+            AggregateJob.objects.update(run_after=timezone.now())
+            self.assertFalse(run_aggregate_job(claim_aggregate_jobs()[0], max_attempts=2))
+        self.assertEqual(AggregateJob.objects.get().status, 'failed')
+
+
+@mock.patch('budgetapp.models.update_budget_aggregates_async', update_budget_aggregates)
+class DashboardQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dashboard', password='pw')
+        self.client.force_login(self.user)
+        self.budgets = 0
+        self.incomes = 0
+
+    def add_budgets(self, count):
+        today = timezone.localdate()
+        for _ in range(count):
+            self.budgets += 1
+            budget = Budget.objects.create(user=self.user, category=f'Budget {self.budgets}', amount=Decimal('50.00'),
+                                           frequency=('weekly', 'fortnightly', 'monthly')[self.budgets % 3])
+            Transaction.objects.bulk_create(set_derived_fields([
+                Transaction(user=self.user, budget=budget, amount=Decimal('12.00'), description='t',
+                            date=aware(today - timedelta(days=4 * i)))
+                for i in range(10)
+            ]))
+            update_budget_aggregates(budget)
+        for _ in range(count // 2):
+            self.incomes += 1
+            income = Income.objects.create(user=self.user, source=f'Job {self.incomes}', amount=Decimal('300.00'),
+                                           frequency='variable', is_variable=True)
+            IncomeTransaction.objects.create(user=self.user, income=income, amount=Decimal('320.00'),
+                                             description='pay', date=aware(today))
+
+    def dashboard_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_budgets(self):
+        self.add_budgets(2)
+        baseline = self.dashboard_queries()
+        self.add_budgets(10)
+        self.assertEqual(self.dashboard_queries(), baseline)
+
+    @mock.patch('budgetapp.models.rebucket_budget_periods')
+    def test_new_period_is_calculated_in_one_query_and_healed(self, rebucket):
+        self.add_budgets(2)
+        with CaptureQueriesContext(connection) as fresh:
+            build_dashboard_data(self.user)
+        self.add_budgets(4)
+        later = timezone.now() + timedelta(days=40)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            with CaptureQueriesContext(connection) as stale:
+                data = build_dashboard_data(self.user)
+            # One transactions query covers every budget whose stored periods ended
+            self.assertEqual(len(stale), len(fresh) + 1)
+            self.assertEqual(sorted(call.args[0].pk for call in rebucket.call_args_list),
+                             sorted(Budget.objects.filter(user=self.user).values_list('pk', flat=True)))
+            for call in rebucket.call_args_list:
+                update_budget_aggregates(call.args[0])
+            rebucket.reset_mock()
+            with CaptureQueriesContext(connection) as healed:
+                rebuilt = build_dashboard_data(self.user)
+        self.assertEqual(len(healed), len(fresh))
+        self.assertEqual([card.balance for card in rebuilt['budget_data']], [card.balance for card in data['budget_data']])
+        rebucket.assert_not_called()
+
+    def test_income_figures(self):
+        self.add_budgets(2)
+        cache.clear()
+        response = self.client.get(reverse('dashboard'), secure=True)
+        income_data = response.context['variable_income_data'][0]
+        self.assertEqual(income_data.actual_period_amount, Decimal('320.00'))
+        self.assertEqual(income_data.difference, Decimal('20.00'))
+        self.assertEqual(len(income_data.recent_transactions), 1)
+        self.assertEqual(response.context['total_weekly_income'], Decimal('320.00') / Decimal('8.57'))
+
+    def test_cached_payload_holds_only_plain_values(self):
+        self.add_budgets(3)
+        cache.clear()
+        self.client.get(reverse('dashboard'), secure=True)
+        payload = get_cached(user_cache_key(self.user.id, 'dashboard_data'))
+        self.assertEqual(len(payload['budget_data']), 3)
+        self.assertNotIn(b'budgetapp.models', get_serializer().dumps(payload))
+        self.assertEqual(get_serializer().loads(get_serializer().dumps(payload)), payload)
+        # A cache hit renders without touching budget data (the profile is read by the timezone middleware)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'), secure=True)
+        self.assertContains(response, 'Budget 3')
+        self.assertFalse([q for q in queries if 'budgetapp_' in q['sql'] and 'budgetapp_userprofile' not in q['sql']])
+
+
+@mock.patch('budgetapp.models.update_budget_aggregates_async', update_budget_aggregates)
+class DashboardFragmentTests(TestCase):
+    def setUp(self):
+        page_cache.get_fragment_cache().clear()
+        self.user = User.objects.create_user('fragments', password='pw')
+        for i in range(3):
+            Budget.objects.create(user=self.user, category=f'Budget {i}', amount=Decimal('50.00'), frequency='weekly')
+
+    def fragment_misses(self, data):
+        before = page_cache.cache_stats()['fragments']['misses']
+        fragments = render_dashboard_fragments(data)
+        return fragments, page_cache.cache_stats()['fragments']['misses'] - before
+
+    def test_only_changed_card_is_rendered_again(self):
+        data = build_dashboard_data(self.user)
+        fragments, misses = self.fragment_misses(data)
+        self.assertEqual(misses, 3 + 2)
+        self.assertIn('Budget 1', fragments['budget_cards'][1])
+
+        self.assertEqual(self.fragment_misses(data)[1], 0)
+        data['budget_data'][1].spent += Decimal('5.00')
+        fragments, misses = self.fragment_misses(data)
+        self.assertEqual(misses, 1)
+        self.assertIn('Spent: $5.00', fragments['budget_cards'][1])
+
+    def test_timezone_is_part_of_the_key(self):
+        data = build_dashboard_data(self.user)
+        with timezone.override('Australia/Adelaide'):
+            self.fragment_misses(data)
+        with timezone.override('UTC'):
+            self.assertEqual(self.fragment_misses(data)[1], 5)
+
+
+@override_settings(AGGREGATE_WORKERS=0)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('etags', password='pw')
+        self.client.force_login(self.user)
+        self.budget = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        # A browser has its CSRF cookie from the login page; without one no page validates
+        self.client.get(reverse('dashboard'), secure=True)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in (reverse('dashboard'), reverse('budget_detail', args=[self.budget.pk])):
+            etag = self.client.get(url, secure=True)['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            # Only the timezone middleware's profile lookup runs
+            self.assertFalse([q for q in queries if 'budgetapp_' in q['sql'] and 'budgetapp_userprofile' not in q['sql']])
+
+    def test_logging_in_again_defeats_the_validator(self):
+        # The cached page's CSRF token would no longer match the new session
+        url = reverse('budget_detail', args=[self.budget.pk])
+        etag = self.client.get(url, secure=True)['ETag']
+        self.client.logout()
+        self.client.login(username='etags', password='pw')
+        self.assertEqual(self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_and_messages_defeat_the_validator(self):
+        url = reverse('dashboard')
+        etag = self.client.get(url, secure=True)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(user=self.user, budget=self.budget, amount=Decimal('5.00'),
+                                       description='t', date=aware(timezone.localdate()))
+        self.assertEqual(self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url, secure=True)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('budget_edit', args=[self.budget.pk]), {
+                'category': 'Groceries', 'amount': '100.00', 'frequency': 'weekly',
+            }, secure=True)
+        self.assertEqual(response.status_code, 302)
+        # The redirect target carries a success message, so it is rendered in full
+        response = self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(AGGREGATE_WORKERS=0)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pages', password='pw')
+        self.budget = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        today = timezone.localdate()
+        # Pairs of transactions share a date, so pages must break ties on id
+        Transaction.objects.bulk_create(set_derived_fields([
+            Transaction(user=self.user, budget=self.budget, amount=Decimal('1.00'), description=f't{i}',
+                        date=aware(today - timedelta(days=i // 2)))
+            for i in range(25)
+        ]))
+        self.paginator = KeysetPaginator(self.budget.transactions.all(), ('-date', '-id'))
+
+    def test_walks_forward_and_back_at_constant_cost(self):
+        expected = list(self.budget.transactions.order_by('-date', '-id'))
+        pages = [self.paginator.page()]
+        while pages[-1].has_next:
+            with self.assertNumQueries(1):
+                pages.append(self.paginator.page(after=pages[-1].next_cursor))
+        self.assertEqual([t for page in pages for t in page], expected)
+        self.assertFalse(pages[0].has_previous)
+        self.assertEqual(len(pages[-1]), 5)
+
+        back = self.paginator.page(before=pages[-1].previous_cursor)
+        self.assertEqual(back.object_list, pages[-2].object_list)
+        first = self.paginator.page(before=pages[1].previous_cursor)
+        self.assertEqual(first.object_list, pages[0].object_list)
+        self.assertFalse(first.has_previous)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        with self.assertRaises(InvalidCursor):
+            self.paginator.page(after='not-a-cursor')
+        request = mock.Mock(GET={'transactions_after': 'bm9wZQ'})
+        self.assertEqual(self.paginator.page_from_request(request, 'transactions').object_list,
+                         self.paginator.page().object_list)
+
+    def test_budget_detail_charts_latest_periods_in_order(self):
+        self.client.force_login(self.user)
+        update_budget_aggregates(self.budget)
+        response = self.client.get(reverse('budget_detail', args=[self.budget.pk]), secure=True)
+        chart = response.context['chart_periods']
+        latest = list(self.budget.periods.order_by('-start_date')[:8])
+        self.assertEqual(chart, latest[::-1])
+        next_page = self.client.get(reverse('budget_detail', args=[self.budget.pk]), {
+            'transactions_after': response.context['transactions'].next_cursor}, secure=True)
+        self.assertEqual(len(next_page.context['transactions']), 10)
+
+    def test_table_fragments_and_json(self):
+        self.client.force_login(self.user)
+        update_budget_aggregates(self.budget)
+        first = self.paginator.page()
+        url = reverse('budget_transactions', args=[self.budget.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'transactions_after': first.next_cursor, 'periods_after': 'x'}, secure=True)
+        self.assertNotContains(response, '<html')
+        self.assertEqual(list(response.context['transactions']), self.paginator.page(after=first.next_cursor).object_list)
+        # Links keep the other table's cursor
+        self.assertContains(response, 'periods_after=x')
+        self.assertLessEqual(len([q for q in queries if 'budgetapp_' in q['sql']]), 3)
+
+        data = self.client.get(url, {'format': 'json'}, secure=True).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(data['results'][0]['amount'], '1.00')
+        self.assertEqual(data['next_cursor'], first.next_cursor)
+        periods = self.client.get(reverse('budget_periods', args=[self.budget.pk]), {'format': 'json'}, secure=True)
+        self.assertEqual(len(periods.json()['results']), self.budget.periods.count())
+
+        other = User.objects.create_user('intruder', password='pw')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url, secure=True).status_code, 404)
+
+    def test_income_detail_pages_through_history(self):
+        self.client.force_login(self.user)
+        income = Income.objects.create(user=self.user, source='Job', amount=Decimal('100.00'), frequency='weekly')
+        IncomeTransaction.objects.bulk_create(set_derived_fields([
+            IncomeTransaction(user=self.user, income=income, amount=Decimal('5.00'), description=f'p{i}',
+                              date=aware(timezone.localdate() - timedelta(days=i)))
+            for i in range(25)
+        ]))
+        url = reverse('income_detail', args=[income.pk])
+        first = self.client.get(url, secure=True).context['transactions_page']
+        second = self.client.get(url, {'transactions_after': first.next_cursor}, secure=True)
+        self.assertEqual(len(second.context['transactions_page']), 5)
+        # The chart keeps showing the latest transactions
+        self.assertEqual(second.context['income_transactions'], first.object_list)
+
+
+@override_settings(AGGREGATE_WORKERS=0)
+class JsonApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('api', password='pw')
+        self.client.force_login(self.user)
+        self.budget = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        Transaction.objects.bulk_create(set_derived_fields([
+            Transaction(user=self.user, budget=self.budget, amount=Decimal('12.34'), description=f't{i}',
+                        date=aware(timezone.localdate() - timedelta(days=i)))
+            for i in range(30)
+        ]))
+        update_budget_aggregates(self.budget)
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params, secure=True)
+
+    def test_dashboard_in_cents_with_field_selection(self):
+        Income.objects.create(user=self.user, source='Job', amount=Decimal('500.00'), frequency='weekly')
+        data = self.get('api_dashboard').json()
+        self.assertEqual(data['totals']['total_budget'], 10000)
+        budget = data['budgets'][0]
+        self.assertEqual(budget['amount'], 10000)
+        self.assertIsInstance(budget['spent'], int)
+        trimmed = self.get('api_dashboard', fields='id,balance', income_fields='source').json()
+        self.assertEqual(set(trimmed['budgets'][0]), {'id', 'balance'})
+        self.assertEqual(trimmed['incomes'], [{'source': 'Job'}])
+        self.assertEqual(self.get('api_dashboard', fields='nope').status_code, 400)
+
+    def test_budget_period_and_transactions(self):
+        current = self.get('api_budget', self.budget.pk).json()['current_period']
+        self.assertTrue(current['is_current'])
+        periods = self.get('api_budget_periods', self.budget.pk, limit=2).json()
+        self.assertEqual(len(periods['results']), min(2, self.budget.periods.count()))
+
+        first = self.get('api_transactions', budget=self.budget.pk).json()
+        self.assertEqual(len(first['results']), 20)
+        self.assertEqual(first['results'][0]['amount'], 1234)
+        rest = self.get('api_transactions', after=first['next_cursor']).json()
+        self.assertEqual(len(rest['results']), 10)
+        self.assertIsNone(rest['next_cursor'])
+        self.assertEqual(self.get('api_transactions', after='garbage').status_code, 400)
+
+    def test_validators_compression_and_auth(self):
+        response = self.client.get(reverse('api_transactions'), {'limit': 100}, secure=True,
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        not_modified = self.client.get(reverse('api_transactions'), {'limit': 100}, secure=True,
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.client.logout()
+        self.assertEqual(self.get('api_dashboard').status_code, 401)
+        other = User.objects.create_user('snoop', password='pw')
+        self.client.force_login(other)
+        self.assertEqual(self.get('api_budget', self.budget.pk).status_code, 404)
+
+
+@override_settings(AGGREGATE_WORKERS=0)
+class BatchIngestionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('batch', password='pw')
+        self.client.force_login(self.user)
+        self.food = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        self.fuel = Budget.objects.create(user=self.user, category='Fuel', amount=Decimal('60.00'), frequency='weekly')
+        self.job = Income.objects.create(user=self.user, source='Job', amount=Decimal('500.00'), frequency='weekly')
+        other = User.objects.create_user('other-batch', password='pw')
+        self.foreign = Budget.objects.create(user=other, category='Theirs', amount=Decimal('10.00'), frequency='weekly')
+
+    def post(self, body):
+        return self.client.post(reverse('api_transactions_batch'), json.dumps(body),
+                                content_type='application/json', secure=True)
+
+    def test_bulk_insert_with_one_refresh_per_target(self):
+        today = timezone.localdate().isoformat()
+        rows = [{'budget': self.food.pk if i % 2 else self.fuel.pk, 'amount': 250, 'description': f'r{i}', 'date': today}
+                for i in range(200)]
+        rows.append({'budget': self.foreign.pk, 'amount': 100, 'description': 'sneaky', 'date': today})
+        rows.append({'budget': self.food.pk, 'amount': '1.00', 'description': '', 'date': 'yesterday'})
+        body = {'transactions': rows,
+                'income_transactions': [{'income': self.job.pk, 'amount': 50000, 'description': 'pay'}]}
+        with mock.patch('budgetapp.models.schedule_aggregate_job', wraps=schedule_aggregate_job) as schedule, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.post(body)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['transactions']['created'], 200)
+        self.assertEqual(data['transactions']['results'][200]['errors'], {'budget': 'Unknown budget.'})
+        self.assertEqual(set(data['transactions']['results'][201]['errors']), {'amount', 'description', 'date'})
+        self.assertEqual(data['income_transactions']['created'], 1)
+        self.assertEqual(sorted((call.args[0], call.args[1]) for call in schedule.call_args_list),
+                         [('budget', self.food.pk), ('budget', self.fuel.pk), ('income', self.job.pk)])
+
+        self.food.refresh_from_db()
+        self.job.refresh_from_db()
+        self.assertEqual(self.food.total_spent, Decimal('250.00'))
+        self.assertEqual(self.job.total_income, Decimal('500.00'))
+        self.assertEqual(self.foreign.transactions.count(), 0)
+        self.assertEqual(self.food.get_current_period_info()['total_spent'], Decimal('250.00'))
+
+    def test_dates_are_stored_at_local_midnight(self):
+        self.post({'transactions': [
+            {'budget': self.food.pk, 'amount': 100, 'description': 'timed', 'date': '2025-03-02T15:45:00'},
+            {'budget': self.food.pk, 'amount': 100, 'description': 'undated'},
+        ]})
+        stored = dict(self.food.transactions.values_list('description', 'date'))
+        self.assertEqual(stored, {'timed': aware(date(2025, 3, 2)), 'undated': aware(timezone.localdate())})
+
+    def test_signal_updates_are_deferred(self):
+        with mock.patch('budgetapp.models.schedule_aggregate_job') as schedule:
+            with deferred_aggregates():
+                for i in range(5):
+                    Transaction.objects.create(user=self.user, budget=self.food, amount=Decimal('1.00'),
+                                               description=f't{i}', date=aware(timezone.localdate()))
+                self.assertFalse(schedule.called)
+        self.assertEqual([call.args[:2] for call in schedule.call_args_list], [('budget', self.food.pk)])
+
+    def test_rejects_malformed_bodies(self):
+        self.assertEqual(self.client.post(reverse('api_transactions_batch'), 'nope', content_type='application/json',
+                                          secure=True).status_code, 400)
+        self.assertEqual(self.post({'transactions': [{}] * 1001}).status_code, 400)
+
+
+OFX_STATEMENT = """OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20250302120000[+10:EST]
+<TRNAMT>-12.50
+<NAME>WOOLWORTHS 1234
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250303<TRNAMT>1500.00<NAME>ACME PAYROLL<MEMO>March</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+QIF_STATEMENT = """!Type:Bank
+D02/03'25
+T-1,012.50
+PRent
+^
+D3/03/2025
+T45.00
+PRefund
+MShoes
+^
+"""
+
+
+class StatementImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer', password='pw')
+        self.client.force_login(self.user)
+        self.food = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        self.misc = Budget.objects.create(user=self.user, category='Misc', amount=Decimal('50.00'), frequency='weekly')
+        self.job = Income.objects.create(user=self.user, source='Job', amount=Decimal('500.00'), frequency='weekly')
+        ImportRule.objects.create(user=self.user, pattern='woolworths', budget=self.food)
+        ImportRule.objects.create(user=self.user, pattern=r'^acme\b', match_type='regex', income=self.job, priority=1)
+
+    def test_parsers(self):
+        csv_rows = list(parse_csv(['Date,Description,Debit,Credit', '02/03/2025,Woolworths,12.50,', '03/03/2025,Acme,,1500',
+                                   'soon,Bad,1,']))
+        self.assertEqual(csv_rows[:2], [
+            (2, StatementRow(2, date(2025, 3, 2), Decimal('-12.50'), 'Woolworths')),
+            (3, StatementRow(3, date(2025, 3, 3), Decimal('1500'), 'Acme')),
+        ])
+        self.assertIn('date', str(csv_rows[2][1]))
+        self.assertEqual([row[1:] for _, row in parse_ofx(OFX_STATEMENT.splitlines())], [
+            (date(2025, 3, 2), Decimal('-12.50'), 'WOOLWORTHS 1234'),
+            (date(2025, 3, 3), Decimal('1500.00'), 'ACME PAYROLL March'),
+        ])
+        self.assertEqual([row[1:] for _, row in parse_qif(QIF_STATEMENT.splitlines())], [
+            (date(2025, 3, 2), Decimal('-1012.50'), 'Rent'),
+            (date(2025, 3, 3), Decimal('45.00'), 'Refund Shoes'),
+        ])
+
+    @override_settings(AGGREGATE_WORKERS=0)
+    def test_upload_maps_rows_with_one_refresh_per_target(self):
+        today = timezone.localdate()
+        lines = ['Date,Description,Amount'] + [
+            f"{today:%d/%m/%Y},{'Woolworths' if i % 2 else 'Corner store'},-2.00" for i in range(300)
+        ] + [f'{today:%d/%m/%Y},ACME PAYROLL,500.00', f'{today:%d/%m/%Y},Interest,0.12', 'garbage,x,1']
+        upload = SimpleUploadedFile('statement.csv', '\n'.join(lines).encode())
+        with mock.patch('budgetapp.models.schedule_aggregate_job', wraps=schedule_aggregate_job) as schedule, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('import_transactions'), {
+                'statement': upload, 'default_budget': self.misc.pk,
+            }, secure=True)
+        self.assertRedirects(response, reverse('import_transactions'), fetch_redirect_response=False)
+        self.assertEqual(sorted(call.args[:2] for call in schedule.call_args_list),
+                         [('budget', self.food.pk), ('budget', self.misc.pk), ('income', self.job.pk)])
+        self.food.refresh_from_db()
+        self.job.refresh_from_db()
+        self.assertEqual(self.food.total_spent, Decimal('300.00'))
+        self.assertEqual(self.misc.transactions.count(), 150)
+        self.assertEqual(self.job.total_income, Decimal('500.00'))
+        # No default income, so the interest credit is skipped
+        self.assertFalse(IncomeTransaction.objects.filter(description='Interest').exists())
+        self.assertEqual(timezone.localtime(self.food.transactions.first().date).date(), today)
+
+    def test_reimport_skips_rows_already_recorded(self):
+        lines = ['Date,Description,Amount', '02/03/2025,Woolworths,-4.50', '02/03/2025,WOOLWORTHS,-4.50',
+                 '03/03/2025,Woolworths,-9.00']
+        first = import_file(self.user, lines[:3], 'csv')
+        self.assertEqual((first['transactions'], first['duplicates']), (2, 0))
+        # The overlapping rows are skipped; one of the two identical purchases is new
+        second = import_file(self.user, lines + ['02/03/2025,Woolworths,-4.50'], 'csv', chunk_size=1)
+        self.assertEqual((second['transactions'], second['duplicates']), (2, 2))
+        self.assertEqual(self.food.transactions.count(), 4)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.qif') as statement:
+            statement.write(QIF_STATEMENT)
+            statement.flush()
+            call_command('import_transactions', statement.name, user='importer',
+                         default_budget=self.misc.pk, stdout=mock.MagicMock())
+        self.assertEqual(list(self.misc.transactions.values_list('amount', flat=True)), [Decimal('1012.50')])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', password='pw')
+        self.client.force_login(self.user)
+        self.food = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        self.fuel = Budget.objects.create(user=self.user, category='Fuel', amount=Decimal('60.00'), frequency='weekly')
+        self.job = Income.objects.create(user=self.user, source='Job', amount=Decimal('500.00'), frequency='weekly')
+        self.day = date(2025, 3, 2)
+        # Rows are dated in the profile's timezone (UTC), whichever one an earlier request left active
+        with timezone.override('UTC'):
+            for i, budget in enumerate((self.food, self.fuel, self.food)):
+                Transaction.objects.create(user=self.user, budget=budget, amount=Decimal('1.50') * (i + 1),
+                                           description=f'Item, {i}', date=aware(self.day + timedelta(days=i)))
+            IncomeTransaction.objects.create(user=self.user, income=self.job, amount=Decimal('500.00'),
+                                             description='Pay', date=aware(self.day))
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_transactions'), params, secure=True)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_filtered_by_budget_and_dates(self):
+        # Session, user, profile, the budget filter, then one query for every row
+        with self.assertNumQueries(5):
+            response, body = self.export(budget=self.food.pk, start='2025-03-03', end='2025-03-04')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(body.splitlines(), [
+            'id,date,budget_id,budget,description,amount,recurring_transaction_id',
+            f'{self.food.transactions.order_by("date").last().pk},2025-03-04,{self.food.pk},Food,"Item, 2",4.50,',
+        ])
+
+    def test_ndjson_income_and_command(self):
+        _, body = self.export(kind='income', format='ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{
+            'id': IncomeTransaction.objects.get().pk, 'date': '2025-03-02', 'income_id': self.job.pk,
+            'income': 'Job', 'description': 'Pay', 'amount': '500.00',
+        }])
+        self.assertEqual(self.client.get(reverse('export_transactions'), {'budget': 999}, secure=True).status_code, 400)
+
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as output:
+            call_command('export_transactions', user='exporter', output=output.name)
+            self.assertEqual(len(output.read().splitlines()), 4)
+
+    def test_csv_neutralizes_formulas(self):
+        with timezone.override('UTC'):
+            for description in ('=HYPERLINK("http://example.com")', '-5 refund', '@SUM(A1)'):
+                Transaction.objects.create(user=self.user, budget=self.fuel, amount=Decimal('-2.00'),
+                                           description=description, date=aware(self.day))
+        response = self.client.get(reverse('export_transactions'), {'budget': self.fuel.pk}, secure=True,
+                                   headers={'accept-encoding': 'gzip'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))[1:]
+        self.assertEqual([row[4] for row in rows[:3]], ["'=HYPERLINK(\"http://example.com\")", "'-5 refund", "'@SUM(A1)"])
+        self.assertEqual(rows[0][5], '-2.00')
+        _, body = self.export(budget=self.fuel.pk, format='ndjson')
+        self.assertEqual(json.loads(body.splitlines()[0])['description'], '=HYPERLINK("http://example.com")')
+
+
+@override_settings(AGGREGATE_WORKERS=0)
+class BackupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('source', email='source@example.com', password='pw')
+        self.user.profile.timezone = 'Australia/Adelaide'
+        self.user.profile.save()
+        self.food = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        job = Income.objects.create(user=self.user, source='Job', amount=Decimal('500.00'), frequency='weekly')
+        rule = RecurringTransaction.objects.create(user=self.user, budget=self.food, amount=Decimal('5.00'),
+                                                   description='Coffee', frequency='weekly',
+                                                   start_date=timezone.localdate() - timedelta(days=14))
+        ImportRule.objects.create(user=self.user, pattern='acme', income=job)
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('budgetapp.models.update_budget_aggregates_async', update_budget_aggregates):
+            rule.generate_transactions()
+            Transaction.objects.create(user=self.user, budget=self.food, amount=Decimal('12.00'), description='Lunch',
+                                       date=aware(timezone.localdate()))
+            IncomeTransaction.objects.create(user=self.user, income=job, amount=Decimal('480.00'), description='Pay',
+                                             date=aware(timezone.localdate()))
+        Budget.objects.filter(pk=self.food.pk).update(created_at=timezone.now() - timedelta(days=90))
+        self.food.refresh_from_db()
+
+    def backup(self):
+        archive = io.BytesIO()
+        dump_user(self.user, archive)
+        archive.seek(0)
+        return archive
+
+    def test_round_trip_into_new_account(self):
+        archive = self.backup()
+        target = User.objects.create_user('target', password='pw')
+        with mock.patch('budgetapp.models.schedule_aggregate_job') as schedule:
+            result = restore_user(archive, target)
+        schedule.assert_not_called()
+        self.assertEqual(result['counts']['transaction'], 4)
+        self.assertEqual(result['counts']['budget_period'], self.food.periods.count())
+
+        budget = Budget.objects.get(user=target)
+        self.assertNotEqual(budget.pk, self.food.pk)
+        self.assertEqual((budget.total_spent, budget.created_at), (self.food.total_spent, self.food.created_at))
+        self.assertEqual(budget.transactions.filter(recurring_transaction__budget=budget).count(), 3)
+        self.assertEqual(list(budget.periods.values_list('total_spent', flat=True)),
+                         list(self.food.periods.values_list('total_spent', flat=True)))
+        self.assertEqual(ImportRule.objects.get(user=target).income.user, target)
+        self.assertEqual(UserProfile.objects.get(user=target).timezone, 'Australia/Adelaide')
+        restored = IncomeTransaction.objects.get(user=target)
+        with timezone.override('Australia/Adelaide'):
+            self.assertEqual(restored.fingerprint, restored.compute_fingerprint())
+
+    def test_restore_refuses_non_empty_account_unless_replacing(self):
+        with self.assertRaises(BackupError):
+            restore_user(self.backup(), self.user)
+        with mock.patch('budgetapp.models.schedule_aggregate_job') as schedule, \
+                self.captureOnCommitCallbacks(execute=True):
+            restore_user(self.backup(), self.user, replace=True, rebuild=True)
+        budget = Budget.objects.get(user=self.user)
+        self.assertEqual(sorted(call.args[0] for call in schedule.call_args_list), ['budget', 'income'])
+        self.assertEqual(budget.transactions.count(), 4)
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/source.ndjson.gz'
+            call_command('backup_user', 'source', output=path, stdout=mock.MagicMock())
+            call_command('restore_user', path, user='copy', stdout=mock.MagicMock())
+        copy = User.objects.get(username='copy')
+        self.assertFalse(copy.has_usable_password())
+        self.assertEqual(Transaction.objects.filter(user=copy).count(), 4)
+
+
+class FindDuplicatesTests(TestCase):
+    def test_backfills_and_reports_copies_without_deleting(self):
+        user = User.objects.create_user('dupes', password='pw')
+        budget = Budget.objects.create(user=user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+        day = aware(timezone.localdate())
+        # Rows from before fingerprints existed
+        Transaction.objects.bulk_create([
+            Transaction(user=user, budget=budget, amount=Decimal('3.00'), description=description, date=day,
+                        day=timezone.localdate())
+            for description in ('Coffee', 'coffee!', 'Coffee', 'Tea')
+        ])
+        out = io.StringIO()
+        call_command('find_duplicates', backfill=True, chunk_size=2, stdout=out)
+        self.assertIn("3 copies", out.getvalue())
+        self.assertIn("1 duplicated transactions, 2 extra rows.", out.getvalue())
+        self.assertEqual(budget.transactions.count(), 4)
+        self.assertFalse(budget.transactions.filter(fingerprint='').exists())
+
+
+class RecomputeBudgetHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('history', password='pw')
+        self.budgets = [
+            Budget.objects.create(user=self.user, category=category, amount=Decimal('80.00'), frequency='weekly')
+            for category in ('Food', 'Fuel')
+        ]
+        today = timezone.localdate()
+        for budget in self.budgets:
+            Transaction.objects.bulk_create(set_derived_fields([
+                Transaction(user=self.user, budget=budget, amount=Decimal('9.00'), description='t',
+                            date=aware(today - timedelta(days=5 * i)))
+                for i in range(6)
+            ]))
+            update_budget_aggregates(budget)
+
+    def test_stale_budgets_roll_forward_from_reads_and_the_command(self):
+        stale, fresh = self.budgets
+        later = timezone.now() + timedelta(days=8)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            with mock.patch('budgetapp.models.rebucket_budget_periods') as rebucket:
+                info = stale.get_current_period_info()
+            rebucket.assert_called_once_with(stale)
+            self.assertEqual(info['start_date'], stale.get_current_period_start())
+
+            update_budget_aggregates(fresh)
+            out = io.StringIO()
+            call_command('recompute_budget_history', stale=True, stdout=out)
+            self.assertIn('for 1 budgets', out.getvalue())
+            self.assertTrue(stale.periods.filter(start_date=stale.get_current_period_start()).exists())
+
+    def recompute(self, **options):
+        out = io.StringIO()
+        call_command('recompute_budget_history', stdout=out, **options)
+        return out.getvalue()
+
+    def stored_periods(self):
+        return list(BudgetPeriod.objects.order_by('budget_id', 'start_date').values_list(
+            'budget_id', 'start_date', 'end_date', 'budget_amount', 'total_spent', 'difference', 'is_current',
+            'is_over_budget'))
+
+    def test_workers_store_the_same_periods_as_a_serial_run(self):
+        other = User.objects.create_user('history2', password='pw')
+        budget = Budget.objects.create(user=other, category='Rent', amount=Decimal('400.00'), frequency='fortnightly',
+                                       rollover=True)
+        Transaction.objects.bulk_create(set_derived_fields([
+            Transaction(user=other, budget=budget, amount=Decimal('150.00'), description='t',
+                        date=aware(timezone.localdate() - timedelta(days=9 * i)))
+            for i in range(8)
+        ]))
+        self.recompute()
+        serial = self.stored_periods()
+        BudgetPeriod.objects.all().delete()
+
+        class InlineExecutor:
+            """Runs submitted shards in this process, where the test database is visible."""
+            shards = []
+
+            def __init__(self, max_workers, initializer):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def submit(self, func, budget_ids):
+                self.shards.append(budget_ids)
+                future = Future()
+                future.set_result(func(budget_ids))
+                return future
+
+        with mock.patch.object(recompute_command, 'ProcessPoolExecutor', InlineExecutor):
+            self.assertIn('2 worker(s)', self.recompute(workers=2))
+        self.assertEqual(self.stored_periods(), serial)
+        # One shard per user
+        self.assertEqual(sorted(InlineExecutor.shards), [[b.pk for b in self.budgets], [budget.pk]])
+
+    def test_users_and_since_select_budgets(self):
+        other = User.objects.create_user('history2', password='pw')
+        Budget.objects.create(user=other, category='Rent', amount=Decimal('400.00'), frequency='weekly')
+        self.assertIn('for 2 budgets', self.recompute(users='history'))
+        self.assertIn('for 3 budgets', self.recompute(users=f'history,{other.pk}'))
+
+        # Near midnight in Auckland, the owner's day is a day ahead of the server's
+        since = timezone.localdate() + timedelta(days=10)
+        UserProfile.objects.filter(user=self.user).update(timezone='Pacific/Auckland')
+        with timezone.override('Pacific/Auckland'):
+            Transaction.objects.bulk_create(set_derived_fields([
+                Transaction(user=self.user, budget=self.budgets[0], amount=Decimal('5.00'), description='late',
+                            date=aware(since)),
+                Transaction(user=self.user, budget=self.budgets[1], amount=Decimal('5.00'), description='early',
+                            date=aware(since - timedelta(days=1))),
+            ]))
+        self.assertLess(timezone.localtime(self.budgets[0].transactions.get(description='late').date).date(), since)
+        with mock.patch.object(recompute_command, 'recompute_budgets', wraps=recompute_command.recompute_budgets) as run:
+            self.assertIn('for 1 budgets', self.recompute(since=since.isoformat()))
+        run.assert_called_once_with([self.budgets[0].pk])
+
+
+class RecurringGenerationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('recurring', password='pw')
+        self.budget = Budget.objects.create(user=self.user, category='Bills', amount=Decimal('200.00'), frequency='monthly')
+        self.today = timezone.localdate()
+
+    def add_rule(self, **kwargs):
+        defaults = {'budget': self.budget, 'amount': Decimal('5.00'), 'description': 'Coffee', 'frequency': 'daily',
+                    'start_date': self.today - timedelta(days=29)}
+        defaults.update(kwargs)
+        return RecurringTransaction.objects.create(user=self.user, **defaults)
+
+    def test_backlog_is_bulk_inserted_with_one_refresh_per_budget(self):
+        daily = self.add_rule()
+        weekly = self.add_rule(frequency='weekly', description='Rent')
+        with mock.patch('budgetapp.recurring.update_budget_aggregates_async') as refresh:
+            # Including one fingerprint lookup for the whole batch
+            with self.assertNumQueries(10):
+                stats = generate_recurring_transactions(today=self.today)
+        refresh.assert_called_once()
+        self.assertEqual(stats, {'rules': 2, 'created': 35, 'budgets': 1})
+        daily.refresh_from_db()
+        weekly.refresh_from_db()
+        self.assertEqual(daily.last_generated, self.today)
+        self.assertEqual(weekly.last_generated, self.today - timedelta(days=1))
+        self.assertEqual(daily.transactions.count(), 30)
+
+        with mock.patch('budgetapp.recurring.update_budget_aggregates_async') as refresh:
+            self.assertEqual(generate_recurring_transactions(today=self.today)['created'], 0)
+        refresh.assert_not_called()
+
+    def test_skips_existing_and_deactivates_expired_rules(self):
+        rule = self.add_rule(end_date=self.today - timedelta(days=20))
+        Transaction.objects.create(user=self.user, budget=self.budget, amount=Decimal('5.00'), description='Coffee',
+                                   date=aware(rule.start_date), recurring_transaction=rule)
+        generate_recurring_transactions(today=self.today)
+        rule.refresh_from_db()
+        self.assertFalse(rule.active)
+        self.assertEqual(rule.last_generated, rule.end_date)
+        self.assertEqual(rule.transactions.count(), 10)
+
+    def test_duplicates_are_impossible(self):
+        rule = self.add_rule()
+        stale = RecurringTransaction.objects.select_related('budget').get(pk=rule.pk)
+        generate_for_rules([RecurringTransaction.objects.select_related('budget').get(pk=rule.pk)], self.today)
+        # A second worker holding an out-of-date copy of the rule inserts nothing new
+        generate_for_rules([stale], self.today)
+        self.assertEqual(rule.transactions.count(), 30)
+        # Even at another midnight for the same day, as a generator in a different timezone would store
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Transaction.objects.bulk_create(set_derived_fields([Transaction(
+                user=self.user, budget=self.budget, amount=Decimal('5.00'), description='dup',
+                date=aware(self.today) + timedelta(hours=3), recurring_transaction=rule)]))
+
+    def test_rules_are_generated_in_the_owners_timezone(self):
+        UserProfile.objects.filter(user=self.user).update(timezone='Pacific/Kiritimati')
+        with timezone.override('Pacific/Kiritimati'):
+            today = timezone.localdate()
+        rule = self.add_rule(start_date=today - timedelta(days=2))
+        generate_recurring_transactions()
+        generated = list(rule.transactions.order_by('day'))
+        self.assertEqual([t.day for t in generated], [today - timedelta(days=i) for i in (2, 1, 0)])
+        with timezone.override('Pacific/Kiritimati'):
+            self.assertEqual({timezone.localtime(t.date).time() for t in generated}, {datetime.min.time()})
+
+    def test_bills_already_entered_by_hand_are_not_generated(self):
+        rule = self.add_rule(frequency='weekly', description='Rent', amount=Decimal('400.00'),
+                             start_date=self.today - timedelta(days=7))
+        Transaction.objects.create(user=self.user, budget=self.budget, amount=Decimal('400.00'), description='rent',
+                                   date=aware(rule.start_date))
+        generate_recurring_transactions(today=self.today)
+        self.assertEqual(list(rule.transactions.values_list('description', flat=True)), ['Rent (Recurring)'])
+        self.assertEqual(self.budget.transactions.count(), 2)
+
+    def test_claimed_rules_are_skipped_until_lease_expires(self):
+        rule = self.add_rule()
+        rules = RecurringTransaction.objects.filter(active=True)
+        claimed, last_pk = claim_rules(rules)
+        self.assertEqual((claimed, last_pk), ([rule], rule.pk))
+        self.assertEqual(claim_rules(rules), ([], None))
+        self.assertEqual(generate_recurring_transactions(today=self.today)['rules'], 0)
+        RecurringTransaction.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(generate_recurring_transactions(today=self.today)['created'], 30)
+
+
+@override_settings(AGGREGATE_WORKERS=0)
+class DataVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('versions', password='pw')
+        self.budget = Budget.objects.create(user=self.user, category='Food', amount=Decimal('100.00'), frequency='weekly')
+
+    def test_changes_bump_version_on_commit(self):
+        key = user_cache_key(self.user.id, 'dashboard_data')
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction = Transaction.objects.create(user=self.user, budget=self.budget, amount=Decimal('5.00'),
+                                                     description='t', date=aware(timezone.localdate()))
+            # Nothing changes for readers until the write is committed
+            self.assertEqual(user_cache_key(self.user.id, 'dashboard_data'), key)
+        self.assertNotEqual(user_cache_key(self.user.id, 'dashboard_data'), key)
+
+        version = get_data_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.delete()
+        self.assertGreater(get_data_version(self.user.id), version)
+
+    def test_aggregate_rebuild_and_bulk_generation_bump_version(self):
+        version = get_data_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            update_budget_aggregates(self.budget)
+        self.assertGreater(get_data_version(self.user.id), version)
+
+        version = get_data_version(self.user.id)
+        RecurringTransaction.objects.bulk_create([RecurringTransaction(
+            user=self.user, budget=self.budget, amount=Decimal('2.00'), description='r', frequency='weekly',
+            start_date=timezone.localdate())])
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_recurring_transactions()
+        self.assertGreater(get_data_version(self.user.id), version)
+
+    def test_other_users_keep_their_cache(self):
+        other = User.objects.create_user('other', password='pw')
+        key = user_cache_key(other.id, 'dashboard_data')
+        with self.captureOnCommitCallbacks(execute=True):
+            Budget.objects.create(user=self.user, category='Fuel', amount=Decimal('40.00'), frequency='weekly')
+        self.assertEqual(user_cache_key(other.id, 'dashboard_data'), key)
+
+
+class CacheRefreshTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        page_cache.get_local_cache().clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_stale_value_served_while_another_request_refreshes(self):
+        self.assertEqual(get_or_compute('page', self.compute, timeout=60), 1)
+        later = time.time() + 120
+        with mock.patch('budgetapp.cache.time.time', return_value=later):
+            cache.add('page_lock', 1)
+            self.assertEqual(get_or_compute('page', self.compute, timeout=60), 1)
+            self.assertEqual(self.calls, 1)
+            cache.delete('page_lock')
+            self.assertEqual(get_or_compute('page', self.compute, timeout=60), 2)
+        self.assertIsNone(cache.get('page_lock'))
+
+    def test_early_expiry_is_probabilistic(self):
+        page_cache.set_cached('page', 'cached', timeout=60, delta=5.0)
+        # log(1 - 0) = 0: never early
+        with mock.patch('budgetapp.cache.random.random', return_value=0.0):
+            self.assertEqual(get_or_compute('page', self.compute), 'cached')
+        # A draw close to 1 pushes the effective clock past expiry
+        with mock.patch('budgetapp.cache.random.random', return_value=1 - 1e-9):
+            self.assertEqual(get_or_compute('page', self.compute), 1)
+
+    @mock.patch('budgetapp.cache.LOCK_WAIT', 0.1)
+    def test_miss_waits_for_lock_then_computes(self):
+        cache.add('page_lock', 1)
+        self.assertEqual(get_or_compute('page', self.compute), 1)
+        self.assertEqual(get_cached('page'), 1)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}):
+            self.assertEqual(get_or_compute('page', self.compute), 1)
+            page_cache.get_local_cache().clear()
+            self.assertEqual(get_or_compute('page', self.compute), 1)
+            self.assertIsNone(cache.get('page_lock'))
+
+    def test_backend_errors_degrade_to_uncached(self):
+        user = User.objects.create_user('outage', password='pw')
+        broken = mock.Mock(side_effect=OSError('read-only file system'))
+        with mock.patch.multiple(page_cache.cache, get=broken, set=broken, add=broken, incr=broken), \
+                self.assertLogs('budgetapp.cache', 'WARNING'):
+            first = get_data_version(user.id)
+            self.assertIsNone(page_cache.bump_data_version(user.id))
+            self.assertNotEqual(get_data_version(user.id), first)
+            self.assertEqual(get_or_compute('page', self.compute), 1)
+            page_cache.get_local_cache().clear()
+            self.assertEqual(get_or_compute('page', self.compute), 2)
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        page_cache.get_local_cache().clear()
+
+    def test_local_tier_answers_without_shared_cache(self):
+        page_cache.set_cached('page', {'a': 1})
+        before = page_cache.cache_stats()
+        with mock.patch.object(page_cache.cache, 'get') as shared_get:
+            self.assertEqual(get_cached('page'), {'a': 1})
+        shared_get.assert_not_called()
+        after = page_cache.cache_stats()
+        self.assertEqual(after['local']['hits'], before['local']['hits'] + 1)
+
+        # Another worker's process only has the shared copy
+        page_cache.get_local_cache().clear()
+        self.assertEqual(get_cached('page'), {'a': 1})
+        self.assertEqual(page_cache.cache_stats()['shared']['hits'], after['shared']['hits'] + 1)
+
+    def test_version_bump_in_another_worker_reaches_this_one(self):
+        user = User.objects.create_user('tiers', password='pw')
+        key = user_cache_key(user.id, 'dashboard_data')
+        page_cache.set_cached(key, 'old')
+        # Simulate the bump arriving from another process via the shared cache
+        cache.incr(f'data_version_{user.id}')
+        self.assertIsNone(get_cached(user_cache_key(user.id, 'dashboard_data')))
+
+    def test_local_tier_is_bounded(self):
+        local = page_cache.LocalCache(max_entries=2, timeout=60)
+        for key in 'abc':
+            local.set(key, key)
+        self.assertEqual(len(local), 2)
+        self.assertIsNone(local.get('a'))
+        expired = page_cache.LocalCache(max_entries=2, timeout=0)
+        expired.set('a', 'a')
+        self.assertIsNone(expired.get('a'))
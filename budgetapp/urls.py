@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
@@ -12,6 +12,8 @@ urlpatterns = [
     # Budget URLs
     path('budget/create/', views.budget_create, name='budget_create'),
     path('budget/<int:pk>/', views.budget_detail, name='budget_detail'),
+    path('budget/<int:pk>/transactions/', views.budget_transactions, name='budget_transactions'),
+    path('budget/<int:pk>/periods/', views.budget_periods, name='budget_periods'),
     path('budget/<int:pk>/edit/', views.budget_edit, name='budget_edit'),
     path('budget/<int:pk>/delete/', views.budget_delete, name='budget_delete'),
     
@@ -40,4 +42,20 @@ urlpatterns = [
     path('recurring/<int:pk>/edit/', views.recurring_transaction_edit, name='recurring_transaction_edit'),
     path('recurring/<int:pk>/delete/', views.recurring_transaction_delete, name='recurring_transaction_delete'),
     path('recurring/<int:pk>/toggle/', views.recurring_transaction_toggle, name='recurring_transaction_toggle'),
+
+    # Statement import and export URLs
+    path('import/', views.import_transactions, name='import_transactions'),
+    path('import/rules/create/', views.import_rule_create, name='import_rule_create'),
+    path('import/rules/<int:pk>/delete/', views.import_rule_delete, name='import_rule_delete'),
+    path('export/', views.export_transactions, name='export_transactions'),
+
+    # JSON API
+    path('api/dashboard/', api.dashboard, name='api_dashboard'),
+    path('api/budgets/<int:pk>/', api.budget_current_period, name='api_budget'),
+    path('api/budgets/<int:pk>/periods/', api.budget_periods, name='api_budget_periods'),
+    path('api/transactions/', api.transactions, name='api_transactions'),
+    path('api/transactions/batch/', api.transactions_batch, name='api_transactions_batch'),
+
+    # Monitoring URLs
+    path('ops/worker-stats/', views.worker_stats, name='worker_stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Compact view models for cached pages.
+
+Cached pages used to hold model instances, prefetch caches and lazy
+querysets, which are slow to pickle and can query again when the template
+renders. The classes here hold only the fields the templates read; they use
+``__slots__`` and pickle as a class reference plus a tuple of values.
+"""
+import hashlib
+import pickle
+from decimal import Decimal
+
+from django.db.models import Prefetch, Q, Sum
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .cache import get_fragments, set_fragments
+from .models import Budget, Income, IncomeTransaction, Transaction, get_current_period_infos
+
+
+class ViewModel:
+    """Base for slotted records built positionally or by keyword."""
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        for name, value in zip(self.__slots__, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.__reduce__() == other.__reduce__()
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{self.__class__.__name__}({values})'
+
+
+def fingerprint(value):
+    """Stable hash of a view model (or list of them), used to key fragments rendered from it."""
+    return hashlib.blake2b(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), digest_size=16).hexdigest()
+
+
+class BudgetSummary(ViewModel):
+    __slots__ = ('id', 'category', 'amount', 'frequency_display', 'total_spent', 'avg_weekly_spent',
+                 'rollover', 'rollover_max')
+
+    @classmethod
+    def from_budget(cls, budget):
+        return cls(budget.pk, budget.category, budget.amount, budget.get_frequency_display(), budget.total_spent,
+                   budget.avg_weekly_spent, budget.rollover, budget.rollover_max)
+
+
+class BudgetCard(ViewModel):
+    __slots__ = ('budget', 'balance', 'spent', 'weekly_amount', 'weekly_spent', 'percentage')
+
+
+class IncomeSummary(ViewModel):
+    __slots__ = ('id', 'source', 'amount', 'frequency_display', 'total_income', 'avg_30d', 'avg_90d', 'is_variable')
+
+    @classmethod
+    def from_income(cls, income):
+        return cls(income.pk, income.source, income.amount, income.get_frequency_display(), income.total_income,
+                   income.avg_30d, income.avg_90d, income.is_variable)
+
+
+class VariableIncomeCard(ViewModel):
+    __slots__ = ('income', 'recent_transactions', 'actual_period_amount', 'expected_amount', 'difference')
+
+
+class TransactionRow(ViewModel):
+    __slots__ = ('id', 'date', 'description', 'amount', 'budget_id', 'budget_category')
+
+    fields = ('id', 'date', 'description', 'amount', 'budget_id', 'budget__category')
+
+
+class IncomeTransactionRow(ViewModel):
+    __slots__ = ('id', 'date', 'description', 'amount', 'income_id', 'income_source')
+
+    fields = ('id', 'date', 'description', 'amount', 'income_id', 'income__source')
+
+    @classmethod
+    def from_transaction(cls, transaction, income):
+        return cls(transaction.pk, transaction.date, transaction.description, transaction.amount,
+                   income.id, income.source)
+
+
+def build_dashboard_data(user):
+    """Assemble the dashboard context for ``user`` in a fixed number of queries."""
+    budgets = list(Budget.objects.filter(user=user))
+    period_infos = get_current_period_infos(budgets)
+    # Income figures come from filtered aggregates rather than per-income queries
+    today = timezone.localdate()
+    incomes = list(Income.objects.filter(user=user).annotate(
+        recent_total=Sum('income_transactions__amount',
+                         filter=Q(income_transactions__day__gt=today - timezone.timedelta(days=60))),
+        period_total=Sum('income_transactions__amount', filter=Income.current_period_filter()),
+    ).prefetch_related(Prefetch(
+        'income_transactions',
+        queryset=IncomeTransaction.objects.filter(
+            income__is_variable=True, day__gt=today - timezone.timedelta(days=30)
+        ).order_by('-date')[:5],
+        to_attr='recent_transactions',
+    )))
+
+    budget_data = []
+    total_budget = 0
+    total_spent = 0
+    remaining_budget = 0
+    weekly_budgeted = 0
+    weekly_spent = 0
+
+    for budget in budgets:
+        period_info = period_infos[budget.pk]
+        weekly_amount = budget.get_weekly_amount()
+        # Use precomputed fields
+        avg_weekly_spent = budget.avg_weekly_spent
+        budget_data.append(BudgetCard(
+            budget=BudgetSummary.from_budget(budget),
+            balance=period_info['balance'],
+            spent=period_info['total_spent'],
+            weekly_amount=weekly_amount,
+            weekly_spent=avg_weekly_spent,
+            percentage=(period_info['balance'] / period_info['budget_amount']) * Decimal('100') if period_info['budget_amount'] > 0 else Decimal('0'),
+        ))
+        total_budget += budget.amount
+        remaining_budget += period_info['balance']
+        total_spent += period_info['total_spent']
+        weekly_budgeted += weekly_amount
+        weekly_spent += avg_weekly_spent
+
+    total_weekly_income = sum(income.get_weekly_amount(income.recent_total) for income in incomes)
+
+    income_summaries = []
+    variable_income_data = []
+    for income in incomes:
+        summary = IncomeSummary.from_income(income)
+        income_summaries.append(summary)
+        if not income.is_variable:
+            continue
+        actual_period_amount = income.get_current_period_actual_income(income.period_total)
+        variable_income_data.append(VariableIncomeCard(
+            income=summary,
+            recent_transactions=[IncomeTransactionRow.from_transaction(t, income) for t in income.recent_transactions],
+            actual_period_amount=actual_period_amount,
+            expected_amount=income.amount,
+            difference=actual_period_amount - income.amount,
+        ))
+
+    recent_transactions = Transaction.objects.filter(user=user).order_by('-date').values_list(*TransactionRow.fields)[:10]
+    recent_income_transactions = IncomeTransaction.objects.filter(user=user).order_by('-date').values_list(
+        *IncomeTransactionRow.fields)[:5]
+
+    return {
+        'budget_data': budget_data,
+        'total_budget': total_budget,
+        'remaining_budget': remaining_budget,
+        'weekly_budgeted': weekly_budgeted,
+        'weekly_spent': weekly_spent,
+        'income_remaining_after_budgets': total_weekly_income - weekly_budgeted,
+        'income_remaining_after_spend': total_weekly_income - weekly_spent,
+        'total_weekly_income': total_weekly_income,
+        'total_monthly_income': total_weekly_income * Decimal('52') / Decimal('12'),
+        'total_yearly_income': total_weekly_income * Decimal('52'),
+        'recent_transactions': [TransactionRow(*row) for row in recent_transactions],
+        'incomes': income_summaries,
+        'variable_income_data': variable_income_data,
+        'recent_income_transactions': [IncomeTransactionRow(*row) for row in recent_income_transactions],
+        'has_variable_income': bool(variable_income_data),
+    }
+
+
+def render_fragments(template_name, name, items):
+    """
+    Render ``template_name`` once per item (available to it as ``name``).
+
+    Fragments are cached by template, timezone and a fingerprint of the item,
+    so only items whose content changed are rendered again.
+    """
+    prefix = f"fragment_{template_name.rsplit('/', 1)[-1].removesuffix('.html')}_{timezone.get_current_timezone_name()}"
+    keys = [f'{prefix}_{fingerprint(item)}' for item in items]
+    fragments = get_fragments(keys)
+    rendered = {}
+    for key, item in zip(keys, items):
+        if key not in fragments and key not in rendered:
+            rendered[key] = get_template(template_name).render({name: item})
+    if rendered:
+        set_fragments(rendered)
+        fragments.update(rendered)
+    return [mark_safe(fragments[key]) for key in keys]
+
+
+def render_dashboard_fragments(data):
+    """The separately cached pieces of the dashboard for a ``build_dashboard_data`` payload."""
+    [recent_transactions] = render_fragments('budgetapp/fragments/recent_transactions.html',
+                                             'recent_transactions', [data['recent_transactions']])
+    [recent_income_transactions] = render_fragments('budgetapp/fragments/recent_income_transactions.html',
+                                                    'recent_income_transactions', [data['recent_income_transactions']])
+    return {
+        'budget_cards': render_fragments('budgetapp/fragments/budget_card.html', 'budget_item', data['budget_data']),
+        'income_rows': render_fragments('budgetapp/fragments/income_row.html', 'income', data['incomes']),
+        'recent_transactions_html': recent_transactions,
+        'recent_income_transactions_html': recent_income_transactions,
+    }
@@ -1,57 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login, authenticate, update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Sum, Prefetch
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.utils import timezone
-from django.core.cache import cache
-from django.views.decorators.cache import cache_page
 from decimal import Decimal
+import hashlib
+import io
+import time
 from .forms import (
     UserRegistrationForm, BudgetForm, IncomeForm, TransactionForm, 
-    RecurringTransactionForm, IncomeTransactionForm, UserSettingsForm, ProfileSettingsForm
+    RecurringTransactionForm, IncomeTransactionForm, UserSettingsForm, ProfileSettingsForm,
+    StatementImportForm, ImportRuleForm, TransactionExportForm
 )
-from .models import Budget, Income, Transaction, RecurringTransaction, IncomeTransaction, UserProfile
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-
-# Cache utility functions
-def clear_user_cache(user):
-    """Clear all cache keys related to a user"""
-    # Clear dashboard cache
-    cache.delete(f'dashboard_data_{user.id}')
-
-def clear_budget_cache(budget):
-    """Clear cache for a specific budget"""
-    cache.delete(f'budget_detail_{budget.id}')
-    clear_user_cache(budget.user)
-
-def clear_income_cache(income):
-    """Clear cache for a specific income"""
-    cache.delete(f'income_detail_{income.id}')
-    clear_user_cache(income.user)
-
-# Utility functions for cache management
-def clear_transaction_cache(transaction):
-    """Clear cache when a transaction is changed"""
-    # Clear budget-specific caches
-    cache.delete(f'budget_detail_{transaction.budget.id}')
-    # Clear dashboard cache for this user
-    cache.delete(f'dashboard_data_{transaction.user.id}')
-
-def clear_income_transaction_cache(income_transaction):
-    """Clear cache when an income transaction is changed"""
-    # Clear income-specific caches
-    cache.delete(f'income_detail_{income_transaction.income.id}')
-    # Clear dashboard cache for this user
-    cache.delete(f'dashboard_data_{income_transaction.user.id}')
-
-def clear_recurring_transaction_cache(recurring_transaction):
-    """Clear cache when a recurring transaction is changed"""
-    # Clear budget-specific caches
-    cache.delete(f'budget_detail_{recurring_transaction.budget.id}')
-    # Clear dashboard cache for this user
-    cache.delete(f'dashboard_data_{recurring_transaction.user.id}')
+from .models import (
+    Budget, Income, Transaction, RecurringTransaction, IncomeTransaction, UserProfile, ImportRule
+)
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from .exporters import CONTENT_TYPES, export_lines, export_queryset
+from .importers import StatementError, detect_format, import_file
+from .cache import cache_stats, get_data_version, get_or_compute, user_cache_key
+from .pagination import KeysetPaginator
+from .tasks import worker_stats as aggregate_worker_stats
+from .viewmodels import build_dashboard_data, render_dashboard_fragments
 
 # Add a utility function to create user profile if it doesn't exist
 def get_or_create_profile(user):
@@ -61,6 +35,34 @@ def get_or_create_profile(user):
     except UserProfile.DoesNotExist:
         return UserProfile.objects.create(user=user)
 
+DEPLOY_VERSION = settings.DEPLOY_VERSION or str(int(time.time()))
+
+def user_data_etag(request, *args, **kwargs):
+    """
+    Weak ETag for pages built only from the user's own data.
+
+    Costs no queries: the user's data version lives in the cache. The local
+    date and timezone are included because current periods depend on them.
+    Pages embed a CSRF token, which logging in rotates, so the session and
+    CSRF secret count too (hashed), along with the deploy the markup came
+    from. Pages with pending messages are never validated, so the message shows.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    version = get_data_version(request.user.id)
+    session = f"{request.META.get('CSRF_COOKIE', '')}|{request.session.session_key}|{DEPLOY_VERSION}"
+    session = hashlib.blake2b(session.encode(), digest_size=8).hexdigest()
+    return (f'W/"{request.user.id}-{version}-{timezone.localdate():%Y%m%d}-{timezone.get_current_timezone_name()}'
+            f'-{session}"')
+
+def page_json(page, fields):
+    """A keyset page as JSON-ready data; dates become ISO strings and decimals strings."""
+    return {
+        'results': [{field: getattr(obj, field) for field in fields} for obj in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+
 def register(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST)
@@ -92,9 +94,6 @@ def user_settings(request):
                 profile_form.save()
                 messages.success(request, "Your profile has been updated successfully!")
                 
-                # Clear cache to reflect new settings
-                clear_user_cache(request.user)
-                
                 return redirect('user_settings')
             
         elif action == 'password':
@@ -126,86 +125,13 @@ def user_settings(request):
 
 # Dashboard view - main page
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
 def dashboard(request):
     user = request.user
-    cache_key = f'dashboard_data_{user.id}'
-    dashboard_data = cache.get(cache_key)
-    
-    if dashboard_data is None:
-        # Prefetch related data to reduce queries
-        budgets = Budget.objects.filter(user=user).prefetch_related(
-            Prefetch('transactions', queryset=Transaction.objects.select_related('recurring_transaction'))
-        )
-        incomes = Income.objects.filter(user=user).prefetch_related('income_transactions')
-        process_recurring_transactions(user)
-        
-        budget_data = []
-        total_budget = 0
-        total_spent = 0
-        remaining_budget = 0
-        weekly_budgeted = 0
-        weekly_spent = 0
-        
-        for budget in budgets:
-            period_info = budget.get_current_period_info()
-            weekly_amount = budget.get_weekly_amount()
-            # Use precomputed fields
-            avg_weekly_spent = budget.avg_weekly_spent
-            budget_data.append({
-                'budget': budget,
-                'balance': period_info['balance'],
-                'spent': period_info['total_spent'],
-                'weekly_amount': weekly_amount,
-                'weekly_spent': avg_weekly_spent,
-                'percentage': (period_info['balance'] / period_info['budget_amount']) * Decimal('100') if period_info['budget_amount'] > 0 else Decimal('0')
-            })
-            total_budget += budget.amount
-            remaining_budget += period_info['balance']
-            total_spent += period_info['total_spent']
-            weekly_budgeted += weekly_amount
-            weekly_spent += avg_weekly_spent
-        
-        total_weekly_income = sum(income.get_weekly_amount() for income in incomes)
-        total_monthly_income = total_weekly_income * Decimal('52') / Decimal('12')
-        total_yearly_income = total_weekly_income * Decimal('52')
-        
-        variable_incomes = [income for income in incomes if income.is_variable]
-        variable_income_data = []
-        for income in variable_incomes:
-            recent_period = timezone.now() - timezone.timedelta(days=30)
-            income_transactions = income.income_transactions.filter(date__gte=recent_period).order_by('-date')
-            variable_income_data.append({
-                'income': income,
-                'recent_transactions': income_transactions[:5],
-                'actual_period_amount': income.get_current_period_actual_income(),
-                'expected_amount': income.amount,
-                'difference': income.get_current_period_actual_income() - income.amount
-            })
-        
-        recent_transactions = Transaction.objects.filter(user=user).select_related('budget').order_by('-date')[:10]
-        recent_income_transactions = IncomeTransaction.objects.filter(user=user).select_related('income').order_by('-date')[:5]
-        recurring_transactions = RecurringTransaction.objects.filter(user=user, active=True).select_related('budget').order_by('start_date')
-        
-        dashboard_data = {
-            'budget_data': budget_data,
-            'total_budget': total_budget,
-            'remaining_budget': remaining_budget,
-            'weekly_budgeted': weekly_budgeted,
-            'weekly_spent': weekly_spent,
-            'income_remaining_after_budgets': total_weekly_income - weekly_budgeted,
-            'income_remaining_after_spend': total_weekly_income - weekly_spent,
-            'total_weekly_income': total_weekly_income,
-            'total_monthly_income': total_monthly_income,
-            'total_yearly_income': total_yearly_income,
-            'recent_transactions': recent_transactions,
-            'incomes': incomes,
-            'recurring_transactions': recurring_transactions,
-            'variable_income_data': variable_income_data,
-            'recent_income_transactions': recent_income_transactions,
-            'has_variable_income': any(income.is_variable for income in incomes),
-        }
-        cache.set(cache_key, dashboard_data, 300)
-    return render(request, 'budgetapp/dashboard.html', dashboard_data)
+    dashboard_data = get_or_compute(user_cache_key(user.id, 'dashboard_data'), lambda: build_dashboard_data(user))
+    context = dict(dashboard_data, **render_dashboard_fragments(dashboard_data))
+    return render(request, 'budgetapp/dashboard.html', context)
 
 @login_required
 def budget_create(request):
@@ -216,9 +142,6 @@ def budget_create(request):
             budget.user = request.user
             budget.save()
             
-            # Clear user cache when budget is created
-            clear_user_cache(request.user)
-            
             messages.success(request, "Budget created successfully!")
             return redirect('dashboard')
     else:
@@ -235,9 +158,6 @@ def budget_edit(request, pk):
         if form.is_valid():
             updated_budget = form.save()
             
-            # Clear cache when budget is updated
-            clear_budget_cache(updated_budget)
-            
             messages.success(request, "Budget updated successfully!")
             return redirect('dashboard')
     else:
@@ -250,52 +170,60 @@ def budget_delete(request, pk):
     budget = get_object_or_404(Budget, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        # Clear cache before deleting the budget
-        clear_budget_cache(budget)
-        
         budget.delete()
         messages.success(request, "Budget deleted successfully!")
         return redirect('dashboard')
         
     return render(request, 'budgetapp/budget_confirm_delete.html', {'budget': budget})
 
+def budget_transaction_paginator(budget):
+    return KeysetPaginator(budget.transactions.all(), ('-date', '-id'))
+
+def budget_period_paginator(budget):
+    return KeysetPaginator(budget.periods.all(), ('-start_date', '-id'))
+
 # Budget detail view with caching
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
 def budget_detail(request, pk):
     budget = get_object_or_404(Budget, pk=pk, user=request.user)
-    transactions_page = request.GET.get('transactions_page', 1)
-    periods_page = request.GET.get('periods_page', 1)
-    # Use BudgetPeriod queryset instead of JSONField
-    all_historical_periods = budget.periods.all().order_by('-start_date')
-    transactions = budget.transactions.select_related('recurring_transaction').order_by('-date')
     period_info = budget.get_current_period_info()
-    transactions_paginator = Paginator(transactions, 10)
-    try:
-        paginated_transactions = transactions_paginator.page(transactions_page)
-    except PageNotAnInteger:
-        paginated_transactions = transactions_paginator.page(1)
-    except EmptyPage:
-        paginated_transactions = transactions_paginator.page(transactions_paginator.num_pages)
-    periods_paginator = Paginator(all_historical_periods, 10)
-    try:
-        paginated_periods = periods_paginator.page(periods_page)
-    except PageNotAnInteger:
-        paginated_periods = periods_paginator.page(1)
-    except EmptyPage:
-        paginated_periods = periods_paginator.page(periods_paginator.num_pages)
+    # The chart shows the most recent periods, oldest first
+    chart_periods = list(budget.periods.order_by('-start_date')[:8])[::-1]
     context = {
         'budget': budget,
-        'transactions': paginated_transactions,
+        'transactions': budget_transaction_paginator(budget).page_from_request(request, 'transactions'),
         'balance': period_info['balance'],
         'spent': period_info['total_spent'],
         'percentage': (period_info['balance'] / period_info['budget_amount']) * Decimal('100') if period_info['budget_amount'] > 0 else Decimal('0'),
-        'historical_periods': paginated_periods,
-        'all_historical_periods': all_historical_periods,
-        'periods_page': int(periods_page),
-        'transactions_page': int(transactions_page),
+        'historical_periods': budget_period_paginator(budget).page_from_request(request, 'periods'),
+        'chart_periods': chart_periods,
     }
     return render(request, 'budgetapp/budget_detail.html', context)
 
+# Single tables of the budget detail page, fetched by its pagination links
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
+def budget_transactions(request, pk):
+    budget = get_object_or_404(Budget.objects.only('id'), pk=pk, user=request.user)
+    page = budget_transaction_paginator(budget).page_from_request(request, 'transactions')
+    if request.GET.get('format') == 'json':
+        return JsonResponse(page_json(page, ('id', 'date', 'description', 'amount')))
+    return render(request, 'budgetapp/fragments/budget_transactions.html', {'budget': budget, 'transactions': page})
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
+def budget_periods(request, pk):
+    budget = get_object_or_404(Budget.objects.only('id'), pk=pk, user=request.user)
+    page = budget_period_paginator(budget).page_from_request(request, 'periods')
+    if request.GET.get('format') == 'json':
+        return JsonResponse(page_json(page, ('start_date', 'end_date', 'budget_amount', 'total_spent', 'difference',
+                                             'is_current', 'is_over_budget')))
+    return render(request, 'budgetapp/fragments/budget_periods.html', {'budget': budget, 'historical_periods': page})
+
 @login_required
 def income_create(request):
     if request.method == 'POST':
@@ -310,9 +238,6 @@ def income_create(request):
                 
             income.save()
             
-            # Clear user cache when income is created
-            clear_user_cache(request.user)
-            
             messages.success(request, "Income added successfully!")
             
             # Redirect to add income transaction if variable income
@@ -341,9 +266,6 @@ def income_edit(request, pk):
                 
             income.save()
             
-            # Clear cache when income is updated
-            clear_income_cache(income)
-            
             messages.success(request, "Income updated successfully!")
             return redirect('dashboard')
     else:
@@ -356,9 +278,6 @@ def income_delete(request, pk):
     income = get_object_or_404(Income, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        # Clear cache before deleting the income
-        clear_income_cache(income)
-        
         income.delete()
         messages.success(request, "Income deleted successfully!")
         return redirect('dashboard')
@@ -374,9 +293,6 @@ def transaction_create(request):
             transaction.user = request.user
             transaction.save()
             
-            # Clear cache when transaction is created
-            clear_transaction_cache(transaction)
-            
             messages.success(request, "Transaction recorded successfully!")
             return redirect('dashboard')
     else:
@@ -393,9 +309,6 @@ def transaction_edit(request, pk):
         if form.is_valid():
             updated_transaction = form.save()
             
-            # Clear cache when transaction is updated
-            clear_transaction_cache(updated_transaction)
-            
             messages.success(request, "Transaction updated successfully!")
             return redirect('budget_detail', pk=updated_transaction.budget.id)
     else:
@@ -409,9 +322,6 @@ def transaction_delete(request, pk):
     budget_id = transaction.budget.id
     
     if request.method == 'POST':
-        # Clear cache before deleting the transaction
-        clear_transaction_cache(transaction)
-        
         transaction.delete()
         messages.success(request, "Transaction deleted successfully!")
         return redirect('budget_detail', pk=budget_id)
@@ -429,9 +339,6 @@ def transaction_create_for_budget(request, budget_pk):
             transaction.user = request.user
             transaction.save()
             
-            # Clear cache when transaction is created
-            clear_transaction_cache(transaction)
-            
             messages.success(request, "Transaction recorded successfully!")
             return redirect('budget_detail', pk=budget.id)
     else:
@@ -459,9 +366,8 @@ def recurring_transaction_create(request):
             recurring_transaction = form.save(commit=False)
             recurring_transaction.user = request.user
             recurring_transaction.save()
-            
-            # Clear cache when recurring transaction is created
-            clear_recurring_transaction_cache(recurring_transaction)
+            # Catch up this rule now; the scheduled generate_recurring run handles the rest
+            recurring_transaction.generate_transactions()
             
             messages.success(request, "Recurring transaction created successfully!")
             return redirect('recurring_transaction_list')
@@ -478,9 +384,7 @@ def recurring_transaction_edit(request, pk):
         form = RecurringTransactionForm(request.user, request.POST, instance=recurring_transaction)
         if form.is_valid():
             updated_transaction = form.save()
-            
-            # Clear cache when recurring transaction is updated
-            clear_recurring_transaction_cache(updated_transaction)
+            updated_transaction.generate_transactions()
             
             messages.success(request, "Recurring transaction updated successfully!")
             return redirect('recurring_transaction_list')
@@ -494,9 +398,6 @@ def recurring_transaction_delete(request, pk):
     recurring_transaction = get_object_or_404(RecurringTransaction, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        # Clear cache before deleting the recurring transaction
-        clear_recurring_transaction_cache(recurring_transaction)
-        
         recurring_transaction.delete()
         messages.success(request, "Recurring transaction deleted successfully!")
         return redirect('recurring_transaction_list')
@@ -511,34 +412,93 @@ def recurring_transaction_toggle(request, pk):
     recurring_transaction.active = not recurring_transaction.active
     recurring_transaction.save()
     
-    # Clear cache when recurring transaction is toggled
-    clear_recurring_transaction_cache(recurring_transaction)
-    
     status = "activated" if recurring_transaction.active else "deactivated"
     messages.success(request, f"Recurring transaction {status} successfully!")
     
     return redirect('recurring_transaction_list')
 
-def process_recurring_transactions(user):
-    """Process all recurring transactions for a user"""
-    # Get all active recurring transactions in one query with related fields
-    recurring_transactions = RecurringTransaction.objects.filter(
-        user=user,
-        active=True
-    ).select_related('budget')
-    
-    # Get all existing recurring transactions for this user to avoid duplicate checks
-    existing_transactions = Transaction.objects.filter(
-        user=user,
-        recurring_transaction__isnull=False
-    ).values_list('recurring_transaction_id', 'date')
-    
-    # Create a set for faster lookups
-    existing_set = {(rt_id, date.date()) for rt_id, date in existing_transactions}
-    
-    # Process each recurring transaction
-    for recurring_transaction in recurring_transactions:
-        recurring_transaction.generate_transactions()
+@login_required
+def import_transactions(request):
+    if request.method == 'POST':
+        form = StatementImportForm(request.user, request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['statement']
+            try:
+                file_format = form.cleaned_data['format'] or detect_format(upload.name)
+                # Read the upload line by line rather than into memory
+                lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline='')
+                result = import_file(
+                    request.user, lines, file_format,
+                    date_format=form.cleaned_data['date_format'] or None,
+                    default_budget=getattr(form.cleaned_data['default_budget'], 'id', None),
+                    default_income=getattr(form.cleaned_data['default_income'], 'id', None),
+                )
+            except StatementError as e:
+                form.add_error('statement', str(e))
+            else:
+                messages.success(request, (
+                    f"Imported {result['transactions']} transactions and {result['income_transactions']} "
+                    f"income transactions from {result['rows']} rows ({result['skipped']} unmatched, "
+                    f"{result['duplicates']} already recorded)."
+                ))
+                for line, error in result['errors'][:10]:
+                    messages.warning(request, f"Line {line}: {error}")
+                if len(result['errors']) > 10:
+                    messages.warning(request, f"{len(result['errors']) - 10} more rows could not be read.")
+                return redirect('import_transactions')
+    else:
+        form = StatementImportForm(request.user)
+
+    context = {
+        'form': form,
+        'rule_form': ImportRuleForm(request.user),
+        'export_form': TransactionExportForm(request.user),
+        'rules': ImportRule.objects.filter(user=request.user).select_related('budget', 'income'),
+    }
+    return render(request, 'budgetapp/import_transactions.html', context)
+
+@login_required
+def import_rule_create(request):
+    if request.method == 'POST':
+        form = ImportRuleForm(request.user, request.POST)
+        if form.is_valid():
+            rule = form.save(commit=False)
+            rule.user = request.user
+            rule.save()
+            messages.success(request, "Import rule added successfully!")
+        else:
+            for error in form.errors.values():
+                messages.error(request, error.as_text().lstrip('* '))
+    return redirect('import_transactions')
+
+@login_required
+def import_rule_delete(request, pk):
+    rule = get_object_or_404(ImportRule, pk=pk, user=request.user)
+    if request.method == 'POST':
+        rule.delete()
+        messages.success(request, "Import rule deleted successfully!")
+    return redirect('import_transactions')
+
+@login_required
+def export_transactions(request):
+    """
+    Stream the user's transactions or income transactions as CSV or NDJSON.
+
+    Not gzipped: the compressor would hold rows back until it had a block to send.
+    """
+    form = TransactionExportForm(request.user, request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(' '.join(error for errors in form.errors.values() for error in errors))
+    options = form.cleaned_data
+    kind, file_format = options['kind'], options['format']
+    queryset = export_queryset(request.user, kind, options['start'], options['end'], options['budget'], options['income'])
+    # The body is generated after this view returns, so pin the user's timezone now
+    response = StreamingHttpResponse(
+        export_lines(queryset, kind, file_format, timezone.get_current_timezone()),
+        content_type=CONTENT_TYPES[file_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}-{timezone.localdate():%Y%m%d}.{file_format}"'
+    return response
 
 @login_required
 def income_transaction_create(request):
@@ -549,9 +509,6 @@ def income_transaction_create(request):
             income_transaction.user = request.user
             income_transaction.save()
             
-            # Clear cache when income transaction is created
-            clear_income_transaction_cache(income_transaction)
-            
             messages.success(request, "Income transaction recorded successfully!")
             return redirect('income_transaction_list')
     else:
@@ -568,9 +525,6 @@ def income_transaction_edit(request, pk):
         if form.is_valid():
             updated_transaction = form.save()
             
-            # Clear cache when income transaction is updated
-            clear_income_transaction_cache(updated_transaction)
-            
             messages.success(request, "Income transaction updated successfully!")
             return redirect('income_transaction_list')
     else:
@@ -584,9 +538,6 @@ def income_transaction_delete(request, pk):
     income_id = income_transaction.income.id
     
     if request.method == 'POST':
-        # Clear cache before deleting the income transaction
-        clear_income_transaction_cache(income_transaction)
-        
         income_transaction.delete()
         messages.success(request, "Income transaction deleted successfully!")
         return redirect('income_transaction_list')
@@ -604,9 +555,6 @@ def income_transaction_create_for_income(request, income_pk):
             income_transaction.user = request.user
             income_transaction.save()
             
-            # Clear cache when income transaction is created
-            clear_income_transaction_cache(income_transaction)
-            
             messages.success(request, "Income transaction recorded successfully!")
             return redirect('income_detail', pk=income.id)
     else:
@@ -641,33 +589,51 @@ def income_transaction_list(request):
     
     return render(request, 'budgetapp/income_transaction_list.html', context)
 
+def income_transaction_paginator(income):
+    return KeysetPaginator(IncomeTransaction.objects.filter(income=income), ('-date', '-id'), per_page=20)
+
+def income_detail_context(income):
+    income_transactions = IncomeTransaction.objects.filter(income=income)
+    current_period_income = income.get_current_period_actual_income()
+    expected_income = income.amount
+    difference = current_period_income - expected_income if income.is_variable else 0
+    first_page = income_transaction_paginator(income).page()
+    transaction_count = income_transactions.count()
+    # Use precomputed fields
+    return {
+        'income': income,
+        'income_transactions': first_page.object_list,
+        'transactions_page': first_page,
+        'current_period_income': current_period_income,
+        'expected_income': expected_income,
+        'difference': difference,
+        'difference_abs': abs(difference),
+        'avg_30d': income.avg_30d,
+        'avg_90d': income.avg_90d,
+        'total_income': income.total_income,
+        'transaction_count': transaction_count,
+        'average_transaction': income.total_income / transaction_count if transaction_count else 0,
+    }
+
 # Income detail view with caching
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
 def income_detail(request, pk):
     income = get_object_or_404(Income, pk=pk, user=request.user)
-    cache_key = f'income_detail_{income.id}'
-    context = cache.get(cache_key)
-    if context is None:
-        income_transactions = IncomeTransaction.objects.filter(income=income).order_by('-date')
-        current_period_income = income.get_current_period_actual_income()
-        expected_income = income.amount
-        difference = current_period_income - expected_income if income.is_variable else 0
-        # Use precomputed fields
-        avg_30d = income.avg_30d
-        avg_90d = income.avg_90d
-        total_income = income.total_income
-        context = {
-            'income': income,
-            'income_transactions': income_transactions[:20],
-            'current_period_income': current_period_income,
-            'expected_income': expected_income,
-            'difference': difference,
-            'avg_30d': avg_30d,
-            'avg_90d': avg_90d,
-            'total_income': total_income,
-            'transaction_count': income_transactions.count()
-        }
-        # Cache for 5 minutes
-        cache.set(cache_key, context, 300)
-    
+    context = get_or_compute(user_cache_key(request.user.id, 'income_detail', income.id),
+                             lambda: income_detail_context(income))
+    # Only the first page of the history is cached; the chart always uses it
+    if request.GET.get('transactions_after') or request.GET.get('transactions_before'):
+        context = dict(context, transactions_page=income_transaction_paginator(income).page_from_request(
+            request, 'transactions'))
     return render(request, 'budgetapp/income_detail.html', context)
+
+
+# Monitoring view for staff
+@user_passes_test(lambda user: user.is_staff)
+def worker_stats(request):
+    """Queue depth, coalescing and latency figures for this process's aggregate workers, plus cache hit rates."""
+    stats = aggregate_worker_stats()
+    stats['cache'] = cache_stats()
+    return JsonResponse(stats)